@@ -0,0 +1,496 @@
+"""
+Deterministic tests that need no network access, over small graphs built in
+memory or from tiny SQL dumps written to a temporary directory
+
+Run with `python3 offline_tests.py` (or `python3 -m pytest offline_tests.py`)
+"""
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from functools import partial
+from typing import Dict, List, Optional
+from wikitas_tools import (
+    find_path_best_first,
+    find_path_bidirectional,
+    find_path_bounded,
+    find_path_landmarks,
+    find_path_sharded,
+    find_path_simple,
+    find_path_simple_async,
+    find_path_simple_parallel,
+    find_path_wordmatching,
+    find_path_wordmatching_parallel,
+    find_paths_batch,
+    find_paths_from,
+    build_landmark_index,
+    build_local_graph,
+    LinkCache,
+    LocalGraph,
+    MemoryCache,
+    MemorySource,
+    PathCache,
+    Prefetcher,
+    SearchMetrics,
+    SearchService,
+    TitleGraph,
+    WikiApi,
+    make_server,
+    CompactWordNet,
+    build_compact_wordnet,
+    load_compact_wordnet,
+    use_wordnet,
+)
+from wikitas_tools.batch import MalformedPair, read_pairs
+from wikitas_tools.compactwordnet import POS_LIST
+from wikitas_tools.benchmark import make_graph, make_pairs, shortest_path_length
+from wikitas_tools.embeddings import SAMPLE_VECTORS, EmbeddingScorer, convert_vectors, load_vectors
+from wikitas_tools.prefetch import STALE_BATCHES
+
+
+# Small test graph (title -> links) with a redirect to "Japan"
+GRAPH = {
+    "Amon Göth": ["Kraków", "Schindler's List"],
+    "Kraków": ["Poland", "Amon Göth"],
+    "Schindler's List": ["Steven Spielberg", "Amon Göth"],
+    "Steven Spielberg": ["Nippon"],  # Through the redirect
+    "Poland": ["Europe"],
+    "Europe": ["Japan"],
+    "Japan": ["Asia"],
+    "Asia": [],
+}
+REDIRECTS = {"Nippon": "Japan"}
+
+# Synthetic wikipedia-shaped graph and (start, dest) pairs for the finders
+SYNTHETIC_GRAPH = make_graph(num_pages=400, mean_links=6, seed=1)
+PAIRS = make_pairs(SYNTHETIC_GRAPH, 12, seed=2)
+
+
+# Wordnet of the one word of the synthetic titles, so word matching needs no nltk data
+TINY_WORDNET = CompactWordNet(
+    names=["page.n.01"], pos="n", parents=[()], lemmas={"page": {"n": 0}}, exceptions={"n": {}, "v": {}, "a": {}, "r": {}}
+)
+
+
+# ------ Helpers ------
+
+def assert_valid_path(path: List[str], start: str, dest: str, graph: Dict[str, List[str]], shortest: Optional[bool] = False) -> None:
+    """
+    Assert `path` follows the links of `graph` from `start` to `dest` (and
+    is a shortest path if `shortest`), or is empty when there is no path
+    """
+    length = shortest_path_length(graph, start, dest)
+    if length is None:
+        assert path == [], (start, dest, path)
+        return
+    assert path[0] == start and path[-1] == dest, (start, dest, path)
+    assert all(link in graph[page] for page, link in zip(path, path[1:])), path
+    if shortest:
+        assert len(path) == length, (start, dest, path, length)
+
+
+def check_finder(find_path, shortest: Optional[bool] = True) -> None:
+    """
+    Assert `find_path(start, dest)` finds a valid (or shortest) path for
+    each of `PAIRS`, and an empty path from a page to itself
+    """
+    for start, dest in PAIRS:
+        assert_valid_path(find_path(start, dest), start, dest, SYNTHETIC_GRAPH, shortest)
+    assert find_path(PAIRS[0][0], PAIRS[0][0]) == []
+# ------
+
+
+# ------ Dump fixtures ------
+def _sql_title(title: str) -> str:
+    return title.replace(" ", "_").replace("'", "\\'")
+
+
+def _write_dump(path: str, table: str, rows: List[str]) -> None:
+    # Split over two INSERTs, like the real dumps
+    half = len(rows) // 2
+    with gzip.open(path, "wt", encoding="utf-8") as dump:
+        dump.write(f"-- MySQL dump of `{table}`\n")
+        for part in (rows[:half], rows[half:]):
+            if part:
+                dump.write(f"INSERT INTO `{table}` VALUES " + ",".join(part) + ";\n")
+
+
+def write_dumps(directory: str, links: Dict[str, List[str]], redirects: Dict[str, str], linktarget: bool) -> Dict[str, str]:
+    """
+    Write the `page`, `pagelinks`, `redirect` (and with `linktarget`, the
+    2024 onwards `pagelinks` & `linktarget`) dumps of a graph to `directory`
+    and return the paths by table
+    """
+    page_ids = {title: 10 + 3 * i for i, title in enumerate(list(links) + list(redirects))}
+    pages = [
+        f"({page_ids[title]},0,'{_sql_title(title)}',{int(title in redirects)},0,0.5,'20240101','20240101',1,10,'wikitext',NULL)"
+        for title in page_ids
+    ]
+    pages.append("(9999,4,'Project_page',0,0,0.5,'20240101','20240101',1,10,'wikitext',NULL)")  # Not an article
+    paths = {table: os.path.join(directory, f"{table}.sql.gz") for table in ("page", "pagelinks", "redirect")}
+    _write_dump(paths["page"], "page", pages)
+    _write_dump(paths["redirect"], "redirect", [
+        f"({page_ids[redirect]},0,'{_sql_title(title)}','','')" for redirect, title in redirects.items()
+    ])
+
+    target_ids: Dict[str, int] = {}
+    page_links = []
+    for title, title_links in links.items():
+        for link in title_links:
+            if linktarget:
+                target_id = target_ids.setdefault(link, len(target_ids) + 1)
+                page_links.append(f"({page_ids[title]},0,{target_id})")
+            else:
+                page_links.append(f"({page_ids[title]},0,'{_sql_title(link)}',0)")
+    _write_dump(paths["pagelinks"], "pagelinks", page_links)
+    if linktarget:
+        paths["linktarget"] = os.path.join(directory, "linktarget.sql.gz")
+        _write_dump(paths["linktarget"], "linktarget", [
+            f"({target_id},0,'{_sql_title(link)}')" for link, target_id in target_ids.items()
+        ])
+    return paths
+# ------
+
+
+def test_local_graph():
+    for linktarget in (False, True):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_dumps(directory, GRAPH, REDIRECTS, linktarget)
+            graph_dir = os.path.join(directory, "graph")
+            build_local_graph(graph_dir, paths["page"], paths["pagelinks"], paths["redirect"], paths.get("linktarget"))
+            graph = LocalGraph(graph_dir)
+
+            assert graph.num_pages == len(GRAPH)
+            assert graph.num_links == sum(len(links) for links in GRAPH.values())
+            for title, links in GRAPH.items():
+                assert sorted(graph.iter_links(title)) == sorted(REDIRECTS.get(link, link) for link in links)
+            assert sorted(graph.iter_backlinks("Japan")) == ["Europe", "Steven Spielberg"]
+            assert sorted(graph.iter_backlinks("Amon Göth")) == ["Kraków", "Schindler's List"]
+
+            assert graph.wikititle("Nippon") == "Japan"
+            assert graph.wikititle("schindler's_list") == "Schindler's List"
+            assert graph.wikititle("steven spielberg") == "Steven Spielberg"
+            assert graph.wikititle("JAPAN") == "Japan"
+
+            path = find_path_simple_parallel("amon göth", "japan", source=graph)
+            assert path == ["Amon Göth", "Schindler's List", "Steven Spielberg", "Japan"]
+
+
+def test_local_graph_fingerprint():
+    fingerprints = []
+    # The same no. of links on each page, to a different page
+    for links in (GRAPH, {**GRAPH, "Poland": ["Asia"]}):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = write_dumps(directory, links, REDIRECTS, linktarget=False)
+            graph_dir = os.path.join(directory, "graph")
+            build_local_graph(graph_dir, paths["page"], paths["pagelinks"], paths["redirect"])
+            fingerprints.append(LocalGraph(graph_dir).fingerprint())
+    assert fingerprints[0] != fingerprints[1]
+
+
+def test_simple():
+    check_finder(partial(find_path_simple, source=MemorySource(SYNTHETIC_GRAPH)))
+
+
+def test_simple_parallel():
+    source = MemorySource(SYNTHETIC_GRAPH)
+    check_finder(partial(find_path_simple_parallel, source=source))
+    check_finder(partial(find_path_simple_parallel, source=source, prefetch=100))
+
+
+def test_simple_async():
+    check_finder(partial(find_path_simple_async, source=MemorySource(SYNTHETIC_GRAPH)))
+
+
+def test_bidirectional():
+    check_finder(partial(find_path_bidirectional, source=MemorySource(SYNTHETIC_GRAPH)))
+
+
+def test_bounded():
+    source = MemorySource(SYNTHETIC_GRAPH)
+    with tempfile.TemporaryDirectory() as spill_dir:
+        # Small enough to spill the frontier and visited set to disk
+        check_finder(lambda start, dest: find_path_bounded(
+            start, dest, memory_nodes=16, spill_dir=spill_dir, source=source
+        ).path)
+        # Or all in memory
+        check_finder(lambda start, dest: find_path_bounded(start, dest, spill_dir=spill_dir, source=source).path)
+
+    start, dest = PAIRS[0]
+    result = find_path_bounded(start, dest, max_depth=1, source=source)
+    assert result.path == [] and result.reason == "max_depth"
+
+
+class ReversedSource(MemorySource):
+    """
+    A source answering each batch of pages in reverse order, like the last
+    query of a batch coming back first
+    """
+
+    def iter_links_batched(self, titles):
+        return reversed(list(super().iter_links_batched(titles)))
+
+
+def test_out_of_order():
+    # The only shortest path is through the last of 2000 pages a level
+    # deep, answered after the first of them (and its links a level deeper)
+    graph = {"S": [f"A{i}" for i in range(2000)], "B0": ["D"], "D": []}
+    graph.update({f"A{i}": [] for i in range(2000)})
+    graph["A0"] = ["B0"]
+    graph["A1999"] = ["D"]
+    source = ReversedSource(graph)
+    shortest = ["S", "A1999", "D"]
+
+    assert find_path_simple_parallel("S", "D", source=source) == shortest
+    assert find_path_simple_parallel("S", "D", source=source, prefetch=2000) == shortest
+    assert find_path_bounded("S", "D", source=source).path == shortest
+    assert dict(find_paths_from("S", ["D", "B0"], source=source)) == {"D": shortest, "B0": ["S", "A0", "B0"]}
+
+
+def test_word_matching():
+    source = MemorySource(SYNTHETIC_GRAPH)
+    use_wordnet(TINY_WORDNET)
+    try:
+        check_finder(partial(find_path_wordmatching, source=source), shortest=False)
+        check_finder(partial(find_path_wordmatching_parallel, source=source), shortest=False)
+        check_finder(partial(find_path_best_first, source=source), shortest=False)
+        check_finder(partial(find_path_best_first, source=source, prefetch=0), shortest=False)
+    finally:
+        use_wordnet(None)
+
+
+def test_prefetch():
+    source = MemorySource(SYNTHETIC_GRAPH)
+    titles = sorted(SYNTHETIC_GRAPH)
+    metrics = SearchMetrics()
+    with Prefetcher(source, 60, metrics) as prefetcher:
+        prefetcher.prefetch(titles[:100])  # Only up to the budget
+        assert metrics.counts["prefetched"] == 60
+        batch = titles[50:70]  # Partly prefetched
+        assert dict(prefetcher.iter_links_batched(batch)) == dict(source.iter_links_batched(batch))
+        assert metrics.counts["prefetch_hits"] == 10
+
+        # Prefetches never asked for are dropped once over, freeing up the budget
+        for query in set(prefetcher._fetches.values()):
+            query.future.result()
+        for i in range(STALE_BATCHES + 1):
+            list(prefetcher.iter_links_batched(titles[200 + i:201 + i]))
+        assert metrics.counts["prefetch_dropped"] == 50
+        prefetcher.prefetch(titles[300:400])
+        assert metrics.counts["prefetched"] == 120
+
+
+def test_compact_wordnet():
+    # Built from nltk's private lemma and exception maps, so checked against nltk itself
+    try:
+        from nltk.corpus import wordnet
+        wordnet.ensure_loaded()
+    except LookupError:
+        print("skipped (no nltk wordnet data)")
+        return
+
+    with tempfile.TemporaryDirectory() as wordnet_dir:
+        path = os.path.join(wordnet_dir, "wordnet.pickle")
+        build_compact_wordnet(path)
+        compact = load_compact_wordnet(path)
+
+    words = [
+        "dog", "dogs", "geese", "wolves", "churches", "women", "boxes", "running", "ran",
+        "better", "best", "happily", "Kraków", "Poland", "film", "films", "directed", "nonword",
+    ]
+    words += sorted(wordnet._lemma_pos_offset_map)[::2000]  # Spread over the whole index
+    for word in words:
+        for pos in POS_LIST:
+            assert compact._morphy(word.lower(), pos) == wordnet._morphy(word.lower(), pos), (word, pos)
+        synsets = wordnet.synsets(word)
+        synset = compact.synset(word)
+        assert (synset.name() if synset else None) == (synsets[0].name() if synsets else None), word
+
+    firsts = [(synset, wordnet.synsets(word)[0]) for word in words for synset in [compact.synset(word)] if synset]
+    for synset_1, nltk_synset_1 in firsts:
+        for synset_2, nltk_synset_2 in firsts:
+            similarity = synset_1.wup_similarity(synset_2)
+            expected = nltk_synset_1.wup_similarity(nltk_synset_2)
+            if expected is None:
+                assert similarity is None, (synset_1, synset_2)
+            else:
+                assert abs(similarity - expected) < 1e-9, (synset_1, synset_2, similarity, expected)
+
+
+def test_sharded():
+    check_finder(partial(find_path_sharded, workers=2, source_factory=partial(MemorySource, SYNTHETIC_GRAPH)))
+
+
+def test_landmarks():
+    graph = TitleGraph(MemorySource(SYNTHETIC_GRAPH), list(SYNTHETIC_GRAPH))
+    with tempfile.TemporaryDirectory() as index_dir:
+        index = build_landmark_index(graph, index_dir, num_landmarks=4)
+        check_finder(partial(find_path_landmarks, index=index))
+
+
+def test_link_cache():
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for cache in (LinkCache(os.path.join(cache_dir, "cache.sqlite3")), MemoryCache()):
+            # Each wiki's api reads only its own entries
+            english = WikiApi(cache=cache)
+            german = WikiApi("https://de.wikipedia.org/w/api.php", cache=cache)
+            english.cache.set_many("links", {"Japan": ["Asia"], "Poland": ["Europe"]})
+            german.cache.set("links", "Japan", ["Asien"])
+            assert english.cache.get("links", "Japan") == ["Asia"]
+            assert german.cache.get("links", "Japan") == ["Asien"]
+            assert cache.get("links", "Japan") is None
+
+            german.cache.invalidate()
+            assert german.cache.get("links", "Japan") is None
+            assert english.cache.get("links", "Japan") == ["Asia"]
+
+            # Entries fetched before their page changed are removed
+            english.cache.invalidate_before("links", {"Japan": time.time() + 60, "Poland": 0})
+            assert english.cache.get_many("links", ["Japan", "Poland"]) == {"Poland": ["Europe"]}
+            cache.close()
+
+
+def test_path_cache():
+    hubs = sorted(SYNTHETIC_GRAPH, key=lambda title: len(SYNTHETIC_GRAPH[title]), reverse=True)[:2]
+    path_cache = PathCache(MemorySource(SYNTHETIC_GRAPH), hubs=hubs, hub_depth=2)
+    check_finder(path_cache.find_path, shortest=False)
+    check_finder(path_cache.find_path, shortest=False)  # From the path cache
+    for start, dest in PAIRS:
+        path = path_cache.find_path(start, dest)
+        if path:  # Found paths are cached
+            assert path_cache.lookup(start, dest) == path
+
+
+def test_batch():
+    source = MemorySource(SYNTHETIC_GRAPH)
+    start = PAIRS[0][0]
+    dests = [dest for _start, dest in PAIRS]
+    for dest, path in find_paths_from(start, dests, source=source):
+        assert_valid_path(path, start, dest, SYNTHETIC_GRAPH, shortest=True)
+    assert list(find_paths_from(start, [start], source=source)) == [(start, [])]
+
+    results = list(find_paths_batch(PAIRS + PAIRS[:3] + [("Page 1", "No such page")], source=source))
+    assert len(results) == len(PAIRS) + 4
+    assert results[0]["error"] is not None  # Answered while resolving titles
+    for result in results[1:]:
+        assert result["error"] is None, result
+        assert 0 <= result["seconds"] <= result["elapsed"]
+        assert_valid_path(result["path"], result["start"], result["dest"], SYNTHETIC_GRAPH, shortest=True)
+
+    # Results stream before every pair is read
+    read = []
+
+    def stream_pairs():
+        for pair in PAIRS:
+            read.append(pair)
+            yield pair
+
+    first = next(find_paths_batch(stream_pairs(), source=source, chunk_size=4))
+    assert len(read) == 4 and (first["start"], first["dest"]) in PAIRS[:4]
+
+    # Malformed lines are answered with an error, without ending the batch
+    lines = ["# pairs", "Page 1\tPage 2", "Page 1", "{not json", '{"start": "Page 1"}', '{"start": "Page 1", "dest": "Page 3"}']
+    pairs = list(read_pairs(lines))
+    assert pairs[0] == ("Page 1", "Page 2") and pairs[-1] == ("Page 1", "Page 3")
+    assert all(isinstance(pair, MalformedPair) for pair in pairs[1:-1])
+    results = list(find_paths_batch(pairs, source=source))
+    assert [result["error"] is None for result in results] == [False, False, False, True, True]
+
+
+class BrokenSource(MemorySource):
+    """
+    A source whose link queries fail, like an api failing after every retry
+    """
+
+    def iter_links(self, title):
+        raise ValueError("Bad response")
+
+
+def _get(url: str):
+    try:
+        with urllib.request.urlopen(url) as res:
+            return res.status, json.load(res)
+    except urllib.error.HTTPError as err:
+        return err.code, json.load(err)
+
+
+def test_service():
+    start, dest = PAIRS[0]
+    for source, expected in ((MemorySource(SYNTHETIC_GRAPH), 200), (BrokenSource(SYNTHETIC_GRAPH), 502)):
+        server = make_server(SearchService(source), "127.0.0.1", 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/path?"
+        try:
+            status, body = _get(url + urllib.parse.urlencode({"start": start, "dest": dest}))
+            assert status == expected, body
+            if expected == 200:
+                assert_valid_path(body["path"], start, dest, SYNTHETIC_GRAPH, shortest=True)
+            for params in (
+                {"start": start},
+                {"start": start, "dest": dest, "method": "nope"},
+                {"start": start, "dest": dest, "timeout": "soon"},
+                {"start": start, "dest": dest, "timeout": "-1"},
+            ):
+                status, body = _get(url + urllib.parse.urlencode(params))
+                assert status == 400 and body["error"].startswith("Bad query"), body
+            status, body = _get(url + urllib.parse.urlencode({"start": start, "dest": "No such page"}))
+            assert status == 404, body
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def test_embeddings():
+    vocab, vectors = load_vectors(SAMPLE_VECTORS)
+    assert "japan" in vocab and "saitama" in vocab
+    assert vectors.shape == (len(vocab), vectors.shape[1])
+    assert abs(float((vectors[vocab["japan"]] ** 2).sum()) - 1) < 1e-5  # Unit vectors
+
+    scorer = EmbeddingScorer(["Japan"], SAMPLE_VECTORS)
+    scores = scorer.score_many(["Saitama Prefecture", "Football league", "Xyzzy", ""])
+    assert scores[0] > scores[1] > 0
+    assert scores[2:] == [0.0, 0.0]  # No words with vectors
+    assert scores == [scorer.score_title(title) for title in ["Saitama Prefecture", "Football league", "Xyzzy", ""]]
+    assert EmbeddingScorer(["Xyzzy"], SAMPLE_VECTORS).score_many(["Japan"]) == [0.0]
+
+    with tempfile.TemporaryDirectory() as directory:
+        prefix = os.path.join(directory, "sample")
+        convert_vectors(SAMPLE_VECTORS, prefix)
+        npy_vocab, npy_vectors = load_vectors(prefix + ".npy")
+        assert npy_vocab == vocab
+        assert abs(npy_vectors - vectors).max() < 1e-6
+        npy_scores = EmbeddingScorer(["Japan"], prefix + ".npy").score_many(["Saitama Prefecture", "Football league"])
+        assert all(abs(a - b) < 1e-6 for a, b in zip(npy_scores, scores))
+        del npy_vectors  # Release the memory map before the directory is removed
+        load_vectors.cache_clear()
+
+
+def main():
+    test_local_graph()
+    test_local_graph_fingerprint()
+    test_simple()
+    test_simple_parallel()
+    test_simple_async()
+    test_bidirectional()
+    test_bounded()
+    test_out_of_order()
+    test_word_matching()
+    test_prefetch()
+    test_compact_wordnet()
+    test_sharded()
+    test_landmarks()
+    test_link_cache()
+    test_path_cache()
+    test_batch()
+    test_service()
+    test_embeddings()
+    print("All offline tests passed")
+
+
+if __name__ == "__main__":
+    main()
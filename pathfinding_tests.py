@@ -4,11 +4,19 @@ from wikipedia page A to B using the wikipedia api
 """
 from timeit import default_timer
 from wikitas_tools import (
+    find_path_best_first,
+    find_path_bidirectional,
+    find_path_bounded,
+    find_path_landmarks,
+    find_path_sharded,
     find_path_wordmatching,
     find_path_wordmatching_parallel,
     find_path_simple,
     find_path_simple_parallel,
+    find_path_simple_async,
     log_path,
+    LocalGraph,
+    PathCache,
 )
 
 
@@ -16,6 +24,7 @@ TEST_SEP = "------------------------------------"
 
 START_PAGE = "amon goth"
 END_PAGE = "japan"
+GRAPH_DIR = None  # Offline graph with a landmark index (see README), for test_landmarks
 
 # Other examples
 # -------------
@@ -60,6 +69,24 @@ def test_word_matching():
     print(TEST_SEP)
 
 
+def test_best_first():
+    print("Best-first with word matching (multi-threaded):")
+    print(TEST_SEP)
+
+    try:
+        start_1 = default_timer()
+        path = find_path_best_first(START_PAGE, END_PAGE)
+        end_1 = default_timer()
+        dur_1 = end_1 - start_1
+        log_path(path)
+        print(f"found in {dur_1} s")
+    except KeyboardInterrupt:
+        end_1 = default_timer()
+        print(f"stopped at {end_1 - start_1} s")
+
+    print(TEST_SEP)
+
+
 def test_simple_parallel():
     print("With no matching (multi-threaded)")
     print(TEST_SEP)
@@ -78,6 +105,24 @@ def test_simple_parallel():
     print(TEST_SEP)
 
 
+def test_simple_async():
+    print("With no matching (asynchronous)")
+    print(TEST_SEP)
+
+    try:
+        start_1 = default_timer()
+        path = find_path_simple_async(START_PAGE, END_PAGE)
+        end_1 = default_timer()
+        dur_1 = end_1 - start_1
+        log_path(path)
+        print(f"found in {dur_1} s")
+    except KeyboardInterrupt:
+        end_1 = default_timer()
+        print(f"stopped at {end_1 - start_1} s")
+
+    print(TEST_SEP)
+
+
 def test_simple():
     print("With no matching (single thread)")
     print(TEST_SEP)
@@ -95,9 +140,113 @@ def test_simple():
     print(TEST_SEP)
 
 
+def test_bidirectional():
+    print("Bidirectional (multi-threaded)")
+    print(TEST_SEP)
+
+    try:
+        start_1 = default_timer()
+        path = find_path_bidirectional(START_PAGE, END_PAGE)
+        end_1 = default_timer()
+        dur_1 = end_1 - start_1
+        log_path(path)
+        print(f"found in {dur_1} s")
+    except KeyboardInterrupt:
+        end_1 = default_timer()
+        print(f"stopped at {end_1 - start_1} s")
+
+    print(TEST_SEP)
+
+
+def test_bounded():
+    print("Bounded memory, within 60 s (multi-threaded)")
+    print(TEST_SEP)
+
+    try:
+        start_1 = default_timer()
+        result = find_path_bounded(START_PAGE, END_PAGE, deadline=60)
+        end_1 = default_timer()
+        dur_1 = end_1 - start_1
+        log_path(result.path)
+        print(f"{result.reason} in {dur_1} s ({result.pages_expanded} pages expanded)")
+    except KeyboardInterrupt:
+        end_1 = default_timer()
+        print(f"stopped at {end_1 - start_1} s")
+
+    print(TEST_SEP)
+
+
+def test_sharded():
+    print("With no matching (multi-process)")
+    print(TEST_SEP)
+
+    try:
+        start_1 = default_timer()
+        path = find_path_sharded(START_PAGE, END_PAGE)
+        end_1 = default_timer()
+        dur_1 = end_1 - start_1
+        log_path(path)
+        print(f"found in {dur_1} s")
+    except KeyboardInterrupt:
+        end_1 = default_timer()
+        print(f"stopped at {end_1 - start_1} s")
+
+    print(TEST_SEP)
+
+
+def test_landmarks():
+    print("With A* over the landmark index of the offline graph")
+    print(TEST_SEP)
+
+    if GRAPH_DIR is None:
+        print("skipped (no GRAPH_DIR)")
+        print(TEST_SEP)
+        return
+
+    try:
+        start_1 = default_timer()
+        path = find_path_landmarks(START_PAGE, END_PAGE, source=LocalGraph(GRAPH_DIR))
+        end_1 = default_timer()
+        dur_1 = end_1 - start_1
+        log_path(path)
+        print(f"found in {dur_1} s")
+    except KeyboardInterrupt:
+        end_1 = default_timer()
+        print(f"stopped at {end_1 - start_1} s")
+
+    print(TEST_SEP)
+
+
+def test_path_cache():
+    print("With no matching, then again from the path cache")
+    print(TEST_SEP)
+
+    path_cache = PathCache(hubs=[END_PAGE])
+    for attempt in ("searched", "cached"):
+        try:
+            start_1 = default_timer()
+            path = path_cache.find_path(START_PAGE, END_PAGE)
+            end_1 = default_timer()
+            dur_1 = end_1 - start_1
+            log_path(path)
+            print(f"{attempt} in {dur_1} s")
+        except KeyboardInterrupt:
+            end_1 = default_timer()
+            print(f"stopped at {end_1 - start_1} s")
+
+    print(TEST_SEP)
+
+
 def main():
+    test_bidirectional()
     test_word_matching_parallel()
+    test_best_first()
     test_simple_parallel()
+    test_sharded()
+    test_landmarks()
+    test_path_cache()
+    test_bounded()
+    test_simple_async()
     test_word_matching()
     test_simple()
 
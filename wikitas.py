@@ -3,13 +3,28 @@ The main code for the wikitas, passing START_PAGE, END_PAGE and [...OPTIONS] as
 """
 import sys
 import timeit
+from functools import partial
 from typing import Callable, Optional
 from wikitas_tools import (
+    find_path_best_first,
+    find_path_bidirectional,
+    find_path_landmarks,
+    find_path_sharded,
     find_path_simple,
     find_path_simple_parallel,
+    find_path_simple_async,
     find_path_wordmatching,
     find_path_wordmatching_parallel,
     log_path,
+    set_cache,
+    set_metrics,
+    LinkCache,
+    LinkSource,
+    LocalGraph,
+    PathCache,
+    WikiApiSource,
+    ProgressMetrics,
+    run_batch,
 )
 
 
@@ -21,6 +36,7 @@ DESCRIPTION:
 
 USAGE:
     python3 wikitas.py [START_PAGE] [END_PAGE] [...OPTIONS]
+    python3 wikitas.py --batch=PAIRS_FILE [...OPTIONS]
 
 OPTIONS:
     -h | --help             Display this help page
@@ -28,23 +44,59 @@ OPTIONS:
     -s | --simple           Find path from START_PAGE to END_PAGE using without matching words
     -Pw | --Pmatchwords     Same as --matchwords but using multi-threaded http requests to the wikipedia api
     -Ps | --Psimple         (Default) Same as --simple but using multi-threaded http requests to the wikipedia api
+    -As | --Asimple         Same as --simple but always keeping 32 asynchronous http requests in flight
+    -b | --bidirectional    Find the shortest path by searching forwards from START_PAGE and backwards from END_PAGE
+    -B | --bestfirst        Find path from START_PAGE to END_PAGE by always expanding the most related pages first
+    -S | --sharded          Same as --simple but split across a process per cpu
+    -L | --landmarks        Find the shortest path by an A* search using the landmark index of --graph (see README)
+    -C | --pathcache        Answer from (and add to) the cache of paths found and the trees of --hubs, else as --Psimple
+    --hubs=HUB_1|HUB_2      Hub pages whose paths to and from nearby pages are searched up front for --pathcache
+    -c | --cache            Cache wikipedia api results on disk (~/.cache/wikitas) across runs
+    --graph=GRAPH_DIR       Search the offline graph in GRAPH_DIR (see README) instead of the wikipedia api
+    --vectors=VECTORS_FILE  Match words by the word vectors in VECTORS_FILE (see README) instead of wordnet
+    -m | --metrics          Show where each search spent its time, and its no. of http requests, pages, etc.
+    --batch=PAIRS_FILE      Find the path of every START_PAGE<tab>END_PAGE line of PAIRS_FILE (- for stdin),
+                            writing each result as a line of JSON as soon as it is found
 """)
 
 
+# Callbacks scoring links with a `scorer_factory`
+WORD_MATCHING_CALLBACKS = (find_path_wordmatching, find_path_wordmatching_parallel, find_path_best_first)
+
+
 def run_wikitas(
     start: str,
     end: str,
-    callback: Optional[Callable[[str], str]] = find_path_simple_parallel
+    callback: Optional[Callable[[str], str]] = find_path_simple_parallel,
+    source: Optional[LinkSource] = None,
+    scorer_factory: Optional[Callable] = None,
+    show_metrics: Optional[bool] = False,
+    source_factory: Optional[Callable[[], LinkSource]] = WikiApiSource
 ) -> None:
     print("-----------------------------------")
     print(f"Starting {callback.__name__}")
 
+    # Shows the progress of the search, and records its http reqs
+    metrics = ProgressMetrics()
+    set_metrics(metrics)
+
     start_time = timeit.default_timer()
-    path = callback(start, end)
+    if scorer_factory is not None and callback in WORD_MATCHING_CALLBACKS:
+        path = callback(start, end, source=source, scorer_factory=scorer_factory, metrics=metrics)
+    elif callback is find_path_sharded:  # Each worker process opens its own source
+        path = callback(start, end, source_factory=source_factory, metrics=metrics)
+    else:
+        path = callback(start, end, source=source, metrics=metrics)
     end_time = timeit.default_timer()
 
     log_path(path)
     print(f"Found in {end_time - start_time} s")
+    if show_metrics:
+        report = metrics.report()
+        for phase, seconds in sorted(report["timings"].items()):
+            print(f"{phase}: {seconds:.3f} s")
+        for name, value in sorted({**report["counts"], **report["maxima"], **report["gauges"]}.items()):
+            print(f"{name}: {value}")
     print("-----------------------------------")
 
 
@@ -54,6 +106,13 @@ def main() -> None:
 
     callback_options = set()  # No duplicate callbacks
     start_end = []
+    source = None  # Default - the wikipedia api
+    source_factory = WikiApiSource  # Source of each worker of --sharded
+    scorer_factory = None  # Default - wordnet similarity
+    show_metrics = False
+    batch_file = None
+    use_path_cache = False
+    hubs = []
 
     # Arg parsing
     for arg in args:
@@ -66,6 +125,33 @@ def main() -> None:
             callback_options.add(find_path_wordmatching_parallel)
         elif arg in ("-Ps", "--Psimple"):
             callback_options.add(find_path_simple_parallel)
+        elif arg in ("-As", "--Asimple"):
+            callback_options.add(find_path_simple_async)
+        elif arg in ("-b", "--bidirectional"):
+            callback_options.add(find_path_bidirectional)
+        elif arg in ("-B", "--bestfirst"):
+            callback_options.add(find_path_best_first)
+        elif arg in ("-S", "--sharded"):
+            callback_options.add(find_path_sharded)
+        elif arg in ("-L", "--landmarks"):
+            callback_options.add(find_path_landmarks)
+        elif arg in ("-C", "--pathcache"):
+            use_path_cache = True
+        elif arg.startswith("--hubs="):
+            hubs = arg[len("--hubs="):].split("|")
+            use_path_cache = True
+        elif arg in ("-c", "--cache"):
+            set_cache(LinkCache())
+        elif arg in ("-m", "--metrics"):
+            show_metrics = True
+        elif arg.startswith("--batch="):
+            batch_file = arg[len("--batch="):]
+        elif arg.startswith("--graph="):
+            source = LocalGraph(arg[len("--graph="):])
+            source_factory = partial(LocalGraph, arg[len("--graph="):])
+        elif arg.startswith("--vectors="):
+            from wikitas_tools import EmbeddingScorer  # Imported only when used, as it loads numpy
+            scorer_factory = partial(EmbeddingScorer, vectors_path=arg[len("--vectors="):])
         elif arg.startswith("-"):  # Invalid option - abort
             print(f"Invalid option: '{arg}'")
             print_help()
@@ -73,17 +159,33 @@ def main() -> None:
         else:  # Arg is start or end page title
             start_end.append(arg)
 
+    if batch_file is not None:
+        if batch_file == "-":
+            run_batch(sys.stdin, sys.stdout, source)
+        else:
+            with open(batch_file, encoding="utf-8") as pairs_file:
+                run_batch(pairs_file, sys.stdout, source)
+        return
+
     if len(start_end) != 2:  # End missing or too many pages passed as args
         print_help()
         return
 
     start, end = start_end
+    if use_path_cache:  # Built once every option is known, as it searches the hubs' trees
+        path_cache = PathCache(source, hubs=hubs)
+
+        def find_path_cached(start: str, dest: str, source: Optional[LinkSource] = None, metrics=None):
+            return path_cache.find_path(start, dest, metrics)
+
+        callback_options.add(find_path_cached)
+
     if not callback_options:  # No callback option specified - default --Psimple
-        run_wikitas(start, end)
+        run_wikitas(start, end, source=source, scorer_factory=scorer_factory, show_metrics=show_metrics)
         return
 
     for callback in callback_options:  # Run the wikitas for each callback specified
-        run_wikitas(start, end, callback)
+        run_wikitas(start, end, callback, source, scorer_factory, show_metrics, source_factory)
 
 
 if __name__ == "__main__":
@@ -1,2 +1,37 @@
 from .pathfinding import *
 from .wikilog import log_path
+from .cache import LinkCache, MemoryCache
+from .wikiapi import set_cache, set_metrics, WikiApi
+from .transport import Transport, AdaptiveLimiter, RetryError
+from .metrics import NullMetrics, SearchMetrics, ProgressMetrics
+from .sources import LinkSource, WikiApiSource, CachedSource, MemorySource
+from .localgraph import LocalGraph, build_local_graph
+from .batch import find_paths_from, find_paths_batch, run_batch
+from .sharded import ShardedSearcher, find_path_sharded
+from .prefetch import Prefetcher
+from .pathcache import PathCache
+from .service import SearchService, SharedFetcher, OverloadedError, DeadlineExceededError, make_server
+from .landmarks import LandmarkIndex, TitleGraph, build_landmark_index, find_path_landmarks
+from .word_utils import SimilarityScorer, use_wordnet, load_wordnet
+from .compactwordnet import CompactWordNet, build_compact_wordnet, load_compact_wordnet
+
+# Imported on first use, as they load heavy optional dependencies (numpy).
+# nltk and requests are likewise only imported once words are matched / a
+# http req is made (see `word_utils.load_wordnet` and `transport.py`)
+_LAZY_IMPORTS = {
+    "EmbeddingScorer": ".embeddings",
+    "convert_vectors": ".embeddings",
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted([*globals(), *_LAZY_IMPORTS])
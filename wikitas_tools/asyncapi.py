@@ -0,0 +1,202 @@
+"""
+Asynchronous link fetching from the wikipedia api, so a search can keep
+a fixed number of http reqs in flight instead of waiting on whole batches
+
+Uses httpx (over HTTP/2 when `h2` is installed) if it is available,
+otherwise falls back to the `requests` session on a persistent thread pool
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Dict, Any, Optional, Tuple
+from .metrics import NullMetrics
+from .wikiapi import WikiApi, default_api, MAX_THREADS, _decode_json, _links_params, _parse_aliases, _parse_links
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class RateLimiter:
+    """
+    Spaces out the starts of http reqs to at most `rps` requests per second
+    No limit if `rps` is None
+    """
+
+    def __init__(self, rps: Optional[float] = None):
+        self.interval = 1 / rps if rps else 0
+        self._next_start = 0.0
+
+    async def wait(self) -> None:
+        """
+        Wait until the next http req is allowed to start
+        """
+        if not self.interval:
+            return
+
+        now = asyncio.get_running_loop().time()
+        delay = self._next_start - now
+        self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AsyncLinkFetcher:
+    """
+    Fetches links from the pages of `api` with at most `concurrency`
+    http reqs in flight and at most `rps` reqs started per second
+
+    Use as an async context manager:
+        async with AsyncLinkFetcher(concurrency=32) as fetcher:
+            title_links, continuation = await fetcher.fetch_links(titles)
+
+    Links are read from and written to `api.cache` if it is set
+    """
+
+    def __init__(
+        self,
+        concurrency: int = MAX_THREADS,
+        rps: Optional[float] = None,
+        api: Optional[WikiApi] = None
+    ):
+        self.api = api if api is not None else default_api
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(rps)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._client = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Links of pages with more responses to come, cached once complete
+        self._partial_links: Dict[str, List[str]] = {}
+
+    async def __aenter__(self) -> 'AsyncLinkFetcher':
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        if httpx is not None:
+            limits = httpx.Limits(max_connections=self.concurrency)
+            try:
+                self._client = httpx.AsyncClient(http2=True, limits=limits)
+            except ImportError:  # `h2` not installed
+                self._client = httpx.AsyncClient(limits=limits)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self._executor is not None:
+            # Don't wait on reqs abandoned by the search
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _get_httpx(self, params: Dict[str, Any], metrics: NullMetrics) -> Any:
+        """
+        Make a single http req with httpx, retrying transient errors in the same
+        way as `Transport.get` (without holding a slot while backing off)
+        """
+        transport = self.api.transport
+        params = transport.request_params(params)
+        timeout = None
+        if transport.timeout is not None:
+            connect_timeout, read_timeout = transport.timeout
+            timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+
+        attempt = 0
+        while True:
+            res, retry_after = None, None
+            async with self._semaphore:
+                await self.rate_limiter.wait()
+                start = time.monotonic()
+                try:
+                    res = await self._client.get(self.api.url, params=params, timeout=timeout)
+                except httpx.TransportError as err:  # Connection errors and timeouts
+                    error: Exception = err
+            latency = time.monotonic() - start
+
+            if res is not None:
+                if not transport.should_retry(res.status_code, res.headers):
+                    transport.record(latency, True, metrics)
+                    res.raise_for_status()
+                    return res
+
+                if transport.is_throttled(res.status_code, res.headers):
+                    metrics.count("throttled")
+                retry_after = res.headers.get("Retry-After")
+                error = httpx.HTTPStatusError(
+                    f"{res.status_code} response from {self.api.url}", request=res.request, response=res
+                )
+
+            transport.record(latency, False, metrics)
+            delay = transport.failed(attempt, error, retry_after, metrics)
+            with metrics.timer("backoff"):
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _get(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Make a single http req to the wikipedia api, returning the decoded json
+        """
+        metrics = self.api.metrics
+        with metrics.timer("http"):
+            if self._client is not None:
+                res = await self._get_httpx(params, metrics)
+            else:
+                async with self._semaphore:
+                    await self.rate_limiter.wait()
+                    loop = asyncio.get_running_loop()
+                    res = await loop.run_in_executor(
+                        self._executor, partial(self.api.transport.get, self.api.url, params, metrics)
+                    )
+
+        with metrics.timer("decode"):
+            decoded = _decode_json(res.content)
+        metrics.count("requests")
+        metrics.count("bytes", len(res.content))
+        return decoded
+
+    async def fetch_links(
+        self,
+        titles: List[str],
+        continue_params: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Tuple[str, List[str]]], Optional[Tuple[List[str], Dict[str, Any]]]]:
+        """
+        Get the links from up to `MAX_TITLES` `titles` with a single http req
+        Returns `(title, links)` for each title with links in the response and
+        the `(titles, continue_params)` to pass back to `fetch_links` for the
+        rest of the links (None if complete)
+        """
+        link_cache = self.api.cache
+        title_links = []
+
+        if continue_params is None and link_cache is not None:
+            cached = link_cache.get_many("links", titles)
+            title_links = list(cached.items())
+            titles = [title for title in titles if title not in cached]
+            self.api.metrics.count("cache_hits", len(cached))
+            self.api.metrics.count("cache_misses", len(titles))
+            if not titles:
+                return title_links, None
+
+        params = _links_params(titles)
+        if continue_params:
+            params.update(continue_params)
+
+        res = await self._get(params)
+        if continue_params is None:  # Resolve the redirects of `titles` in bulk
+            self.api.add_aliases(_parse_aliases(res))
+        batch_links = _parse_links(res, titles)
+        title_links.extend(batch_links.items())
+
+        if link_cache is not None:
+            for title in titles:
+                self._partial_links.setdefault(title, []).extend(batch_links.get(title, []))
+            if "continue" not in res:
+                link_cache.set_many(
+                    "links", {title: self._partial_links.pop(title) for title in titles}
+                )
+
+        if "continue" not in res:
+            return title_links, None
+        return title_links, (titles, res["continue"])
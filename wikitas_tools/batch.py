@@ -0,0 +1,226 @@
+"""
+Finding the paths of many (start, dest) pairs at once, sharing work between them:
+pairs with the same start (in each chunk of pairs read) are answered by a single
+breadth first search, and links fetched for one search are kept in memory for the rest
+"""
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, IO, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+from .cache import MemoryCache
+from .metrics import NullMetrics, null_metrics
+from .sources import CachedSource, LinkSource, default_source
+from .tree import SearchTree
+from .wikiapi import MAX_THREADS, MAX_TITLES, TitleNotFoundError
+
+CHUNK_SIZE = 1000  # Pairs read, resolved and grouped by start at a time
+
+
+class MalformedPair(NamedTuple):
+    """
+    A line of a pairs file that isn't a (start, dest) pair, answered by
+    `find_paths_batch` with an error result instead of ending the batch
+    """
+    line: str
+    error: str
+
+
+def read_pairs(lines: Iterable[str]) -> Iterator[Union[Tuple[str, str], MalformedPair]]:
+    """
+    Read (start, dest) pairs from `lines` (e.g. a file), each either
+    `START<tab>DEST` or a JSON object `{"start": START, "dest": DEST}`
+    Blank lines and lines starting with # are skipped, and any other line
+    is yielded as a `MalformedPair`
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        if line.startswith("{"):
+            try:
+                pair = json.loads(line)
+                start, dest = pair["start"], pair["dest"]
+            except (ValueError, KeyError, TypeError) as err:
+                yield MalformedPair(line, f"Not a JSON pair: {err!r}")
+                continue
+            if not isinstance(start, str) or not isinstance(dest, str):
+                yield MalformedPair(line, "Not a JSON pair: start and dest must be strings")
+                continue
+            yield start, dest
+        else:
+            fields = line.split("\t")
+            if len(fields) != 2:
+                yield MalformedPair(line, f"Not a START<tab>DEST pair: {len(fields)} field(s)")
+                continue
+            yield fields[0].strip(), fields[1].strip()
+
+
+def find_paths_from(
+    start: str,
+    dests: Iterable[str],
+    source: Optional[LinkSource] = None,
+    metrics: Optional[NullMetrics] = None
+) -> Iterator[Tuple[str, List[str]]]:
+    """
+    `find_path_simple_parallel()` from existing title `start` to every
+    existing title in `dests` at once, checking every dest (and the titles
+    redirecting to it) at each level
+
+    Yields `(dest, path)` as the path to each dest is found, then
+    `(dest, [])` for each dest with no path (and for `start` itself, at
+    once, like the other finders)
+    """
+    if source is None:
+        source = default_source
+    if metrics is None:
+        metrics = null_metrics
+
+    remaining = set(dests)
+    if start in remaining:
+        remaining.discard(start)
+        yield start, []
+
+    # Each dest and the titles redirecting to it -> the dest
+    goals: Dict[str, str] = {}
+    with metrics.timer("title"):
+        dest_list = list(remaining)
+        with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
+            for dest, redirects in zip(dest_list, executor.map(source.get_redirects, dest_list)):
+                goals.update(dict.fromkeys(redirects, dest))
+        goals.update({dest: dest for dest in dest_list})
+
+    tree = SearchTree(start)
+    queue = deque([0])
+    pages_at_once = MAX_TITLES * MAX_THREADS  # Fill every thread with a full query
+    level_left = 0  # Queued pages left of the level being expanded
+
+    while queue and remaining:
+        # Responses arrive in any order, so a batch never spans two levels
+        # (a deeper page's links could otherwise be added first)
+        if not level_left:
+            level_left = len(queue)
+        pages = [queue.popleft() for _ in range(min(pages_at_once, level_left))]
+        level_left -= len(pages)
+
+        # Links are streamed per response so the search can stop mid-batch
+        titles = [tree.titles[page] for page in pages]
+        for title, links in source.iter_links_batched(titles):
+            page = tree.id_of(title)
+            metrics.page(title)
+
+            found = []
+            with metrics.timer("frontier"):
+                branches = tree.add_many(links, page)  # Not visited
+                queue.extend(branches)
+                for branch in branches:
+                    dest = goals.get(tree.titles[branch])
+                    if dest in remaining:
+                        remaining.discard(dest)
+                        found.append(dest)
+
+            for dest in found:
+                yield dest, [*tree.path(page), dest]
+            if not remaining:
+                break
+
+    for dest in remaining:
+        yield dest, []
+
+
+def find_paths_batch(
+    pairs: Iterable[Union[Tuple[str, str], MalformedPair]],
+    source: Optional[LinkSource] = None,
+    metrics: Optional[NullMetrics] = None,
+    memo_size: Optional[int] = 100_000,
+    chunk_size: Optional[int] = CHUNK_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """
+    Find the path of each (start, dest) pair in `pairs`, running one
+    `find_paths_from` per distinct start of each `chunk_size` pairs read,
+    with the titles and links of the last `memo_size` pages fetched from
+    `source` kept in memory for every search
+
+    Yields a dict for each pair as soon as it is resolved, of
+        "start", "dest": the pair as passed
+        "path": the path found (empty if none)
+        "found": whether a path was found
+        "seconds": seconds from the start of the search answering the pair
+            (shared by the pairs of the same start) to its answer
+        "elapsed": seconds since the batch started
+        "error": why the pair couldn't be searched (e.g. invalid title), or None
+
+    A `MalformedPair` is answered with its line as "start", an empty "dest"
+    and its error
+    """
+    if source is None:
+        source = default_source
+    if metrics is None:
+        metrics = null_metrics
+    source = CachedSource(source, MemoryCache(memo_size), metrics)
+    batch_start_time = time.perf_counter()
+
+    def result(
+        start: str, dest: str, path: List[str], search_start_time: float, error: Optional[str] = None
+    ) -> Dict[str, Any]:
+        now = time.perf_counter()
+        return {
+            "start": start,
+            "dest": dest,
+            "path": path,
+            "found": bool(path),
+            "seconds": now - search_start_time,
+            "elapsed": now - batch_start_time,
+            "error": error,
+        }
+
+    pairs = iter(pairs)
+    while True:
+        chunk = list(islice(pairs, chunk_size))
+        if not chunk:
+            break
+
+        # Resolved start -> resolved dest -> the pairs (as passed) of those titles
+        groups: Dict[str, Dict[str, List[Tuple[str, str]]]] = {}
+        for pair in chunk:
+            search_start_time = time.perf_counter()
+            if isinstance(pair, MalformedPair):
+                yield result(pair.line, "", [], search_start_time, pair.error)
+                continue
+
+            start, dest = pair
+            try:
+                with metrics.timer("title"):
+                    start_title = source.wikititle(start)
+                    dest_title = source.wikititle(dest)
+            except TitleNotFoundError as err:
+                yield result(start, dest, [], search_start_time, str(err))
+                continue
+            groups.setdefault(start_title, {}).setdefault(dest_title, []).append((start, dest))
+
+        # Starts with the most dests first, as their links are most likely to be reused
+        for start_title, dests in sorted(groups.items(), key=lambda group: -len(group[1])):
+            search_start_time = time.perf_counter()
+            for dest_title, path in find_paths_from(start_title, dests, source, metrics):
+                for start, dest in dests[dest_title]:
+                    yield result(start, dest, path, search_start_time)
+
+    metrics.finish()
+
+
+def run_batch(
+    in_file: IO[str],
+    out_file: IO[str],
+    source: Optional[LinkSource] = None,
+    metrics: Optional[NullMetrics] = None
+) -> None:
+    """
+    Read (start, dest) pairs from `in_file` (see `read_pairs`) and write the
+    result of each (see `find_paths_batch`) to `out_file` as a line of JSON
+    as soon as it is resolved
+    """
+    for result in find_paths_batch(read_pairs(in_file), source, metrics):
+        out_file.write(json.dumps(result) + "\n")
+        out_file.flush()
@@ -0,0 +1,625 @@
+"""
+Offline benchmark of the `find_path_*` functions on a synthetic wikipedia-shaped
+link graph, served by a local stand-in for the wikipedia api so every function
+runs its real http code path, with optional latency and errors
+
+Run with `python3 -m wikitas_tools.benchmark [...OPTIONS]`, which prints
+(or writes) a JSON report of the time, http reqs, pages expanded, peak traced
+memory and path optimality of every function on every (start, dest) pair
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from . import pathfinding
+from .batch import find_paths_batch
+from .landmarks import TitleGraph, build_landmark_index, find_path_landmarks
+from .metrics import SearchMetrics
+from .pathcache import PathCache
+from .service import SearchService
+from .sharded import find_path_sharded
+from .sources import MemorySource, WikiApiSource
+from .wikiapi import WikiApi
+
+LINKS_PER_RESPONSE = 500  # pllimit=max / bllimit=max for normal wikipedia users
+
+
+# ------------------------------------------------------
+# Synthetic link graphs
+
+def make_graph(
+    num_pages: int = 5000,
+    mean_links: int = 30,
+    seed: int = 0
+) -> Dict[str, List[str]]:
+    """
+    Generate a scale-free link graph of `num_pages` pages titled "Page {i}"
+
+    Like wikipedia, the no. of links on each page is log-normally distributed
+    (averaging about `mean_links`) and links go to pages with many backlinks
+    more often (preferential attachment), so there are a few large hubs
+    The same `seed` always generates the same graph
+    """
+    rnd = random.Random(seed)
+    titles = [f"Page {i}" for i in range(num_pages)]
+    sigma = 1.0
+    mu = math.log(max(1, mean_links)) - sigma ** 2 / 2  # Mean of log-normal is e^(mu + sigma^2 / 2)
+
+    # Each page appears once, plus once per backlink
+    targets = list(range(num_pages))
+    graph: Dict[str, List[str]] = {}
+    for i, title in enumerate(titles):
+        num_links = min(num_pages - 1, max(1, int(rnd.lognormvariate(mu, sigma))))
+        links = {}
+        while len(links) < num_links:
+            target = rnd.choice(targets)
+            if target != i:
+                links[target] = None
+
+        targets.extend(links)
+        graph[title] = [titles[target] for target in links]
+
+    return graph
+
+
+def save_graph(graph: Dict[str, List[str]], path: str) -> None:
+    """
+    Save `graph` (title -> links) as a JSON fixture
+    """
+    with open(path, "w", encoding="utf-8") as graph_file:
+        json.dump(graph, graph_file)
+
+
+def load_graph(path: str) -> Dict[str, List[str]]:
+    """
+    Load a graph saved by `save_graph` (or recorded in the same format)
+    """
+    with open(path, encoding="utf-8") as graph_file:
+        return json.load(graph_file)
+
+
+def shortest_path_length(graph: Dict[str, List[str]], start: str, dest: str) -> Optional[int]:
+    """
+    No. of pages on the shortest path from `start` to `dest` (None if no path)
+    """
+    if start == dest:
+        return 0
+
+    depths = {start: 1}
+    queue = deque([start])
+    while queue:
+        page = queue.popleft()
+        for link in graph.get(page, []):
+            if link not in depths:
+                if link == dest:
+                    return depths[page] + 1
+                depths[link] = depths[page] + 1
+                queue.append(link)
+
+    return None
+
+
+# ------------------------------------------------------
+# Local stand-in for the wikipedia api
+
+class MockWikiServer:
+    """
+    Serves `graph` over http, answering the opensearch, prop=links, list=backlinks
+    and prop=categories queries made by `WikiApi` like the wikipedia api does
+    (including `continue` pagination of `links_per_response` links per response)
+
+    Each response is delayed by `latency` seconds, and fails with a
+    http 503 with probability `error_rate`
+
+    Use as a context manager:
+        with MockWikiServer(graph) as server:
+            api = WikiApi(url=server.url)
+
+    Attributes:
+    ----------
+    `url`: str
+        Url of the api.php endpoint
+    `stats`: Dict[str, int]
+        Counts of `requests`, `bytes` sent, `errors` and `pages_expanded`
+        (titles queried for links or backlinks), reset with `reset_stats()`
+    """
+
+    def __init__(
+        self,
+        graph: Dict[str, List[str]],
+        latency: float = 0,
+        error_rate: float = 0,
+        links_per_response: int = LINKS_PER_RESPONSE,
+        seed: int = 0
+    ):
+        self.graph = graph
+        self.latency = latency
+        self.error_rate = error_rate
+        self.links_per_response = links_per_response
+        self.page_ids = {title: i + 1 for i, title in enumerate(graph)}
+        self._titles_lower = {title.lower(): title for title in graph}
+        self.backlinks: Dict[str, List[str]] = {}
+        for title, links in graph.items():
+            for link in links:
+                self.backlinks.setdefault(link, []).append(title)
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._last_request = 0.0
+        self.stats: Dict[str, int] = {}
+        self.reset_stats()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self.url = ""
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = {"requests": 0, "bytes": 0, "errors": 0, "pages_expanded": 0}
+
+    def wait_idle(self, quiet: float = 0.05) -> None:
+        """
+        Wait until no reqs are in flight and none have started for `quiet` seconds,
+        e.g. for reqs abandoned by a finished search to stop
+        """
+        while True:
+            with self._lock:
+                idle = not self._in_flight and time.monotonic() - self._last_request >= quiet
+            if idle:
+                return
+            time.sleep(quiet)
+
+    def __enter__(self) -> 'MockWikiServer':
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                mock._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 128  # Room for every thread's connection at once
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_port}/w/api.php"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    # ------------------------------------------------------
+    # Request handling
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        params = {key: values[0] for key, values in parse_qs(urlparse(handler.path).query).items()}
+        with self._lock:
+            self._in_flight += 1
+            self._last_request = time.monotonic()
+            self.stats["requests"] += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.stats["errors"] += 1
+
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+
+            if failed:
+                body = b"<html><body>503 Service Unavailable</body></html>"
+                status = 503
+            else:
+                body = json.dumps(self._respond(params)).encode()
+                status = 200
+
+            with self._lock:
+                self.stats["bytes"] += len(body)
+            handler.send_response(status)
+            handler.send_header("Content-Type", "application/json" if status == 200 else "text/html")
+            handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _respond(self, params: Dict[str, str]) -> Any:
+        if params.get("action") == "opensearch":
+            title = self._titles_lower.get(params.get("search", "").replace("_", " ").lower())
+            return [params.get("search", ""), [title] if title else []]
+
+        if params.get("list") == "backlinks":
+            return self._backlinks(params)
+        if params.get("prop") == "links":
+            return self._links(params)
+        if params.get("prop") == "categories":
+            return {"query": {"pages": self._pages(params["titles"].split("|"))[1]}}
+
+        return {"error": {"code": "badparams", "info": f"Unsupported query: {params}"}}
+
+    def _pages(self, titles: List[str]) -> Tuple[List[Dict[str, str]], Dict[str, Dict[str, Any]]]:
+        """
+        The "normalized" list and "pages" dict of a response for `titles`
+        """
+        normalized = []
+        pages = {}
+        missing_id = 0
+        for title in titles:
+            if "_" in title:
+                normalized.append({"from": title, "to": title.replace("_", " ")})
+                title = title.replace("_", " ")
+
+            if title in self.page_ids:
+                page_id = self.page_ids[title]
+                pages[str(page_id)] = {"pageid": page_id, "ns": 0, "title": title}
+            else:
+                missing_id -= 1
+                pages[str(missing_id)] = {"ns": 0, "title": title, "missing": ""}
+
+        return normalized, pages
+
+    def _links(self, params: Dict[str, str]) -> Dict[str, Any]:
+        titles = params["titles"].split("|")
+        normalized, pages = self._pages(titles)
+        if "plcontinue" not in params:
+            with self._lock:
+                self.stats["pages_expanded"] += len(titles)
+
+        # Continue from the `offset`th link of the `page_num`th page (by page id)
+        page_num, offset = 0, 0
+        if "plcontinue" in params:
+            page_num, offset = map(int, params["plcontinue"].split("|"))
+
+        ordered = sorted((int(page_id), page) for page_id, page in pages.items() if int(page_id) > 0)
+        if params.get("formatversion") == "2":  # Pages as a list, "missing" as a bool
+            for page in pages.values():
+                if "missing" in page:
+                    page["missing"] = True
+            pages = list(pages.values())
+
+        remaining = self.links_per_response
+        for i in range(page_num, len(ordered)):
+            page = ordered[i][1]
+            links = self.graph.get(page["title"], [])[offset:offset + remaining]
+            if links:
+                page["links"] = [{"ns": 0, "title": link} for link in links]
+            remaining -= len(links)
+            if offset + len(links) < len(self.graph.get(page["title"], [])):
+                return {
+                    "continue": {"plcontinue": f"{i}|{offset + len(links)}", "continue": "||"},
+                    "query": {"normalized": normalized, "pages": pages},
+                }
+            offset = 0
+
+        return {"batchcomplete": "", "query": {"normalized": normalized, "pages": pages}}
+
+    def _backlinks(self, params: Dict[str, str]) -> Dict[str, Any]:
+        backlinks = self.backlinks.get(params["bltitle"].replace("_", " "), [])
+        if params.get("blfilterredir") == "redirects":  # The graph has no redirects
+            backlinks = []
+        if "blcontinue" not in params:
+            with self._lock:
+                self.stats["pages_expanded"] += 1
+
+        offset = int(params.get("blcontinue", 0))
+        end = offset + self.links_per_response
+        res: Dict[str, Any] = {
+            "query": {
+                "backlinks": [
+                    {"pageid": self.page_ids[title], "ns": 0, "title": title}
+                    for title in backlinks[offset:end]
+                ]
+            }
+        }
+        if end < len(backlinks):
+            res["continue"] = {"blcontinue": str(end), "continue": "-||"}
+        return res
+
+
+# ------------------------------------------------------
+# Running the benchmark
+
+FINDERS: Dict[str, Callable[..., List[str]]] = {
+    name: finder
+    for name, finder in vars(pathfinding).items()
+    if name.startswith("find_path_") and callable(finder)
+}
+
+NUM_HUBS = 2  # Hubs of the `PathCache`
+NUM_LANDMARKS = 8  # Landmarks of the landmark index
+SHARDED_WORKERS = 2  # Worker processes of `find_path_sharded`
+
+
+def _api_source(url: str) -> WikiApiSource:
+    """
+    A source over the api at `url` (module level, so worker processes can unpickle it)
+    """
+    return WikiApiSource(WikiApi(url=url))
+
+
+def _hubs(graph: Dict[str, List[str]], num_hubs: int) -> List[str]:
+    """
+    The `num_hubs` pages of `graph` with the most backlinks
+    """
+    in_degrees: Dict[str, int] = dict.fromkeys(graph, 0)
+    for links in graph.values():
+        for link in links:
+            in_degrees[link] = in_degrees.get(link, 0) + 1
+    return sorted(in_degrees, key=in_degrees.get, reverse=True)[:num_hubs]
+
+
+# Searchers set up once per benchmark by `setup(graph, url, stack)` (`url`
+# being the mock api's, and `stack` an `ExitStack` for their clean up),
+# returning a `find_path(start, dest, source, metrics)` function. They keep
+# state between searches or take a while to set up, so they only run when
+# named in `finders` (`--finders` or `--extras`):
+#   find_path_sharded       A new pool of `SHARDED_WORKERS` worker processes per search
+#   find_path_landmarks     An A* search over the in-memory graph (no http reqs),
+#                           with the landmark index built up front
+#   path_cache              A `PathCache` kept between searches, with the trees of
+#                           the `NUM_HUBS` biggest hubs fetched up front
+#   service                 A `SearchService` kept between searches
+def _setup_sharded(graph: Dict[str, List[str]], url: str, stack: contextlib.ExitStack) -> Callable[..., List[str]]:
+    def find_path(start: str, dest: str, source: WikiApiSource, metrics: SearchMetrics) -> List[str]:
+        return find_path_sharded(
+            start, dest, workers=SHARDED_WORKERS, source_factory=partial(_api_source, url), metrics=metrics
+        )
+    return find_path
+
+
+def _setup_landmarks(graph: Dict[str, List[str]], url: str, stack: contextlib.ExitStack) -> Callable[..., List[str]]:
+    title_graph = TitleGraph(MemorySource(graph), list(graph))
+    index_dir = stack.enter_context(tempfile.TemporaryDirectory())
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        index = build_landmark_index(title_graph, index_dir, NUM_LANDMARKS)
+
+    def find_path(start: str, dest: str, source: WikiApiSource, metrics: SearchMetrics) -> List[str]:
+        return find_path_landmarks(start, dest, source=title_graph, index=index, metrics=metrics)
+    return find_path
+
+
+def _setup_path_cache(graph: Dict[str, List[str]], url: str, stack: contextlib.ExitStack) -> Callable[..., List[str]]:
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        path_cache = PathCache(_api_source(url), hubs=_hubs(graph, NUM_HUBS))
+
+    def find_path(start: str, dest: str, source: WikiApiSource, metrics: SearchMetrics) -> List[str]:
+        return path_cache.find_path(start, dest, metrics=metrics)
+    return find_path
+
+
+def _setup_service(graph: Dict[str, List[str]], url: str, stack: contextlib.ExitStack) -> Callable[..., List[str]]:
+    service = SearchService(_api_source(url))
+
+    def find_path(start: str, dest: str, source: WikiApiSource, metrics: SearchMetrics) -> List[str]:
+        return service.search(start, dest)["path"]
+    return find_path
+
+
+EXTRA_FINDERS: Dict[str, Callable[..., Callable[..., List[str]]]] = {
+    "find_path_sharded": _setup_sharded,
+    "find_path_landmarks": _setup_landmarks,
+    "path_cache": _setup_path_cache,
+    "service": _setup_service,
+}
+
+
+def _run_batch(
+    pairs: List[Tuple[str, str]], source: WikiApiSource, metrics: SearchMetrics
+) -> Iterator[Tuple[str, str, List[str], Optional[str]]]:
+    """
+    `(start, dest, path, error)` of each pair of `pairs`, from one `find_paths_batch`
+    """
+    for result in find_paths_batch(pairs, source=source, metrics=metrics):
+        yield result["start"], result["dest"], result["path"], result["error"]
+
+
+# Searchers of every pair at once, as `run(pairs, source, metrics)` yielding
+# `(start, dest, path, error)` as each pair is answered
+BATCH_FINDERS: Dict[str, Callable[..., Iterator[Tuple[str, str, List[str], Optional[str]]]]] = {
+    "find_paths_batch": _run_batch,
+}
+
+ALL_FINDERS = [*FINDERS, *EXTRA_FINDERS, *BATCH_FINDERS]
+
+
+def make_pairs(graph: Dict[str, List[str]], num_pairs: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    `num_pairs` random (start, dest) pairs of different pages of `graph`
+    """
+    rnd = random.Random(seed)
+    titles = list(graph)
+    return [tuple(rnd.sample(titles, 2)) for _ in range(num_pairs)]
+
+
+def run_benchmark(
+    graph: Dict[str, List[str]],
+    pairs: List[Tuple[str, str]],
+    finders: Optional[List[str]] = None,
+    latency: float = 0,
+    error_rate: float = 0,
+    links_per_response: int = LINKS_PER_RESPONSE,
+    trace_memory: bool = False
+) -> Dict[str, Any]:
+    """
+    Run each of `finders` (names in `ALL_FINDERS`, the `find_path_*`
+    functions by default) on each (start, dest) pair of `pairs` against a
+    `MockWikiServer` of `graph`
+
+    With `trace_memory`, each search's peak memory allocated by python in
+    this process is traced with `tracemalloc` ("peak_traced_kb"), which slows
+    searches down, includes the mock server's allocations in the meantime
+    and leaves out worker processes (e.g. of `find_path_sharded`)
+
+    Returns the report, with one entry in "results" per function & pair
+    """
+    finders = finders if finders is not None else list(FINDERS)
+    results = []
+
+    with MockWikiServer(graph, latency, error_rate, links_per_response) as server, contextlib.ExitStack() as stack:
+        def record(
+            name: str, start: str, dest: str, path: List[str], error: Optional[str],
+            seconds: float, metrics: SearchMetrics, peak_traced_kb: Optional[int]
+        ) -> None:
+            if isinstance(path, pathfinding.SearchResult):  # find_path_bounded
+                path = path.path
+            shortest = shortest_path_length(graph, start, dest)
+            valid = bool(path) and path[0] == start and path[-1] == dest and all(
+                link in graph.get(page, []) for page, link in zip(path, path[1:])
+            )
+            results.append({
+                "finder": name,
+                "start": start,
+                "dest": dest,
+                "seconds": seconds,
+                **server.stats,
+                "peak_traced_kb": peak_traced_kb,
+                "path_length": len(path) if path else None,
+                "shortest_length": shortest,
+                "valid": valid,
+                "optimal": valid and len(path) == shortest,
+                "error": error,
+                "metrics": metrics.report(),
+            })
+
+        def start_search() -> float:
+            server.reset_stats()
+            if trace_memory:
+                tracemalloc.start()
+            return time.perf_counter()
+
+        def end_search(start_time: float) -> Tuple[float, Optional[int]]:
+            seconds = time.perf_counter() - start_time
+            server.wait_idle()  # Count reqs abandoned by the search too
+            if not trace_memory:
+                return seconds, None
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return seconds, peak // 1024
+
+        for name in finders:
+            if name in BATCH_FINDERS:
+                # Each pair is timed and counted from the previous answer
+                metrics = SearchMetrics()
+                source = WikiApiSource(WikiApi(url=server.url, metrics=metrics))
+                answers = BATCH_FINDERS[name](pairs, source, metrics)
+                while True:
+                    start_time = start_search()
+                    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                        answer = next(answers, None)
+                    seconds, peak_traced_kb = end_search(start_time)
+                    if answer is None:
+                        break
+                    start, dest, path, error = answer
+                    record(name, start, dest, path, error, seconds, metrics, peak_traced_kb)
+                continue
+
+            if name in EXTRA_FINDERS:
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    finder = EXTRA_FINDERS[name](graph, server.url, stack)
+            else:
+                finder = FINDERS[name]
+            for start, dest in pairs:
+                # A new api for each search, so no links are reused between searches
+                metrics = SearchMetrics()
+                source = WikiApiSource(WikiApi(url=server.url, metrics=metrics))
+                path, error = [], None
+
+                start_time = start_search()
+                try:
+                    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                        path = finder(start, dest, source=source, metrics=metrics)
+                except Exception as err:  # e.g. injected http errors
+                    error = f"{type(err).__name__}: {err}"
+                seconds, peak_traced_kb = end_search(start_time)
+                record(name, start, dest, path, error, seconds, metrics, peak_traced_kb)
+
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "graph": {"pages": len(graph), "links": sum(map(len, graph.values()))},
+        "latency": latency,
+        "error_rate": error_rate,
+        "links_per_response": links_per_response,
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m wikitas_tools.benchmark",
+        description="Benchmark the find_path_* functions on a synthetic link graph served by a local mock wikipedia api",
+    )
+    parser.add_argument("--pages", type=int, default=5000, help="No. of pages of the synthetic graph")
+    parser.add_argument("--links", type=int, default=30, help="Average no. of links per page")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the graph and pairs")
+    parser.add_argument("--graph-file", help="Load the graph from this JSON fixture instead")
+    parser.add_argument("--save-graph", help="Save the graph to this JSON fixture")
+    parser.add_argument("--pairs", type=int, default=5, help="No. of random (start, dest) pairs")
+    parser.add_argument("--finders", help="Comma separated finders (default all the pathfinding find_path_* functions)")
+    parser.add_argument(
+        "--extras", action="store_true",
+        help="Also run the sharded, landmark, path cache, service and batch searches",
+    )
+    parser.add_argument(
+        "--trace-memory", action="store_true",
+        help="Report each search's peak python memory (tracemalloc, slowing searches down)",
+    )
+    parser.add_argument("--latency", type=float, default=0, help="Seconds of latency per http req")
+    parser.add_argument("--error-rate", type=float, default=0, help="Probability of each http req failing")
+    parser.add_argument("--links-per-response", type=int, default=LINKS_PER_RESPONSE)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    if args.graph_file:
+        graph = load_graph(args.graph_file)
+    else:
+        graph = make_graph(args.pages, args.links, args.seed)
+    if args.save_graph:
+        save_graph(graph, args.save_graph)
+
+    finders = args.finders.split(",") if args.finders else list(FINDERS)
+    if args.extras:
+        finders += [name for name in ALL_FINDERS if name not in FINDERS and name not in finders]
+    for name in finders:
+        if name not in ALL_FINDERS:
+            parser.error(f"Unknown finder '{name}' (one of {', '.join(ALL_FINDERS)})")
+
+    report = run_benchmark(
+        graph,
+        make_pairs(graph, args.pairs, args.seed),
+        finders,
+        args.latency,
+        args.error_rate,
+        args.links_per_response,
+        args.trace_memory,
+    )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as report_file:
+            json.dump(report, report_file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""
+Persistent on-disk cache of wikipedia api results (links, categories, titles),
+shared across searches, threads and processes
+"""
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from .metrics import NullMetrics, null_metrics
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "wikitas", "cache.sqlite3")
+DEFAULT_TTL = 7 * 24 * 60 * 60  # 1 week
+DEFAULT_MAX_BYTES = 1024 ** 3  # 1 GiB of cached values
+
+_TOUCH_INTERVAL = 60  # Min seconds between updates of an entry's access time
+_EVICT_EVERY = 1000  # No. of writes between checks of the size of the cache
+
+
+class LinkCache:
+    """
+    SQLite-backed cache of json-serialisable values keyed by (`kind`, `key`),
+    e.g. ("links", "Among Us") -> ["Among Us VR", ...]
+
+    The database is in WAL mode, so any number of threads and processes can
+    read while another writes. Each thread gets its own connection
+
+    Entries of different sources (e.g. the apis of different wikis) are kept
+    apart by `scoped` views of the cache, which share its database
+
+    Attributes:
+    ----------
+    `path`: str
+        Path of the SQLite database file
+    `ttl`: Optional[float]
+        Seconds an entry is valid for after being fetched (None for no expiry)
+    `max_bytes`: Optional[int]
+        Size of cached values above which the least recently used
+        entries are evicted (None for no limit)
+    `scope`: Optional[str]
+        Scope of the entries of this view (None for the unscoped cache)
+
+    Methods:
+    -------
+    `scoped(scope: str)`: LinkCache
+        View of the cache keeping its entries apart under `scope`
+    `get(kind: str, key: str)`: Optional[Any]
+        Returns the cached value or None if missing or expired
+    `get_many(kind: str, keys: Iterable[str])`: Dict[str, Any]
+        Returns the cached values of each key in `keys` that is cached
+    `set(kind: str, key: str, value: Any)`: None
+        Caches `value`
+    `set_many(kind: str, values: Dict[str, Any])`: None
+        Caches every key -> value in `values` in a single transaction
+    `invalidate(kind: Optional[str], key: Optional[str])`: None
+        Removes an entry, all entries of a kind, or everything
+    `invalidate_before(kind: str, times: Dict[str, float])`: None
+        Removes the entries of each key fetched before its time (e.g. its page's last change)
+    `evict()`: None
+        Removes expired entries, then least recently used entries until
+        the cache is at most `max_bytes`
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = DEFAULT_PATH,
+        ttl: Optional[float] = DEFAULT_TTL,
+        max_bytes: Optional[int] = DEFAULT_MAX_BYTES
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.scope: Optional[str] = None
+        self._local = threading.local()  # Connection and no. of writes of each thread
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        """
+        Returns the connection of the current thread, opening it if needed
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit, with explicit transactions for multiple writes
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.writes = 0
+        return conn
+
+    def _kind(self, kind: str) -> str:
+        return kind if self.scope is None else f"{self.scope} {kind}"
+
+    def scoped(self, scope: str) -> 'LinkCache':
+        """
+        View of the cache (sharing its database and connections) whose
+        entries are kept apart from those of other scopes under `scope`
+        (e.g. the url of the api they are fetched from)
+        """
+        view = copy.copy(self)
+        view.scope = self._kind(scope)
+        return view
+
+    def _is_fresh(self, fetched_at: float, now: float) -> bool:
+        return self.ttl is None or now - fetched_at < self.ttl
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        """
+        Returns the cached value of (`kind`, `key`) or None if missing or expired
+        """
+        return self.get_many(kind, [key]).get(key)
+
+    def get_many(self, kind: str, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Returns a dict of key -> cached value for each key in `keys` that
+        is cached and hasn't expired
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        conn = self._conn()
+        now = time.time()
+        values: Dict[str, Any] = {}
+        stale_access = []
+
+        # Stay under SQLite's limit on the no. of params in a query
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = conn.execute(
+                "SELECT key, value, fetched_at, accessed_at FROM entries "
+                f"WHERE kind = ? AND key IN ({', '.join('?' * len(chunk))})",
+                (self._kind(kind), *chunk),
+            )
+            for key, value, fetched_at, accessed_at in rows:
+                if not self._is_fresh(fetched_at, now):
+                    continue
+                values[key] = json.loads(value)
+                if now - accessed_at > _TOUCH_INTERVAL:
+                    stale_access.append((now, self._kind(kind), key))
+
+        # Access times only need to be roughly right for LRU eviction,
+        # so they aren't written on every read
+        if stale_access:
+            conn.executemany(
+                "UPDATE entries SET accessed_at = ? WHERE kind = ? AND key = ?",
+                stale_access,
+            )
+
+        return values
+
+    def set(self, kind: str, key: str, value: Any) -> None:
+        """
+        Caches `value` as the value of (`kind`, `key`)
+        """
+        self.set_many(kind, {key: value})
+
+    def set_many(self, kind: str, values: Dict[str, Any]) -> None:
+        """
+        Caches every key -> value in `values` in a single transaction
+        """
+        if not values:
+            return
+
+        now = time.time()
+        kind = self._kind(kind)
+        rows = []
+        for key, value in values.items():
+            encoded = json.dumps(value, separators=(",", ":"))
+            rows.append((kind, key, encoded, len(encoded), now, now))
+
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries "
+                "(kind, key, value, size, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+        # Counted per thread, so without a lock
+        self._local.writes += len(rows)
+        if self._local.writes >= _EVICT_EVERY:
+            self._local.writes = 0
+            self.evict()
+
+    def invalidate(self, kind: Optional[str] = None, key: Optional[str] = None) -> None:
+        """
+        Removes the entry (`kind`, `key`), all entries of `kind` if `key`
+        is None, or every entry (of the scope, if scoped) if both are None
+        """
+        conn = self._conn()
+        if kind is None and self.scope is None:
+            conn.execute("DELETE FROM entries")
+        elif kind is None:
+            prefix = self._kind("")
+            conn.execute("DELETE FROM entries WHERE substr(kind, 1, ?) = ?", (len(prefix), prefix))
+        elif key is None:
+            conn.execute("DELETE FROM entries WHERE kind = ?", (self._kind(kind),))
+        else:
+            conn.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (self._kind(kind), key))
+
+    def invalidate_before(self, kind: str, times: Dict[str, float]) -> None:
+        """
+        Removes the entry of each key -> time in `times` of `kind` fetched
+        before that time (e.g. the last change of the page it was fetched from)
+        """
+        if not times:
+            return
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "DELETE FROM entries WHERE kind = ? AND key = ? AND fetched_at < ?",
+                [(self._kind(kind), key, fetched_before) for key, fetched_before in times.items()],
+            )
+
+    def evict(self) -> None:
+        """
+        Removes expired entries, then the least recently used entries
+        until the size of the cached values is at most `max_bytes`
+        (of every scope, as they share the database)
+        """
+        conn = self._conn()
+        if self.ttl is not None:
+            conn.execute(
+                "DELETE FROM entries WHERE fetched_at < ?", (time.time() - self.ttl,)
+            )
+
+        if self.max_bytes is None:
+            return
+
+        total, = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        excess = total - self.max_bytes
+        if excess <= 0:
+            return
+
+        # Delete from least recently used until enough bytes are freed
+        rows = conn.execute("SELECT rowid, size FROM entries ORDER BY accessed_at")
+        to_delete = []
+        for rowid, size in rows:
+            if excess <= 0:
+                break
+            to_delete.append((rowid,))
+            excess -= size
+        rows.close()
+
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("DELETE FROM entries WHERE rowid = ?", to_delete)
+
+    def close(self) -> None:
+        """
+        Closes the connection of the current thread
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class MemoryCache:
+    """
+    In-memory cache with the same methods as `LinkCache`, keeping the
+    `max_entries` most recently used entries (no limit if None)
+    e.g. to share links between the searches of a batch
+    """
+
+    def __init__(self, max_entries: Optional[int] = 100_000):
+        self.max_entries = max_entries
+        self.scope: Optional[str] = None
+        # (kind, key) -> (value, time fetched)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _kind(self, kind: str) -> str:
+        return kind if self.scope is None else f"{self.scope} {kind}"
+
+    def scoped(self, scope: str) -> 'MemoryCache':
+        view = copy.copy(self)  # Sharing the entries and lock
+        view.scope = self._kind(scope)
+        return view
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        return self.get_many(kind, [key]).get(key)
+
+    def get_many(self, kind: str, keys: Iterable[str]) -> Dict[str, Any]:
+        kind = self._kind(kind)
+        values: Dict[str, Any] = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get((kind, key))
+                if entry is not None:
+                    self._entries.move_to_end((kind, key))
+                    values[key] = entry[0]
+        return values
+
+    def set(self, kind: str, key: str, value: Any) -> None:
+        self.set_many(kind, {key: value})
+
+    def set_many(self, kind: str, values: Dict[str, Any]) -> None:
+        kind = self._kind(kind)
+        now = time.time()
+        with self._lock:
+            for key, value in values.items():
+                self._entries[(kind, key)] = (value, now)
+                self._entries.move_to_end((kind, key))
+
+            if self.max_entries is not None:
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def invalidate(self, kind: Optional[str] = None, key: Optional[str] = None) -> None:
+        with self._lock:
+            if kind is None and self.scope is None:
+                self._entries.clear()
+            elif kind is None:
+                prefix = self._kind("")
+                for entry in [entry for entry in self._entries if entry[0].startswith(prefix)]:
+                    del self._entries[entry]
+            elif key is None:
+                kind = self._kind(kind)
+                for entry in [entry for entry in self._entries if entry[0] == kind]:
+                    del self._entries[entry]
+            else:
+                self._entries.pop((self._kind(kind), key), None)
+
+    def invalidate_before(self, kind: str, times: Dict[str, float]) -> None:
+        kind = self._kind(kind)
+        with self._lock:
+            for key, fetched_before in times.items():
+                entry = self._entries.get((kind, key))
+                if entry is not None and entry[1] < fetched_before:
+                    del self._entries[(kind, key)]
+
+    def evict(self) -> None:
+        pass  # Evicted as entries are set
+
+    def close(self) -> None:
+        pass
+
+
+def cached_query(
+    cache: Optional[LinkCache],
+    kind: str,
+    query: Callable[[List[str]], Iterator[Dict[str, List[str]]]],
+    titles: List[str],
+    metrics: NullMetrics = null_metrics
+) -> Iterator[Dict[str, List[str]]]:
+    """
+    Cache the complete results of `query`, a generator taking a list of titles and
+    yielding dicts of title -> links as each response arrives, under `kind` in `cache`
+    Cached titles are yielded first, then the rest are queried and only
+    cached once every response has arrived
+    Just runs `query` if `cache` is None
+    Counts "cache_hits" and "cache_misses" in `metrics`
+    """
+    if cache is None:
+        yield from query(titles)
+        return
+
+    cached = cache.get_many(kind, titles)
+    misses = [title for title in titles if title not in cached]
+    metrics.count("cache_hits", len(cached))
+    metrics.count("cache_misses", len(misses))
+    if cached:
+        yield cached
+
+    if not misses:
+        return
+
+    complete: Dict[str, List[str]] = {title: [] for title in misses}
+    for batch_links in query(misses):
+        for title, links in batch_links.items():
+            complete[title].extend(links)
+        yield batch_links
+
+    # Not reached if the caller stopped early, so no partial results
+    cache.set_many(kind, complete)
@@ -0,0 +1,308 @@
+"""
+Compact, pickled form of the parts of the wordnet db used for word matching:
+the lemma index and exception lists (to find the first synset of a word like
+`wordnet.synsets(word)[0]`) and the hypernyms of every synset (for the
+Wu-Palmer similarity), loading in a fraction of the time of importing nltk
+and reading its wordnet corpus, for short-lived word matching processes
+
+Build it once (needs nltk and its wordnet data) with
+    python3 -m wikitas_tools.compactwordnet OUT_FILE
+and use it for word matching with `word_utils.use_wordnet(OUT_FILE)`, or by
+setting the `WIKITAS_WORDNET` environment variable to OUT_FILE (which
+worker processes inherit)
+"""
+import argparse
+import pickle
+from collections import deque
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+FORMAT_VERSION = 1
+POS_LIST = ("n", "v", "a", "r")  # Parts of speech in the order `wordnet.synsets` returns them
+ROOT = -1  # The fake root joining the taxonomies (nltk's `simulate_root`)
+
+# Suffix rules of nltk's `morphy`, by part of speech
+MORPHOLOGICAL_SUBSTITUTIONS = {
+    "n": [
+        ("s", ""), ("ses", "s"), ("ves", "f"), ("xes", "x"), ("zes", "z"),
+        ("ches", "ch"), ("shes", "sh"), ("men", "man"), ("ies", "y"),
+    ],
+    "v": [
+        ("s", ""), ("ies", "y"), ("es", "e"), ("es", ""),
+        ("ed", "e"), ("ed", ""), ("ing", "e"), ("ing", ""),
+    ],
+    "a": [("er", ""), ("est", ""), ("er", "e"), ("est", "e")],
+    "r": [],
+}
+
+
+class CompactSynset:
+    """
+    A synset of a `CompactWordNet`, with the same `wup_similarity` as nltk's `Synset`
+    """
+    __slots__ = ("wordnet", "index")
+
+    def __init__(self, wordnet: 'CompactWordNet', index: int):
+        self.wordnet = wordnet
+        self.index = index
+
+    def name(self) -> str:
+        return self.wordnet.names[self.index]
+
+    def wup_similarity(self, other: 'CompactSynset') -> Optional[float]:
+        return self.wordnet.wup_similarity(self.index, other.index)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CompactSynset) and self.index == other.index
+
+    def __hash__(self) -> int:
+        return self.index
+
+    def __repr__(self) -> str:
+        return f"CompactSynset('{self.name()}')"
+
+
+class CompactWordNet:
+    """
+    The first synset of each word and the hypernyms of each synset of the
+    wordnet db, giving the same results as nltk's `wordnet.synsets(word)[0]`
+    and `Synset.wup_similarity` (with its default `simulate_root=True`)
+
+    Attributes:
+    ----------
+    `names`: List[str]
+        Name of each synset (e.g. dog.n.01), by synset id
+    `pos`: str
+        Part of speech of each synset, by synset id
+    `parents`: List[Tuple[int, ...]]
+        Ids of the hypernyms and instance hypernyms of each synset
+    `lemmas`: Dict[str, Dict[str, int]]
+        Lemma -> part of speech -> id of its first synset
+    `exceptions`: Dict[str, Dict[str, List[str]]]
+        Part of speech -> irregular form -> its base forms (e.g. geese -> goose)
+    `nouns_need_root`: bool
+        Whether nouns are joined by the fake root too (only in wordnet 1.6)
+
+    Methods:
+    -------
+    `synset(word: str)`: Optional[CompactSynset]
+        First synset of `word`, or None if not in the wordnet db
+    `wup_similarity(syn_1: int, syn_2: int)`: Optional[float]
+        Wu-Palmer similarity of 2 synset ids
+    """
+
+    def __init__(
+        self,
+        names: List[str],
+        pos: str,
+        parents: List[Tuple[int, ...]],
+        lemmas: Dict[str, Dict[str, int]],
+        exceptions: Dict[str, Dict[str, List[str]]],
+        nouns_need_root: bool = False
+    ):
+        self.names = names
+        self.pos = pos
+        self.parents = parents
+        self.lemmas = lemmas
+        self.exceptions = exceptions
+        self.nouns_need_root = nouns_need_root
+        self._min_depths: Dict[int, int] = {ROOT: 0}
+        self._max_depths: Dict[int, int] = {ROOT: 0}
+        self._ancestors: Dict[int, FrozenSet[int]] = {}
+        self._hypernym_paths: Dict[int, Dict[int, int]] = {ROOT: {ROOT: 0}}
+
+    # ------ Words ------
+
+    def _morphy(self, form: str, pos: str) -> List[str]:
+        """
+        Base forms of `form` in the db as `pos`, as found by nltk's `morphy`
+        """
+        substitutions = MORPHOLOGICAL_SUBSTITUTIONS[pos]
+
+        def apply_rules(forms: List[str]) -> List[str]:
+            return [
+                form[:-len(old)] + new
+                for form in forms
+                for old, new in substitutions
+                if form.endswith(old)
+            ]
+
+        def filter_forms(forms: List[str]) -> List[str]:
+            return list(dict.fromkeys(form for form in forms if pos in self.lemmas.get(form, ())))
+
+        exceptions = self.exceptions[pos]
+        if form in exceptions:
+            return filter_forms([form, *exceptions[form]])
+
+        forms = apply_rules([form])
+        results = filter_forms([form, *forms])
+        while forms and not results:
+            forms = apply_rules(forms)
+            results = filter_forms(forms)
+        return results
+
+    def synset(self, word: str) -> Optional[CompactSynset]:
+        """
+        First synset of `word` (as `wordnet.synsets(word)[0]`), or None if not in the wordnet db
+        """
+        word = word.lower()
+        for pos in POS_LIST:
+            forms = self._morphy(word, pos)
+            if forms:
+                return CompactSynset(self, self.lemmas[forms[0]][pos])
+        return None
+
+    # ------ Similarity ------
+
+    def _name(self, syn: int) -> str:
+        return "*ROOT*" if syn == ROOT else self.names[syn]
+
+    def _min_depth(self, syn: int) -> int:
+        if syn not in self._min_depths:
+            parents = self.parents[syn]
+            self._min_depths[syn] = 1 + min(map(self._min_depth, parents)) if parents else 0
+        return self._min_depths[syn]
+
+    def _max_depth(self, syn: int) -> int:
+        if syn not in self._max_depths:
+            parents = self.parents[syn]
+            self._max_depths[syn] = 1 + max(map(self._max_depth, parents)) if parents else 0
+        return self._max_depths[syn]
+
+    def _all_ancestors(self, syn: int) -> FrozenSet[int]:
+        """
+        `syn` and all of its hypernyms
+        """
+        if syn not in self._ancestors:
+            ancestors = {syn}
+            for parent in self.parents[syn]:
+                ancestors |= self._all_ancestors(parent)
+            self._ancestors[syn] = frozenset(ancestors)
+        return self._ancestors[syn]
+
+    def _paths(self, syn: int) -> Dict[int, int]:
+        """
+        Hypernym of `syn` (and `syn`) -> the fewest links from `syn` up to it
+        """
+        if syn not in self._hypernym_paths:
+            paths = {}
+            queue = deque([(syn, 0)])
+            while queue:
+                hypernym, distance = queue.popleft()
+                if hypernym not in paths:
+                    paths[hypernym] = distance
+                    queue.extend((parent, distance + 1) for parent in self.parents[hypernym])
+            self._hypernym_paths[syn] = paths
+        return self._hypernym_paths[syn]
+
+    def _distance(self, syn_1: int, syn_2: int, simulate_root: bool) -> Optional[int]:
+        """
+        Fewest links between `syn_1` and `syn_2` through a common hypernym
+        (or the fake root if `simulate_root`), or None if not connected
+        """
+        if syn_1 == syn_2:
+            return 0
+        paths_1 = self._paths(syn_1)
+        paths_2 = self._paths(syn_2)
+        distance = min(
+            (d_1 + paths_2[hypernym] for hypernym, d_1 in paths_1.items() if hypernym in paths_2),
+            default=None,
+        )
+        if simulate_root:  # The fake root is 1 link above the furthest hypernym
+            through_root = (max(paths_1.values()) + 1) + (0 if syn_2 == ROOT else max(paths_2.values()) + 1)
+            distance = through_root if distance is None else min(distance, through_root)
+        return distance
+
+    def wup_similarity(self, syn_1: int, syn_2: int) -> Optional[float]:
+        """
+        Wu-Palmer similarity of synset ids `syn_1` and `syn_2`, as
+        `syn_1.wup_similarity(syn_2)` with nltk, or None if they aren't connected
+        """
+        need_root = self._needs_root(syn_1) or self._needs_root(syn_2)
+
+        # Lowest common hypernyms, by min depth (as nltk does for wup)
+        common = list(self._all_ancestors(syn_1) & self._all_ancestors(syn_2))
+        if need_root:
+            common.append(ROOT)
+        if not common:
+            return None
+        lowest_depth = max(map(self._min_depth, common))
+        subsumers = sorted((syn for syn in common if self._min_depth(syn) == lowest_depth), key=self._name)
+        subsumer = syn_1 if syn_1 in subsumers else subsumers[0]
+
+        depth = self._max_depth(subsumer) + 1
+        len_1 = self._distance(syn_1, subsumer, need_root)
+        len_2 = self._distance(syn_2, subsumer, need_root)
+        if len_1 is None or len_2 is None:
+            return None
+        return (2.0 * depth) / (len_1 + len_2 + 2 * depth)
+
+    def _needs_root(self, syn: int) -> bool:
+        return self.pos[syn] != "n" or self.nouns_need_root
+
+
+def build_compact_wordnet(out_path: str) -> CompactWordNet:
+    """
+    Build a `CompactWordNet` from nltk's wordnet corpus and pickle it to `out_path`
+
+    Reads nltk's private lemma index and exception maps (as of the nltk in
+    requirements.txt), so `test_compact_wordnet` in offline_tests.py checks
+    the result against nltk itself wherever its wordnet data is installed
+    """
+    from nltk.corpus import wordnet
+    wordnet.ensure_loaded()
+
+    synsets = list(wordnet.all_synsets())
+    ids = {syn.name(): i for i, syn in enumerate(synsets)}
+    names = [syn.name() for syn in synsets]
+    pos = "".join(syn.pos() for syn in synsets)
+    parents = [
+        tuple(ids[hyp.name()] for hyp in syn.hypernyms() + syn.instance_hypernyms())
+        for syn in synsets
+    ]
+
+    # Only the first synset of each (lemma, part of speech) is ever used
+    lemmas = {}
+    for lemma, offsets_by_pos in wordnet._lemma_pos_offset_map.items():
+        first = {
+            pos: ids[wordnet.synset_from_pos_and_offset(pos, offsets_by_pos[pos][0]).name()]
+            for pos in POS_LIST if offsets_by_pos.get(pos)
+        }
+        if first:
+            lemmas[lemma] = first
+    exceptions = {pos: dict(wordnet._exception_map[pos]) for pos in POS_LIST}
+
+    compact = CompactWordNet(names, pos, parents, lemmas, exceptions, wordnet.get_version() == "1.6")
+    with open(out_path, "wb") as out_file:
+        pickle.dump(
+            (FORMAT_VERSION, names, pos, parents, lemmas, exceptions, compact.nouns_need_root),
+            out_file,
+            pickle.HIGHEST_PROTOCOL,
+        )
+    return compact
+
+
+def load_compact_wordnet(path: str) -> CompactWordNet:
+    """
+    Load a `CompactWordNet` pickled by `build_compact_wordnet`
+    """
+    with open(path, "rb") as in_file:
+        version, *data = pickle.load(in_file)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compact wordnet format {version}")
+    return CompactWordNet(*data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m wikitas_tools.compactwordnet",
+        description="Build the compact wordnet used for fast-starting word matching from nltk's wordnet",
+    )
+    parser.add_argument("out_file", help="File to write the compact wordnet to")
+    args = parser.parse_args()
+
+    compact = build_compact_wordnet(args.out_file)
+    print(f"Built compact wordnet of {len(compact.names)} synsets and {len(compact.lemmas)} lemmas in {args.out_file}")
+
+
+if __name__ == "__main__":
+    main()
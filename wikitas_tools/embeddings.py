@@ -0,0 +1,186 @@
+"""
+Scoring titles by the cosine similarity of their word vectors to the
+destination's, as an alternative to the wordnet `SimilarityScorer`
+
+Word vectors are read from a text file with a word and its vector on each
+line (e.g. GloVe or fastText `.vec`), or from the memory-mapped `.npy` matrix
+and `.vocab` index written by `convert_vectors` (e.g. for large vector files)
+
+Needs numpy (`pip install numpy`)
+"""
+import os
+from functools import lru_cache
+from typing import Dict, List, Tuple
+from .word_utils import get_words
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Small hand-made vectors of common title words, for tests and examples only
+SAMPLE_VECTORS = os.path.join(os.path.dirname(__file__), "data", "sample_vectors.txt")
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("word vectors need numpy (pip install numpy)")
+
+
+def _read_text_vectors(path: str) -> Tuple[Dict[str, int], 'np.ndarray']:
+    """
+    Read the word vectors of a text file, one `word v_1 v_2 ... v_n` per line
+    """
+    vocab: Dict[str, int] = {}
+    rows = []
+    with open(path, encoding="utf-8") as vector_file:
+        for line in vector_file:
+            fields = line.rstrip().split(" ")
+            if len(fields) <= 2:  # fastText `.vec` header (word count & dimensions)
+                continue
+
+            word = fields[0].lower()
+            if word in vocab:
+                continue
+            vocab[word] = len(rows)
+            rows.append(fields[1:])
+
+    return vocab, np.array(rows, dtype=np.float32)
+
+
+def _normalize(vectors: 'np.ndarray') -> 'np.ndarray':
+    """
+    Scale each row of `vectors` to unit length (zero rows stay zero)
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+@lru_cache(maxsize=4)
+def load_vectors(path: str) -> Tuple[Dict[str, int], 'np.ndarray']:
+    """
+    Load the word vectors at `path`, once per path
+
+    Parameters:
+    ----------
+    `path`: str
+        A text vector file, or the `.npy` file written by `convert_vectors`
+        (memory-mapped, with its vocab read from the `.vocab` file next to it)
+
+    Returns:
+    -------
+    The lowercase word -> row index vocab and the matrix of unit word vectors
+    """
+    _require_numpy()
+    if path.endswith(".npy"):
+        vectors = np.load(path, mmap_mode="r")
+        with open(path[:-len(".npy")] + ".vocab", encoding="utf-8") as vocab_file:
+            vocab = {line.rstrip("\n"): i for i, line in enumerate(vocab_file)}
+        return vocab, vectors
+
+    vocab, vectors = _read_text_vectors(path)
+    return vocab, _normalize(vectors)
+
+
+def convert_vectors(text_path: str, out_prefix: str) -> None:
+    """
+    Convert the text vector file `text_path` to `out_prefix`.npy (unit float32
+    vectors, memory-mapped by `load_vectors`) and `out_prefix`.vocab
+    """
+    _require_numpy()
+    vocab, vectors = _read_text_vectors(text_path)
+    np.save(out_prefix + ".npy", _normalize(vectors))
+    with open(out_prefix + ".vocab", "w", encoding="utf-8") as vocab_file:
+        for word in vocab:  # Dicts keep insertion (row) order
+            vocab_file.write(word + "\n")
+
+
+class EmbeddingScorer:
+    """
+    Scores titles by the cosine similarity of their average word vector
+    to the average word vector of `dest_words` (negative similarities are 0)
+
+    Has the same methods as `SimilarityScorer`, so it can be passed as the
+    `scorer_factory` of the word matching `find_path_*` functions, e.g.
+        find_path_best_first(start, dest, scorer_factory=partial(EmbeddingScorer, vectors_path=path))
+
+    Parameters:
+    ----------
+    `dest_words`: List[str]
+        Words of the destination
+    `vectors_path`: str
+        Word vector file to load (see `load_vectors`). The bundled
+        `SAMPLE_VECTORS` only cover a few words, for tests
+
+    Methods:
+    -------
+    `score(words: List[str])`: float
+        Similarity of `words` to the destination words
+    `score_title(title: str)`: float
+        Similarity of the words of `title` to the destination words
+    `score_many(titles: List[str])`: List[float]
+        `score_title` of each title in `titles`, as one matrix-vector product
+    """
+
+    def __init__(self, dest_words: List[str], vectors_path: str):
+        self.dest_words = dest_words
+        self.vocab, self.vectors = load_vectors(vectors_path)
+
+        dest_ids = self._word_ids(dest_words)
+        dest_vector = self.vectors[dest_ids].sum(axis=0) if dest_ids else None
+        if dest_vector is not None and np.any(dest_vector):
+            self._dest_vector = dest_vector / np.linalg.norm(dest_vector)
+        else:  # No destination words have vectors
+            self._dest_vector = None
+
+    def _word_ids(self, words: List[str]) -> List[int]:
+        """
+        Vector row indexes of the words in `words` with vectors
+        """
+        ids = []
+        for word in words:
+            word_id = self.vocab.get(word.lower())
+            if word_id is not None:
+                ids.append(word_id)
+        return ids
+
+    def score(self, words: List[str]) -> float:
+        """
+        Similarity of `words` to the destination words
+        """
+        return self._score_word_lists([words])[0]
+
+    def score_title(self, title: str) -> float:
+        """
+        Similarity of the words of `title` to the destination words
+        """
+        return self.score(get_words(title))
+
+    def score_many(self, titles: List[str]) -> List[float]:
+        """
+        `score_title` of each title in `titles`
+        """
+        return self._score_word_lists([get_words(title) for title in titles])
+
+    def _score_word_lists(self, word_lists: List[List[str]]) -> List[float]:
+        if self._dest_vector is None or not word_lists:
+            return [0.0] * len(word_lists)
+
+        # Sum the vectors of each list's words, then compare every sum with
+        # the destination at once
+        ids = []
+        owners = []
+        for i, words in enumerate(word_lists):
+            word_ids = self._word_ids(words)
+            ids.extend(word_ids)
+            owners.extend([i] * len(word_ids))
+
+        sums = np.zeros((len(word_lists), self.vectors.shape[1]), dtype=np.float32)
+        if ids:
+            np.add.at(sums, owners, self.vectors[ids])
+
+        norms = np.linalg.norm(sums, axis=1)
+        norms[norms == 0] = 1  # Lists without vectors score 0
+        sims = (sums @ self._dest_vector) / norms
+        return np.clip(sims, 0, 1).tolist()
@@ -0,0 +1,428 @@
+"""
+Landmark (ALT) index of a link graph, for an A* search that finds shortest
+paths like `find_path_simple` while expanding a small fraction of the pages
+
+K landmark pages (the hubs with the most links & backlinks) are picked, and
+the no. of links from each landmark to every page and from every page to
+each landmark are stored as uint8 arrays over the page ids. By the triangle
+inequality, for any landmark L the no. of links from page u to dest t is at least
+    dist(L, t) - dist(L, u)    and    dist(u, L) - dist(t, L)
+a lower bound that never overestimates, so A* expanding pages by
+`depth + bound` still finds a shortest path, and pages that can't reach t
+at all (e.g. reachable from a landmark t isn't) are never expanded
+
+The index is stored in a directory:
+    `meta.json`                 Fingerprint of the graph, and the title, file
+                                and fingerprint of the graph of each landmark
+    `{file}.from.bin` (uint8)   Links from the landmark to each page
+    `{file}.to.bin` (uint8)     Links from each page to the landmark
+
+Build it with
+    python3 -m wikitas_tools.landmarks GRAPH_DIR [--out INDEX_DIR] [--landmarks K]
+(in GRAPH_DIR/landmarks by default) or `build_landmark_index`, and search
+with `find_path_landmarks(start, dest, source=LocalGraph(GRAPH_DIR))`
+
+Rebuilding after the graph changes keeps the same landmarks (those still in
+the graph) and recomputes only the landmarks built on another snapshot, or
+missing (e.g. after raising K or an interrupted build), saving each as soon
+as it is done
+"""
+import argparse
+import heapq
+import json
+import os
+import zlib
+from array import array
+from typing import Callable, Dict, Iterator, List, Optional
+from .localgraph import LocalGraph, _map_array, _write_array
+from .metrics import NullMetrics, null_metrics
+from .sources import LinkSource
+from .wikiapi import TitleNotFoundError
+
+FORMAT_VERSION = 1
+NUM_LANDMARKS = 16
+UNREACHABLE = 255  # Distance of a page not reachable from / not reaching a landmark
+SATURATED = 254  # Distances of 254 links or more are stored as 254 (at least 254)
+
+
+class TitleGraph(LinkSource):
+    """
+    The link graph of `titles` from `source`, with a page id per title like a
+    `LocalGraph`, so a `LandmarkIndex` can be built and searched over the
+    pages of any source, e.g. every page of a `MemorySource`, or every page
+    kept in a `CachedSource`
+
+    `titles` should hold every page of the graph: links to titles not in it
+    (or redirecting to one, see `get_redirects`) are dropped, which may make
+    distances longer than they are
+
+    Attributes:
+    ----------
+    `titles`: List[str]
+        Title of each page, indexed by page id
+    `num_pages`: int
+        No. of pages in the graph
+    `num_links`: int
+        No. of links in the graph
+
+    Methods:
+    -------
+    The same id methods as `LocalGraph` (`id_of`, `links_of`, `backlinks_of`, `fingerprint`)
+    """
+
+    supports_backlinks = True
+
+    def __init__(self, source: LinkSource, titles: List[str]):
+        self.source = source
+        self.titles = list(titles)
+        self.num_pages = len(self.titles)
+        self._ids: Dict[str, int] = {}
+        for node, title in enumerate(self.titles):
+            self._ids.update(dict.fromkeys(source.get_redirects(title), node))
+        self._ids.update({title: node for node, title in enumerate(self.titles)})
+
+        # Forward and reverse adjacency in CSR form, as in `LocalGraph`
+        self._fwd_offsets = array("q", [0])
+        self._fwd_targets = array("i")
+        in_degrees = array("q", [0]) * self.num_pages
+        links_by_title = source.get_links_batched(self.titles)
+        for title in self.titles:
+            targets = {self._ids[link] for link in links_by_title[title] if link in self._ids}
+            self._fwd_targets.extend(sorted(targets))
+            self._fwd_offsets.append(len(self._fwd_targets))
+            for target in targets:
+                in_degrees[target] += 1
+        self.num_links = len(self._fwd_targets)
+
+        self._rev_offsets = array("q", [0])
+        for in_degree in in_degrees:
+            self._rev_offsets.append(self._rev_offsets[-1] + in_degree)
+        cursors = array("q", self._rev_offsets[:-1])
+        self._rev_targets = array("i", [0]) * self.num_links
+        for node in range(self.num_pages):
+            for target in self.links_of(node):
+                self._rev_targets[cursors[target]] = node
+                cursors[target] += 1
+
+    def id_of(self, title: str) -> Optional[int]:
+        return self._ids.get(title)
+
+    def links_of(self, node: int) -> array:
+        return self._fwd_targets[self._fwd_offsets[node]:self._fwd_offsets[node + 1]]
+
+    def backlinks_of(self, node: int) -> array:
+        return self._rev_targets[self._rev_offsets[node]:self._rev_offsets[node + 1]]
+
+    def fingerprint(self) -> int:
+        checksum = zlib.crc32("\n".join(self.titles).encode("utf-8"))
+        checksum = zlib.crc32(self._fwd_offsets, checksum)
+        return zlib.crc32(self._fwd_targets, checksum)
+
+    def wikititle(self, title: str) -> str:
+        title = self.source.wikititle(title)
+        if title not in self._ids:
+            raise TitleNotFoundError(title, [])
+        return self.titles[self._ids[title]]
+
+    def iter_links(self, title: str) -> Iterator[str]:
+        node = self.id_of(title)
+        if node is None:
+            return iter([])
+        return (self.titles[link] for link in self.links_of(node))
+
+    def iter_backlinks(self, title: str) -> Iterator[str]:
+        node = self.id_of(title)
+        if node is None:
+            return iter([])
+        return (self.titles[backlink] for backlink in self.backlinks_of(node))
+
+    def get_redirects(self, title: str) -> List[str]:
+        return self.source.get_redirects(title)
+
+
+def _distances(num_pages: int, root: int, neighbours: Callable[[int], List[int]]) -> array:
+    """
+    No. of links from `root` to each page through `neighbours` (a breadth
+    first search), `UNREACHABLE` if none, and at most `SATURATED`
+    """
+    distances = array("B", [UNREACHABLE]) * num_pages
+    distances[root] = 0
+    frontier = [root]
+    depth = 0
+    while frontier:
+        depth += 1
+        stored = min(depth, SATURATED)
+        next_frontier = []
+        for node in frontier:
+            for neighbour in neighbours(node):
+                if distances[neighbour] == UNREACHABLE:
+                    distances[neighbour] = stored
+                    next_frontier.append(neighbour)
+        frontier = next_frontier
+    return distances
+
+
+def pick_landmarks(graph: LocalGraph, num_landmarks: int = NUM_LANDMARKS) -> List[int]:
+    """
+    Page ids of the `num_landmarks` hubs of `graph` (a `LocalGraph` or
+    `TitleGraph`) with the most links & backlinks
+    """
+    def degree(node: int) -> int:
+        return len(graph.links_of(node)) + len(graph.backlinks_of(node))
+
+    return heapq.nlargest(num_landmarks, range(graph.num_pages), key=degree)
+
+
+def _write_meta(directory: str, meta: dict) -> None:
+    """
+    Replace `meta.json` of the index at once, so an interrupted build leaves a valid index
+    """
+    path = os.path.join(directory, "meta.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(path + ".tmp", path)
+
+
+def build_landmark_index(
+    graph: LocalGraph,
+    out_dir: Optional[str] = None,
+    num_landmarks: Optional[int] = NUM_LANDMARKS
+) -> 'LandmarkIndex':
+    """
+    Build (or bring up to date) the landmark index of `graph` (a `LocalGraph`
+    or `TitleGraph`) in `out_dir` (the `landmarks` directory of a `LocalGraph`
+    by default), with `num_landmarks` landmarks
+
+    Computing a landmark takes 2 breadth first searches over the whole graph.
+    Any change to the graph (a different `fingerprint`) recomputes every
+    landmark, as a changed link can change the distances of any page: only
+    the choice of landmarks still in `graph` is kept. Landmarks already
+    computed on the same snapshot are kept, so rebuilding an unchanged graph
+    (e.g. with more landmarks, or after an interrupted build) only computes
+    the missing ones
+    """
+    if out_dir is None:
+        out_dir = default_index_dir(graph)
+    os.makedirs(out_dir, exist_ok=True)
+    fingerprint = graph.fingerprint()
+
+    meta = {"format_version": FORMAT_VERSION, "landmarks": []}
+    if os.path.exists(os.path.join(out_dir, "meta.json")):
+        with open(os.path.join(out_dir, "meta.json"), encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        if meta["format_version"] != FORMAT_VERSION:
+            meta = {"format_version": FORMAT_VERSION, "landmarks": []}
+
+    # Keep the landmarks still in the graph, then add the biggest hubs
+    nodes = []
+    for landmark in meta["landmarks"]:
+        node = graph.id_of(landmark["title"])
+        if node is not None and node not in nodes:
+            nodes.append(node)
+    for node in pick_landmarks(graph, num_landmarks):
+        if len(nodes) >= num_landmarks:
+            break
+        if node not in nodes:
+            nodes.append(node)
+    nodes = nodes[:num_landmarks]
+
+    previous = meta["landmarks"]
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "num_pages": graph.num_pages,
+        "fingerprint": fingerprint,
+        "landmarks": [],
+    }
+    for node in nodes:
+        title = graph.titles[node]
+        landmark = next((landmark for landmark in previous if landmark["title"] == title), None)
+        if landmark is None or landmark["fingerprint"] != fingerprint:
+            print(f"Computing distances from and to landmark {title}")
+            landmark = {"title": title, "fingerprint": fingerprint, "file": str(zlib.crc32(title.encode("utf-8")))}
+            path = os.path.join(out_dir, landmark["file"])
+            _write_array(path + ".from.bin", _distances(graph.num_pages, node, graph.links_of))
+            _write_array(path + ".to.bin", _distances(graph.num_pages, node, graph.backlinks_of))
+
+        # Saved as each is done, keeping the (outdated) landmarks not yet
+        # rebuilt, so an interrupted build picks up where it stopped
+        meta["landmarks"].append(landmark)
+        done = {landmark["title"] for landmark in meta["landmarks"]}
+        _write_meta(out_dir, {
+            **meta,
+            "landmarks": [*meta["landmarks"], *(landmark for landmark in previous if landmark["title"] not in done)],
+        })
+
+    _write_meta(out_dir, meta)
+    return LandmarkIndex(out_dir, graph)
+
+
+def default_index_dir(graph: LinkSource) -> str:
+    """
+    The `landmarks` directory of a `LocalGraph`
+    """
+    if not isinstance(graph, LocalGraph):
+        raise ValueError("Pass the directory of the landmark index of graphs other than a LocalGraph")
+    return os.path.join(graph.directory, "landmarks")
+
+
+class LandmarkIndex:
+    """
+    Landmark index built with `build_landmark_index` in `directory`, of
+    `graph` (checked to be the snapshot the index was built on, if passed)
+
+    Attributes:
+    ----------
+    `landmarks`: List[str]
+        Titles of the landmarks
+    `graph`: Optional[LocalGraph]
+        The graph the index is of, if passed
+
+    Methods:
+    -------
+    `bounds_to(dest: int)`: Callable[[int], float]
+        Returns a function giving a lower bound of the no. of links from a
+        page id to page id `dest` (inf if there is no path)
+
+    Raises:
+    ------
+        `ValueError` - if the index was built on another snapshot of `graph`
+    """
+
+    def __init__(self, directory: str, graph: Optional[LocalGraph] = None):
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        if meta["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported landmark index format {meta['format_version']}")
+        if graph is not None and graph.fingerprint() != meta["fingerprint"]:
+            raise ValueError(f"Landmark index in {directory} is of another snapshot of the graph, rebuild it")
+
+        self.directory = directory
+        self.graph = graph
+        self.num_pages: int = meta["num_pages"]
+        # Only landmarks built on the same snapshot (e.g. not left over from an interrupted rebuild)
+        landmarks = [landmark for landmark in meta["landmarks"] if landmark["fingerprint"] == meta["fingerprint"]]
+        self.landmarks: List[str] = [landmark["title"] for landmark in landmarks]
+        self._from = [_map_array(os.path.join(directory, landmark["file"] + ".from.bin"), "B") for landmark in landmarks]
+        self._to = [_map_array(os.path.join(directory, landmark["file"] + ".to.bin"), "B") for landmark in landmarks]
+
+    def bounds_to(self, dest: int) -> Callable[[int], float]:
+        """
+        Returns a function giving a lower bound of the no. of links from a
+        page id to page id `dest`, the best of every landmark's (or inf if
+        the page can't reach `dest`)
+        """
+        terms = [(from_l, from_l[dest], to_l, to_l[dest]) for from_l, to_l in zip(self._from, self._to)]
+        inf = float("inf")
+
+        def bound(node: int) -> float:
+            best = 0
+            for from_l, from_dest, to_l, to_dest in terms:
+                # dist(node, dest) >= dist(L, dest) - dist(L, node), if dist(L, node) is exact
+                from_node = from_l[node]
+                if from_dest == UNREACHABLE:
+                    if from_node != UNREACHABLE:  # L reaches node but not dest
+                        return inf
+                elif from_node < SATURATED and from_dest - from_node > best:
+                    best = from_dest - from_node
+
+                # dist(node, dest) >= dist(node, L) - dist(dest, L), if dist(dest, L) is exact
+                to_node = to_l[node]
+                if to_node == UNREACHABLE:
+                    if to_dest != UNREACHABLE:  # dest reaches L but node doesn't
+                        return inf
+                elif to_dest < SATURATED and to_node - to_dest > best:
+                    best = to_node - to_dest
+            return best
+
+        return bound
+
+
+def find_path_landmarks(
+    start: str,
+    dest: str,
+    source: Optional[LocalGraph] = None,
+    index: Optional[LandmarkIndex] = None,
+    metrics: Optional[NullMetrics] = None
+) -> List[str]:
+    """
+    Finds the shortest path from page `start` to `dest` of `source` (a
+    `LocalGraph` or `TitleGraph`, by default the graph of `index`) by an A*
+    search, expanding pages by lowest `depth + lower bound of the links left`
+    from the landmarks of `index` (by default the index in the `landmarks`
+    directory of the `LocalGraph`)
+    """
+    if source is None:
+        if index is None or index.graph is None:
+            raise ValueError("find_path_landmarks needs a LocalGraph or TitleGraph source, or an index of one")
+        source = index.graph
+    if index is None:
+        index = LandmarkIndex(default_index_dir(source), source)
+    if metrics is None:
+        metrics = null_metrics
+    with metrics.timer("title"):
+        start = source.wikititle(start)
+        dest = source.wikititle(dest)
+    if start == dest:
+        return []
+
+    print(f"Finding path from {start} to {dest}")
+    start_id = source.id_of(start)
+    dest_id = source.id_of(dest)
+    bound = index.bounds_to(dest_id)
+    bounds = {start_id: bound(start_id)}
+    depths = {start_id: 0}
+    parents = {start_id: None}
+
+    # Heap of (depth + bound, bound, depth, page id), where the lower bound
+    # breaks ties (so the pages closest to dest are expanded first)
+    frontier = [(bounds[start_id], bounds[start_id], 0, start_id)]
+    while frontier:
+        _priority, _bound, depth, node = heapq.heappop(frontier)
+        if depth > depths[node]:  # Queued again since, by a shorter path
+            continue
+        if node == dest_id:
+            path = []
+            while node is not None:
+                path.append(source.titles[node])
+                node = parents[node]
+            path.reverse()  # Convert to start first (correct order)
+            metrics.finish()
+            return path
+
+        metrics.page(source.titles[node])
+        if metrics.enabled:
+            metrics.observe("depth", depth)
+            metrics.observe("frontier_size", len(frontier))
+
+        with metrics.timer("frontier"):
+            for link in source.links_of(node):
+                if depth + 1 >= depths.get(link, depth + 2):
+                    continue
+                if link not in bounds:
+                    bounds[link] = bound(link)
+                if bounds[link] == float("inf"):  # Can't reach dest
+                    continue
+                depths[link] = depth + 1
+                parents[link] = node
+                heapq.heappush(frontier, (depth + 1 + bounds[link], bounds[link], depth + 1, link))
+
+    metrics.finish()
+    return []
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m wikitas_tools.landmarks",
+        description="Build (or bring up to date) the landmark index of an offline wikipedia link graph",
+    )
+    parser.add_argument("graph_dir", help="Directory of the graph (see localgraph.py)")
+    parser.add_argument("--out", help="Directory to write the index to (GRAPH_DIR/landmarks by default)")
+    parser.add_argument("--landmarks", type=int, default=NUM_LANDMARKS, help="No. of landmarks")
+    args = parser.parse_args()
+
+    index = build_landmark_index(LocalGraph(args.graph_dir), args.out, args.landmarks)
+    print(f"Built landmark index of {len(index.landmarks)} landmarks in {index.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+"""
+Offline wikipedia link graph built from the `page`, `pagelinks` and `redirect`
+(and optionally `linktarget`) SQL dumps at https://dumps.wikimedia.org/enwiki/
+
+The graph is stored in a directory as a compact CSR (compressed sparse row)
+adjacency index, with forward (links) and reverse (backlinks) adjacency:
+    `titles.txt`                    Title of each page, one per line (line no. = page id)
+    `redirects.tsv`                 Redirect title -> page id of its target
+    `fwd_offsets.bin` (int64)       Links of page i are fwd_targets[fwd_offsets[i]:fwd_offsets[i + 1]]
+    `fwd_targets.bin` (int32)
+    `rev_offsets.bin` (int64)       Backlinks of page i, in the same form
+    `rev_targets.bin` (int32)
+    `meta.json`                     No. of pages and links, byte order
+
+Build the graph with
+    python3 -m wikitas_tools.localgraph OUT_DIR --page page.sql.gz --pagelinks pagelinks.sql.gz --redirect redirect.sql.gz
+and load it with `LocalGraph(OUT_DIR)`, a `LinkSource` for the pathfinding functions
+"""
+import argparse
+import gzip
+import json
+import mmap
+import os
+import re
+import sys
+import zlib
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+from .sources import LinkSource
+from .wikiapi import TitleNotFoundError
+
+# Leading columns of each row of the tables in the SQL dumps
+_SQL_STRING = r"'((?:[^'\\]|\\.)*)'"
+# page: (page_id, page_namespace, page_title, page_is_redirect, ...)
+_PAGE_ROW = re.compile(r"\((\d+),(-?\d+)," + _SQL_STRING + r",([01]),")
+# pagelinks (before 2024): (pl_from, pl_namespace, pl_title, pl_from_namespace)
+_PAGELINKS_ROW = re.compile(r"\((\d+),(-?\d+)," + _SQL_STRING + r",(-?\d+)\)")
+# pagelinks (with linktarget): (pl_from, pl_from_namespace, pl_target_id)
+_PAGELINKS_TARGET_ROW = re.compile(r"\((\d+),(-?\d+),(\d+)\)")
+# linktarget: (lt_id, lt_namespace, lt_title)
+_LINKTARGET_ROW = re.compile(r"\((\d+),(-?\d+)," + _SQL_STRING + r"\)")
+# redirect: (rd_from, rd_namespace, rd_title, ...)
+_REDIRECT_ROW = re.compile(r"\((\d+),(-?\d+)," + _SQL_STRING)
+
+_SQL_ESCAPE = re.compile(r"\\(.)")
+_SQL_ESCAPES = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+
+FORMAT_VERSION = 1
+REVERSE_CHUNK = 1 << 24  # Links turned into backlinks at a time when building a graph
+
+
+def _open_dump(path: str):
+    """
+    Open a (possibly gzipped) SQL dump as text
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "rt", encoding="utf-8", errors="replace")
+
+
+def _iter_rows(path: str, table: str, row: re.Pattern) -> Iterator[Tuple[str, ...]]:
+    """
+    Iterate over the leading columns matched by `row` of every row
+    inserted into `table` in the SQL dump at `path`
+    """
+    insert = f"INSERT INTO `{table}` VALUES "
+    with _open_dump(path) as dump:
+        for line in dump:
+            if line.startswith(insert):
+                for match in row.finditer(line, len(insert)):
+                    yield match.groups()
+
+
+def _title(sql_title: str) -> str:
+    """
+    Convert a title from an SQL dump to a wikipedia api title
+    e.g. 'Among_Us' -> 'Among Us', 'Rock_\\'n\\'_roll' -> "Rock 'n' roll"
+    """
+    if "\\" in sql_title:
+        sql_title = _SQL_ESCAPE.sub(
+            lambda match: _SQL_ESCAPES.get(match.group(1), match.group(1)), sql_title
+        )
+    return sql_title.replace("_", " ")
+
+
+def _write_array(path: str, values: array) -> None:
+    with open(path, "wb") as file:
+        values.tofile(file)
+
+
+def build_local_graph(
+    out_dir: str,
+    page_dump: str,
+    pagelinks_dump: str,
+    redirect_dump: Optional[str] = None,
+    linktarget_dump: Optional[str] = None
+) -> None:
+    """
+    Build the CSR link graph of the articles (namespace 0) in the SQL dumps
+    and write it to `out_dir`
+    Links to redirects are resolved to the redirect target
+    The backlinks are filled into their memory-mapped file rather than held
+    in memory, many times faster with numpy installed (`pip install numpy`)
+
+    Parameters:
+    ----------
+    `out_dir`: str
+        Directory to write the graph to (created if missing)
+    `page_dump`: str
+        Path of the (gzipped) `page` table dump
+    `pagelinks_dump`: str
+        Path of the (gzipped) `pagelinks` table dump. Must be sorted
+        by `pl_from`, as the dumps from wikimedia are
+    `redirect_dump`: Optional[str]
+        Path of the (gzipped) `redirect` table dump. Links to redirects
+        are dropped without it
+    `linktarget_dump`: Optional[str]
+        Path of the (gzipped) `linktarget` table dump, needed for
+        `pagelinks` dumps from 2024 onwards, which link to a target id
+        instead of a namespace and title
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Pages are numbered in page_id order, which is the order of the pagelinks
+    # dump, so the forward adjacency can be written while it streams past
+    ids_by_title: Dict[str, int] = {}
+    ids_by_page_id: Dict[int, int] = {}
+    redirect_page_ids: Dict[int, str] = {}  # page_id -> redirect title
+    with open(os.path.join(out_dir, "titles.txt"), "w", encoding="utf-8") as titles_file:
+        for page_id, namespace, title, is_redirect in _iter_rows(page_dump, "page", _PAGE_ROW):
+            if namespace != "0":
+                continue
+
+            title = _title(title)
+            if is_redirect == "1":
+                redirect_page_ids[int(page_id)] = title
+                continue
+
+            node = len(ids_by_title)
+            ids_by_title[title] = node
+            ids_by_page_id[int(page_id)] = node
+            titles_file.write(title + "\n")
+
+    num_pages = len(ids_by_title)
+
+    redirects: Dict[str, int] = {}  # redirect title -> id of target page
+    if redirect_dump is not None:
+        for page_id, namespace, title in _iter_rows(redirect_dump, "redirect", _REDIRECT_ROW):
+            redirect_title = redirect_page_ids.get(int(page_id))
+            target = ids_by_title.get(_title(title))
+            if namespace == "0" and redirect_title is not None and target is not None:
+                redirects[redirect_title] = target
+    del redirect_page_ids
+
+    with open(os.path.join(out_dir, "redirects.tsv"), "w", encoding="utf-8") as redirects_file:
+        for redirect_title, target in redirects.items():
+            redirects_file.write(f"{redirect_title}\t{target}\n")
+
+    def target_id(title: str) -> Optional[int]:
+        title = _title(title)
+        node = ids_by_title.get(title)
+        return node if node is not None else redirects.get(title)
+
+    if linktarget_dump is not None:
+        targets_by_lt_id: Dict[int, int] = {}
+        for lt_id, namespace, title in _iter_rows(linktarget_dump, "linktarget", _LINKTARGET_ROW):
+            if namespace == "0":
+                node = target_id(title)
+                if node is not None:
+                    targets_by_lt_id[int(lt_id)] = node
+
+        links = (
+            (int(pl_from), targets_by_lt_id.get(int(lt_id)))
+            for pl_from, _from_ns, lt_id in _iter_rows(
+                pagelinks_dump, "pagelinks", _PAGELINKS_TARGET_ROW
+            )
+        )
+    else:
+        links = (
+            (int(pl_from), target_id(title) if namespace == "0" else None)
+            for pl_from, namespace, title, _from_ns in _iter_rows(
+                pagelinks_dump, "pagelinks", _PAGELINKS_ROW
+            )
+        )
+
+    # Forward adjacency, streamed in order of source page
+    fwd_offsets = array("q", [0]) * (num_pages + 1)
+    in_degrees = array("q", [0]) * num_pages
+    num_links = 0
+    current_source = -1
+    current_targets = set()
+    with open(os.path.join(out_dir, "fwd_targets.bin"), "wb") as targets_file:
+        def flush() -> None:
+            nonlocal num_links
+            if current_source < 0:
+                return
+
+            targets = array("i", sorted(current_targets))
+            targets.tofile(targets_file)
+            for target in targets:
+                in_degrees[target] += 1
+            num_links += len(targets)
+            fwd_offsets[current_source + 1] = len(targets)
+
+        for pl_from, target in links:
+            source = ids_by_page_id.get(pl_from)
+            if source is None or target is None:
+                continue
+
+            if source != current_source:
+                if source < current_source:
+                    raise ValueError("pagelinks dump must be sorted by pl_from")
+                flush()
+                current_source = source
+                current_targets = set()
+            current_targets.add(target)
+        flush()
+
+    for i in range(num_pages):  # Degrees -> offsets
+        fwd_offsets[i + 1] += fwd_offsets[i]
+    _write_array(os.path.join(out_dir, "fwd_offsets.bin"), fwd_offsets)
+    # Free the title indexes (still referenced by `target_id`) before the reverse pass
+    ids_by_title.clear()
+    ids_by_page_id.clear()
+    redirects.clear()
+
+    # Reverse adjacency, filled in from the forward adjacency
+    rev_offsets = array("q", [0]) * (num_pages + 1)
+    for i in range(num_pages):
+        rev_offsets[i + 1] = rev_offsets[i] + in_degrees[i]
+    _write_array(os.path.join(out_dir, "rev_offsets.bin"), rev_offsets)
+    del in_degrees[:]  # Still referenced by `flush`
+    _write_backlinks(out_dir, fwd_offsets, rev_offsets, num_links)
+
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as meta_file:
+        json.dump({
+            "format_version": FORMAT_VERSION,
+            "num_pages": num_pages,
+            "num_links": num_links,
+            "byteorder": sys.byteorder,
+        }, meta_file)
+
+
+def _write_backlinks(out_dir: str, fwd_offsets: array, rev_offsets: array, num_links: int) -> None:
+    """
+    Helper for `build_local_graph`
+    Write `rev_targets.bin` from `fwd_targets.bin`, filling in each page's
+    backlinks (in order of source page) straight into the memory-mapped
+    file, the links of `REVERSE_CHUNK` at a time with numpy if installed,
+    else one at a time
+    """
+    fwd_path = os.path.join(out_dir, "fwd_targets.bin")
+    rev_path = os.path.join(out_dir, "rev_targets.bin")
+    with open(rev_path, "wb") as rev_file:
+        rev_file.truncate(num_links * 4)
+    if not num_links:  # Empty files can't be mapped
+        return
+
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    if np is not None:
+        fwd = np.memmap(fwd_path, dtype=np.int32, mode="r")
+        rev = np.memmap(rev_path, dtype=np.int32, mode="r+")
+        offsets = np.frombuffer(fwd_offsets, dtype=np.int64)
+        num_pages = len(offsets) - 1
+        cursors = np.frombuffer(rev_offsets, dtype=np.int64)[:-1].copy()  # Next free slot of each page
+
+        source = 0
+        while source < num_pages:
+            # Sources `source` up to `end` (at least one page)
+            end = int(np.searchsorted(offsets, offsets[source] + REVERSE_CHUNK, side="right")) - 1
+            end = min(max(end, source + 1), num_pages)
+            targets = fwd[offsets[source]:offsets[end]]
+            sources = np.repeat(np.arange(source, end, dtype=np.int32), np.diff(offsets[source:end + 1]))
+
+            # Group the links by target, keeping source order, and write
+            # each group from its target's cursor
+            order = np.argsort(targets, kind="stable")
+            targets = targets[order]
+            counts = np.bincount(targets, minlength=num_pages)
+            group_starts = np.cumsum(counts) - counts
+            rev[cursors[targets] + np.arange(len(targets)) - group_starts[targets]] = sources[order]
+            cursors += counts
+            source = end
+        rev.flush()
+        return
+
+    fwd_targets = _map_array(fwd_path, "i")
+    with open(rev_path, "r+b") as rev_file:
+        rev_map = mmap.mmap(rev_file.fileno(), 0)
+    rev_targets = memoryview(rev_map).cast("i")
+    cursors = array("q", rev_offsets[:-1])  # Next free slot of each page
+    for source in range(len(fwd_offsets) - 1):
+        for i in range(fwd_offsets[source], fwd_offsets[source + 1]):
+            target = fwd_targets[i]
+            rev_targets[cursors[target]] = source
+            cursors[target] += 1
+    fwd_targets.release()
+    rev_targets.release()
+    rev_map.close()
+
+
+def _map_array(path: str, typecode: str) -> memoryview:
+    """
+    Memory-map the array in the file at `path` as a read-only memoryview
+    of `typecode` items
+    """
+    if os.path.getsize(path) == 0:  # Empty files can't be mapped
+        return memoryview(array(typecode))
+
+    with open(path, "rb") as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast(typecode)
+
+
+class LocalGraph(LinkSource):
+    """
+    Wikipedia link graph built with `build_local_graph`, memory-mapped from `directory`
+    As a `LinkSource`, searches through it need no http reqs
+
+    Attributes:
+    ----------
+    `titles`: List[str]
+        Title of each page, indexed by page id
+    `num_pages`: int
+        No. of pages in the graph
+    `num_links`: int
+        No. of links in the graph
+
+    Methods:
+    -------
+    `id_of(title: str)`: Optional[int]
+        Returns the page id of `title` (following redirects) or None
+    `links_of(node: int)`: memoryview
+        Returns the page ids linked to by page id `node`
+    `backlinks_of(node: int)`: memoryview
+        Returns the page ids linking to page id `node`
+    `fingerprint()`: int
+        Returns a checksum telling snapshots of the graph apart
+    """
+
+    supports_backlinks = True
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        if meta["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported local graph format {meta['format_version']}")
+        if meta["byteorder"] != sys.byteorder:
+            raise ValueError(f"Local graph was built on a {meta['byteorder']} endian machine")
+
+        self.directory = directory
+        self.num_pages: int = meta["num_pages"]
+        self.num_links: int = meta["num_links"]
+        self._fingerprint: Optional[int] = None
+
+        with open(os.path.join(directory, "titles.txt"), encoding="utf-8") as titles_file:
+            self.titles: List[str] = titles_file.read().splitlines()
+        self._ids: Dict[str, int] = {title: i for i, title in enumerate(self.titles)}
+
+        with open(os.path.join(directory, "redirects.tsv"), encoding="utf-8") as redirects_file:
+            for line in redirects_file:
+                redirect_title, target = line.rstrip("\n").split("\t")
+                self._ids.setdefault(redirect_title, int(target))
+        # Lowercased title -> page id, for `wikititle` (titles come before redirects in `_ids`)
+        self._lower_ids: Dict[str, int] = {}
+        for title, node in self._ids.items():
+            self._lower_ids.setdefault(title.lower(), node)
+
+        self._fwd_offsets = _map_array(os.path.join(directory, "fwd_offsets.bin"), "q")
+        self._fwd_targets = _map_array(os.path.join(directory, "fwd_targets.bin"), "i")
+        self._rev_offsets = _map_array(os.path.join(directory, "rev_offsets.bin"), "q")
+        self._rev_targets = _map_array(os.path.join(directory, "rev_targets.bin"), "i")
+
+    def id_of(self, title: str) -> Optional[int]:
+        """
+        Returns the page id of `title` (following redirects), or None if not in the graph
+        """
+        return self._ids.get(title)
+
+    def links_of(self, node: int) -> memoryview:
+        """
+        Returns the page ids linked to by page id `node`
+        """
+        return self._fwd_targets[self._fwd_offsets[node]:self._fwd_offsets[node + 1]]
+
+    def backlinks_of(self, node: int) -> memoryview:
+        """
+        Returns the page ids linking to page id `node`
+        """
+        return self._rev_targets[self._rev_offsets[node]:self._rev_offsets[node + 1]]
+
+    def fingerprint(self) -> int:
+        """
+        Returns a checksum of the titles and links of every page, telling
+        snapshots of the graph apart (e.g. so a `LandmarkIndex` built on an
+        older one isn't used). Reads the whole link index the first time
+        """
+        if self._fingerprint is None:
+            checksum = zlib.crc32("\n".join(self.titles).encode("utf-8"))
+            checksum = zlib.crc32(self._fwd_offsets, checksum)
+            self._fingerprint = zlib.crc32(self._fwd_targets, checksum)  # Backlinks follow from the links
+        return self._fingerprint
+
+    # ------------------------------------------------------
+    # `LinkSource` functions, by title
+
+    def wikititle(self, title: str) -> str:
+        """
+        Convert `title` to the title of a page in the graph, trying `title`
+        as is, with underscores as spaces, with its first letter capitalised
+        and then ignoring case
+        e.g. wikititle('among_us') -> 'Among Us'
+
+        Raises:
+        ------
+            `TitleNotFoundError` - if there is no page matching `title`
+        """
+        spaced = title.strip().replace("_", " ")
+        for candidate in (title, spaced, spaced[:1].upper() + spaced[1:]):
+            node = self.id_of(candidate)
+            if node is not None:
+                return self.titles[node]
+
+        node = self._lower_ids.get(spaced.lower())
+        if node is not None:
+            return self.titles[node]
+        raise TitleNotFoundError(title, [])
+
+    def get_links(self, title: str) -> List[str]:
+        """
+        Get all links from page `title`
+        Returns empty list for titles not in the graph
+        """
+        node = self.id_of(title)
+        if node is None:
+            return []
+        return [self.titles[link] for link in self.links_of(node)]
+
+    def iter_links(self, title: str) -> Iterator[str]:
+        """
+        Iterate over all links from page `title`
+        """
+        return iter(self.get_links(title))
+
+    def get_backlinks(self, title: str) -> List[str]:
+        """
+        Get all pages linking to page `title`
+        Returns empty list for titles not in the graph
+        """
+        node = self.id_of(title)
+        if node is None:
+            return []
+        return [self.titles[backlink] for backlink in self.backlinks_of(node)]
+
+    def iter_backlinks(self, title: str) -> Iterator[str]:
+        """
+        Iterate over all pages linking to page `title`
+        """
+        return iter(self.get_backlinks(title))
+
+    def get_categories(self, title: str) -> List[str]:
+        """
+        Categories aren't in the dumps the graph is built from
+        """
+        return []
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m wikitas_tools.localgraph",
+        description="Build an offline wikipedia link graph from the wikipedia SQL dumps",
+    )
+    parser.add_argument("out_dir", help="Directory to write the graph to")
+    parser.add_argument("--page", required=True, help="page table dump (.sql or .sql.gz)")
+    parser.add_argument("--pagelinks", required=True, help="pagelinks table dump")
+    parser.add_argument("--redirect", help="redirect table dump")
+    parser.add_argument("--linktarget", help="linktarget table dump (for pagelinks dumps from 2024 onwards)")
+    args = parser.parse_args()
+
+    build_local_graph(args.out_dir, args.page, args.pagelinks, args.redirect, args.linktarget)
+    graph = LocalGraph(args.out_dir)
+    print(f"Built graph of {graph.num_pages} pages and {graph.num_links} links in {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
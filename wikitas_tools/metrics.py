@@ -0,0 +1,207 @@
+"""
+Hooks to measure where a search spends its time, passed to the `find_path_*`
+functions (and set on `WikiApi`) as `metrics`
+
+Phases timed:
+    "title"    - resolving the start and dest titles
+    "http"     - waiting on http reqs (including retries)
+    "backoff"  - waiting to retry failed http reqs (part of "http")
+    "decode"   - decoding json responses
+    "scoring"  - scoring links by relatedness (word matching functions)
+    "frontier" - visited checks and queueing the links of each response
+    "cache"    - looking up cached paths and hub trees (`PathCache`)
+Counts:
+    "requests", "bytes", "cache_hits", "cache_misses", "pages" (expanded),
+    "retries", "throttled" (http reqs the api asked to slow down),
+    "path_cache_hits", "path_cache_misses" (queries answered / not by a `PathCache`)
+    "queries", "rejected", "timed_out", "errors", "shared_fetches" (pages
+    fetched once for concurrent queries of a `SearchService`)
+    "prefetched", "prefetch_hits", "prefetch_dropped" (pages fetched ahead / then
+    asked for / never asked for, `Prefetcher`)
+Maxima:
+    "depth" reached, "frontier_size"
+Gauges (latest value):
+    "concurrency_limit" of http reqs in flight, average http "latency"
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+from .wikilog import log_progress
+
+
+class _NullTimer:
+    """
+    Context manager that does nothing, shared by every `NullMetrics.timer`
+    """
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class NullMetrics:
+    """
+    Metrics hook recording nothing, the default of every search
+
+    Methods:
+    -------
+    `timer(phase: str)`
+        Context manager adding the time spent inside it to `phase`
+    `count(name: str, n: int)`
+        Add `n` to the count `name`
+    `observe(name: str, value: float)`
+        Record `value` of `name`, keeping the maximum
+    `gauge(name: str, value: float)`
+        Record `value` of `name`, keeping the latest
+    `page(title: str)`
+        Page `title` is being expanded
+    `finish()`
+        The search is over
+
+    `enabled` is False, so callers can skip working out values only
+    needed by metrics (e.g. the depth of each page)
+    """
+
+    enabled = False
+
+    def timer(self, phase: str) -> _NullTimer:
+        return _NULL_TIMER
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+    def observe(self, name: str, value: float) -> None:
+        pass
+
+    def gauge(self, name: str, value: float) -> None:
+        pass
+
+    def page(self, title: str) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+
+null_metrics = NullMetrics()
+
+
+class _Timer:
+    """
+    Context manager adding the time spent inside it to `phase` of `metrics`
+    """
+
+    __slots__ = ("metrics", "phase", "start")
+
+    def __init__(self, metrics: 'SearchMetrics', phase: str):
+        self.metrics = metrics
+        self.phase = phase
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.metrics.add_time(self.phase, time.perf_counter() - self.start)
+
+
+class SearchMetrics(NullMetrics):
+    """
+    Metrics hook keeping the total time of each phase, counts and maxima
+    Safe to share between threads (e.g. the http reqs of `iter_links_batched`)
+
+    Attributes:
+    ----------
+    `timings`: Dict[str, float]
+        Total seconds spent in each phase
+    `counts`: Dict[str, int]
+        Total of each count
+    `maxima`: Dict[str, float]
+        Maximum of each observed value
+    `gauges`: Dict[str, float]
+        Latest value of each gauge
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.maxima: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def timer(self, phase: str) -> _Timer:
+        return _Timer(self, phase)
+
+    def add_time(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            if value > self.maxima.get(name, value - 1):
+                self.maxima[name] = value
+
+    def gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self.gauges[name] = value
+
+    def page(self, title: str) -> None:
+        self.count("pages")
+
+    def report(self) -> Dict[str, Any]:
+        """
+        The timings, counts, maxima and gauges so far, e.g. to dump as JSON
+        """
+        with self._lock:
+            return {
+                "timings": dict(self.timings),
+                "counts": dict(self.counts),
+                "maxima": dict(self.maxima),
+                "gauges": dict(self.gauges),
+            }
+
+
+class ProgressMetrics(SearchMetrics):
+    """
+    `SearchMetrics` that also shows the current page, pages expanded, depth
+    and frontier size, redrawn at most every `interval` seconds so that
+    thousands of pages a second don't each cost a write to stdout
+    """
+
+    def __init__(self, interval: Optional[float] = 0.1):
+        super().__init__()
+        self.interval = interval
+        self._next_render = 0.0
+        self._title: Optional[str] = None
+
+    def _render(self) -> None:
+        log_progress(
+            self._title,
+            self.counts.get("pages", 0),
+            self.maxima.get("depth"),
+            self.maxima.get("frontier_size"),
+        )
+
+    def page(self, title: str) -> None:
+        super().page(title)
+        self._title = title
+        now = time.monotonic()
+        if now >= self._next_render:
+            self._next_render = now + self.interval
+            self._render()
+
+    def finish(self) -> None:
+        if self._title is not None:  # Show the final progress and end the line
+            self._render()
+            print()
+            self._title = None
@@ -0,0 +1,277 @@
+"""
+Cache of the paths found between (start, dest) pairs, and of breadth first
+search trees rooted at (or leading to) popular hub pages, so repeated queries
+and queries from / to a hub are answered with no search at all
+
+Paths and trees are kept in the same cache as the links they were found
+through (the `LinkCache` of the api or of a `CachedSource`), so they expire,
+are evicted and are invalidated along with them, and every path is checked
+against the cached links of its pages before being returned
+"""
+from typing import Dict, Iterable, List, Optional
+from .cache import LinkCache, MemoryCache
+from .metrics import NullMetrics, null_metrics
+from .pathfinding import find_path_simple_parallel
+from .sources import CachedSource, LinkSource, WikiApiSource, default_source
+
+HUB_DEPTH = 2  # Levels of links searched from / to each hub
+MAX_HUB_NODES = 100_000  # Max no. of pages in the tree of each hub
+
+
+class PathCache:
+    """
+    Finds paths like `find_path_simple_parallel`, remembering each path found
+    in `cache` (by default the cache `source` already keeps its links in, or
+    else an in-memory cache) and answering from it when possible:
+        - a pair already searched is answered from its cached path
+        - a pair starting at a hub is answered from the hub's forward tree
+          (its shortest paths to the pages within `hub_depth` links)
+        - a pair ending at a hub is answered from the hub's backward tree
+          (shortest paths from the pages within `hub_depth` backlinks)
+    all in O(path length) cache lookups
+
+    With `splice`, a search that finds a page of the backward tree of a hub
+    whose forward tree holds the dest stops there, joining its path to the
+    hub with the hub's path to the dest, so the path is found at once but
+    may be longer than the shortest
+
+    Attributes:
+    ----------
+    `source`: LinkSource
+        Where titles and links are fetched from (through `cache`)
+    `cache`: LinkCache
+        Keeps the links, paths ("paths") and hub trees: each page of the
+        forward (backward) tree of a hub as "hub_from:HUB" ("hub_to:HUB")
+        page -> its parent ("" for the hub), and the no. of pages of each
+        complete tree as "hub_from" ("hub_to") hub -> no. of pages
+    `hubs`: List[str]
+        Hubs with a tree in either direction
+
+    Methods:
+    -------
+    `add_hub(title: str)`: None
+        Search (or find in `cache`) the forward and (if `source` supports
+        backlinks) backward tree of hub `title`
+    `lookup(start: str, dest: str)`: Optional[List[str]]
+        The path from existing title `start` to `dest` if it can be
+        answered from the cache, else None
+    `find_path(start: str, dest: str)`: List[str]
+        The path from `start` to `dest`, from the cache or else searched
+    """
+
+    def __init__(
+        self,
+        source: Optional[LinkSource] = None,
+        cache: Optional[LinkCache] = None,
+        hubs: Iterable[str] = (),
+        hub_depth: Optional[int] = HUB_DEPTH,
+        max_hub_nodes: Optional[int] = MAX_HUB_NODES,
+        splice: Optional[bool] = True
+    ):
+        if source is None:
+            source = default_source
+
+        if cache is None:
+            if isinstance(source, CachedSource):
+                cache = source.cache
+            elif isinstance(source, WikiApiSource) and source.api.cache is not None:
+                cache = source.api.cache
+            else:
+                cache = MemoryCache(max_entries=None)  # Unbounded, so the hub trees aren't evicted
+        # Links have to be cached for the paths to be checked against them
+        if not (isinstance(source, CachedSource) and source.cache is cache) and not (
+            isinstance(source, WikiApiSource) and source.api.cache is cache
+        ):
+            source = CachedSource(source, cache)
+
+        self.source = source
+        self.cache = cache
+        self.hub_depth = hub_depth
+        self.max_hub_nodes = max_hub_nodes
+        self.splice = splice
+        self.hubs: List[str] = []
+        # Hubs with a forward / backward tree in the cache
+        self._from_hubs: List[str] = []
+        self._to_hubs: List[str] = []
+        for hub in hubs:
+            self.add_hub(hub)
+
+    # ------ Hub trees ------
+
+    def _hub_tree(self, hub: str, backward: bool) -> Dict[str, str]:
+        """
+        Breadth first search tree from `hub` over links (or to `hub` over
+        backlinks if `backward`) of up to `hub_depth` levels and
+        `max_hub_nodes` pages, as page -> parent ("" for the hub)
+        """
+        tree = {hub: ""}
+        level = [hub]
+        for _depth in range(self.hub_depth):
+            next_level = []
+            fetch = self.source.iter_backlinks_batched if backward else self.source.iter_links_batched
+            for title, links in fetch(level):
+                for link in links:
+                    if link not in tree and len(tree) < self.max_hub_nodes:
+                        tree[link] = title
+                        next_level.append(link)
+            level = next_level
+        return tree
+
+    def add_hub(self, title: str) -> None:
+        """
+        Search (or find in the cache) the forward and (if the source
+        supports backlinks) backward tree of hub `title`
+        """
+        hub = self.source.wikititle(title)
+        for kind, hubs, backward in (
+            ("hub_from", self._from_hubs, False),
+            ("hub_to", self._to_hubs, True),
+        ):
+            if backward and not self.source.supports_backlinks:
+                continue
+            if self.cache.get(kind, hub) is None:
+                tree = self._hub_tree(hub, backward)
+                self.cache.set_many(f"{kind}:{hub}", tree)
+                self.cache.set(kind, hub, len(tree))  # Complete
+            if hub not in hubs:
+                hubs.append(hub)
+        if hub not in self.hubs:
+            self.hubs.append(hub)
+
+    def _follow(self, kind: str, hub: str, title: str) -> Optional[List[str]]:
+        """
+        The pages from `title` along the parents of the `kind` tree of
+        `hub` to the hub, or None if `title` isn't in the tree (or a page
+        on the way has been evicted from the cache)
+        """
+        path = []
+        while title != "":
+            path.append(title)
+            title = self.cache.get(f"{kind}:{hub}", title)
+            if title is None:
+                return None
+        return path
+
+    # ------ Lookups ------
+
+    def _is_valid(self, path: List[str]) -> bool:
+        """
+        Whether every link of `path` is still in the cache (each page's cached
+        links, or the next page's cached backlinks, hold the next page or
+        one of its redirects), so paths go when the links they use do
+        """
+        links = self.cache.get_many("links", path[:-1])
+        backlinks = self.cache.get_many("backlinks", path[1:])
+        for page, next_page in zip(path, path[1:]):
+            page_links = links.get(page, ())
+            if next_page in page_links or page in backlinks.get(next_page, ()):
+                continue
+            redirects = self.cache.get("redirects", next_page) or []
+            if set(redirects).isdisjoint(page_links):
+                return False
+        return True
+
+    def lookup(self, start: str, dest: str) -> Optional[List[str]]:
+        """
+        The path from existing title `start` to `dest` if it can be answered
+        from the cached paths and hub trees, else None
+        """
+        path = self.cache.get("paths", f"{start}\t{dest}")
+        if path is not None and self._is_valid(path):
+            return path
+
+        if start in self._from_hubs:
+            for title in (dest, *self.source.get_redirects(dest)):
+                to_title = self._follow("hub_from", start, title)
+                if to_title is not None:
+                    path = [*reversed(to_title[1:]), dest]
+                    if self._is_valid(path):
+                        return path
+
+        if dest in self._to_hubs:
+            path = self._follow("hub_to", dest, start)
+            if path is not None and self._is_valid(path):
+                return path
+        return None
+
+    def _bridge(self, titles: List[str], from_hubs: Dict[str, List[str]]) -> Optional[List[str]]:
+        """
+        The path from the first of `titles` in the backward tree of a hub of
+        `from_hubs` (hub -> its path to the dest) through the hub to the
+        dest, or None if none are in one
+        """
+        for hub, from_hub in from_hubs.items():
+            in_tree = self.cache.get_many(f"hub_to:{hub}", titles)
+            for title in titles:
+                to_hub = self._follow("hub_to", hub, title) if title in in_tree else None
+                if to_hub is not None:
+                    return [*to_hub[:-1], *from_hub]
+        return None
+
+    @staticmethod
+    def _cut_loops(path: List[str]) -> List[str]:
+        """
+        `path` with any loops back to an earlier page cut out
+        """
+        cut: List[str] = []
+        for title in path:
+            if title in cut:
+                del cut[cut.index(title) + 1:]
+            else:
+                cut.append(title)
+        return cut
+
+    # ------ Searching ------
+
+    def find_path(self, start: str, dest: str, metrics: Optional[NullMetrics] = None) -> List[str]:
+        """
+        The path from `start` to `dest`, from the cache if possible,
+        otherwise searched and cached
+        """
+        if metrics is None:
+            metrics = null_metrics
+        with metrics.timer("title"):
+            start = self.source.wikititle(start)
+            dest = self.source.wikititle(dest)
+        if start == dest:
+            return []
+
+        with metrics.timer("cache"):
+            path = self.lookup(start, dest)
+        if path is not None:
+            metrics.count("path_cache_hits")
+            metrics.finish()
+            return path
+        metrics.count("path_cache_misses")
+
+        # Hubs through which the search can be cut short -> their path to the dest
+        from_hubs: Dict[str, List[str]] = {}
+        if self.splice:
+            with metrics.timer("cache"):
+                for hub in self._to_hubs:
+                    from_hub = self.lookup(hub, dest) if hub in self._from_hubs else None
+                    if from_hub is not None:
+                        from_hubs[hub] = from_hub
+                path = self._bridge([start], from_hubs)  # The start itself may lead to a hub
+
+        def bridge(titles: List[str]) -> Optional[List[str]]:
+            with metrics.timer("cache"):
+                return self._bridge(titles, from_hubs)
+
+        if path is not None:
+            metrics.finish()
+        else:
+            path = find_path_simple_parallel(
+                start, dest, self.source, metrics, bridge=bridge if from_hubs else None
+            )
+        path = self._cut_loops(path)
+
+        if path:
+            # A search stopping early leaves the links of the last pages it
+            # queried uncached, and the path can't be checked without them
+            cached = self.cache.get_many("links", path[:-1])
+            uncached = [title for title in path[:-1] if title not in cached]
+            if uncached:
+                self.source.get_links_batched(uncached)
+            self.cache.set("paths", f"{start}\t{dest}", path)
+        return path
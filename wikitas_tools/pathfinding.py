@@ -2,56 +2,101 @@
 Different functions to find (possibly shortest) paths from
 wikipedia page A to page B
 """
-from typing import List, Optional
-from queue import Queue
-from .tree import Tree
-from .wikiapi import wikititle, get_links, get_links_parallel
-from .word_utils import similarity, get_words, get_words_with_categories
-from .wikilog import log_page
+from typing import Callable, List, Dict, FrozenSet, NamedTuple, Optional
+from collections import deque
+from itertools import islice
+import asyncio
+import heapq
+import time
+from .tree import SearchTree
+from .spill import DiskSearchTree, SpillQueue, spill_directory
+from .sources import LinkSource, default_source
+from .wikiapi import MAX_THREADS, MAX_TITLES
+from .word_utils import SimilarityScorer, get_words_with_categories
+from .metrics import NullMetrics, null_metrics
+from .prefetch import Prefetcher
+
+
+def _record_page(metrics: NullMetrics, tree: SearchTree, page: int, frontier_size: int) -> None:
+    """
+    Helper to record the expansion of node `page` of `tree` in `metrics`
+    """
+    if metrics.enabled:
+        metrics.observe("depth", tree.depth(page))
+        metrics.observe("frontier_size", frontier_size)
+    metrics.page(tree.titles[page])
+
+
+def _goal_titles(source: LinkSource, dest: str) -> FrozenSet[str]:
+    """
+    Helper returning `dest` and the titles redirecting to it, as a link to
+    any of them reaches `dest` (so is found a level sooner than through its links)
+    """
+    return frozenset([dest, *source.get_redirects(dest)])
 
 
-def find_path_simple(start: str, dest: str) -> List[str]:
+def find_path_simple(
+    start: str,
+    dest: str,
+    source: Optional[LinkSource] = None,
+    metrics: Optional[NullMetrics] = None
+) -> List[str]:
     """
     Finds the shortest path from `start` to `dest` using breadth first seacrh
     Generally faster than `find_path_short` for shorter paths and paths where
     the words in `dest` are not in the wordnet db
     (e.g. Minami (singer) -> Saitama Prefecture || Vietnam War -> Among Us)
+
+    Every `find_path_*` function gets titles and links from `source`
+    (the live english wikipedia api by default), and records where it spends
+    its time in `metrics` (nothing by default, see `metrics.py`)
     """
     # Convert to valid/existing wikipedia titles
-    start = wikititle(start)
-    dest = wikititle(dest)
+    if source is None:
+        source = default_source
+    if metrics is None:
+        metrics = null_metrics
+    with metrics.timer("title"):
+        start = source.wikititle(start)
+        dest = source.wikititle(dest)
+        goal = _goal_titles(source, dest)
     if start == dest:
         return []
 
     print(f"Finding path from {start} to {dest}")
 
-    # Initialise queue and tree for BFS
-    queue = Queue()
-    queue.put(Tree(start))
-    visited = {start}
+    # Initialise queue and tree (of node ids) for BFS
+    tree = SearchTree(start)
+    queue = deque([0])
 
     # Start BFS
-    while not queue.empty():
-        current_page = queue.get()
-        log_page(current_page.root)
-
-        page_links = get_links(current_page.root)
-        for link in page_links:
-            if link == dest:
-                print()
-                return [start, *current_page.parents(), dest]
-
-            if link not in visited:
-                visited.add(link)
-                branch = Tree(link)
-                current_page.add_child(branch)
-                queue.put(branch)
-
-    print()
+    while queue:
+        current_page = queue.popleft()
+        current_title = tree.titles[current_page]
+        _record_page(metrics, tree, current_page, len(queue))
+
+        # Links are streamed per response so the search can stop mid-page
+        for link in source.iter_links(current_title):
+            if link in goal:
+                metrics.finish()
+                return [*tree.path(current_page), dest]
+
+            branch = tree.add(link, current_page)
+            if branch is not None:  # Not visited
+                queue.append(branch)
+
+    metrics.finish()
     return []
 
 
-def find_path_wordmatching(start: str, dest: str, top_n: Optional[int] = 7) -> List[str]:
+def find_path_wordmatching(
+    start: str,
+    dest: str,
+    top_n: Optional[int] = 7,
+    source: Optional[LinkSource] = None,
+    scorer_factory: Optional[Callable[[List[str]], SimilarityScorer]] = None,
+    metrics: Optional[NullMetrics] = None
+) -> List[str]:
     """
     Finds the (possibly shortest) path from wikipedia page
     `start` to `dest` by comparing the relatedness of words
@@ -60,164 +105,653 @@ def find_path_wordmatching(start: str, dest: str, top_n: Optional[int] = 7) -> L
     Generally takes less time than `find_path_simple` for longer paths and
     paths where words in `dest` are in the wordnet db
     (e.g. Among Us -> Black Hole)
+
+    Links are scored by `scorer_factory(dest_words)` (`SimilarityScorer`,
+    the wordnet similarity, by default, or e.g. `EmbeddingScorer`)
     """
     # Convert to valid/existing wikipedia titles
-    start = wikititle(start)
-    dest = wikititle(dest)
+    if source is None:
+        source = default_source
+    if metrics is None:
+        metrics = null_metrics
+    with metrics.timer("title"):
+        start = source.wikititle(start)
+        dest = source.wikititle(dest)
+        goal = _goal_titles(source, dest)
     if start == dest:
         return []
 
     print(f"Finding path from {start} to {dest}")
 
-    dest_words = get_words_with_categories(dest)
+    dest_words = get_words_with_categories(dest, categories=source.get_categories(dest))
     print(f"Matching links against {dest_words}")
+    if scorer_factory is None:
+        scorer_factory = SimilarityScorer
+    scorer = scorer_factory(dest_words)
 
-    # Initialise queue and tree for BFS
-    queue = Queue()
-    queue.put(Tree(start))
-    visited = {start}
+    # Initialise queue and tree (of node ids) for BFS
+    # Every link seen is added to the tree (as visited), but only the
+    # top n links of each page are queued
+    tree = SearchTree(start)
+    queue = deque([0])
 
     # Start BFS
-    while not queue.empty():
-        links_by_sim = []
-        current_page = queue.get()
-        log_page(current_page.root)
-
-        page_links = get_links(current_page.root)
-        if not page_links:
-            continue
-
-        for link in page_links:
-            if link == dest:
-                print()
-                return [start, *current_page.parents(), dest]
-
-            if link not in visited:
-                sim = similarity(get_words(link), dest_words)
-                visited.add(link)
-                links_by_sim.append((link, sim))
+    while queue:
+        branches = []
+        current_page = queue.popleft()
+        current_title = tree.titles[current_page]
+        _record_page(metrics, tree, current_page, len(queue))
+
+        # Links are streamed per response so the search can stop mid-page
+        for link in source.iter_links(current_title):
+            if link in goal:
+                metrics.finish()
+                return [*tree.path(current_page), dest]
+
+            branch = tree.add(link, current_page)
+            if branch is not None:  # Not visited
+                branches.append(branch)
+
+        # Score the page's new links all at once
+        with metrics.timer("scoring"):
+            sims = scorer.score_many([tree.titles[branch] for branch in branches])
+        links_by_sim = list(zip(branches, sims))
 
         # Filter out the top n (default 7) links by similarity to desitnation word(s)
         links_by_sim.sort(key=lambda x: x[1], reverse=True)
         filtered_links = reversed(links_by_sim[:top_n])  # originally 11
 
         # Reverse so most recent element in queue (to pop) is highest similarity
-        for filtered_link, sim in filtered_links:
-            branch = Tree(filtered_link)
-            current_page.add_child(branch)
-            queue.put(branch)
+        for branch, sim in filtered_links:
+            queue.append(branch)
 
-    print()
+    metrics.finish()
     return []
 
 
-def find_path_simple_parallel(start: str, dest: str) -> List[str]:
+def find_path_simple_parallel(
+    start: str,
+    dest: str,
+    source: Optional[LinkSource] = None,
+    metrics: Optional[NullMetrics] = None,
+    prefetch: Optional[int] = 0,
+    bridge: Optional[Callable[[List[str]], Optional[List[str]]]] = None
+) -> List[str]:
     """
-    `find_path_simple()` but http reqs are done in parallel
+    `find_path_simple()` but http reqs are batched and done in parallel
+
+    With `prefetch`, the links of up to that many queued pages are fetched
+    while the links of the current batch are searched. 0 (none) by default,
+    as each response is already searched while the rest are in flight
+
+    With `bridge`, the new pages found from each page are passed to
+    `bridge`, and a path it returns from one of them to `dest` (e.g. a
+    known path) ends the search, joined to the path to that page, so the
+    path may not be the shortest
     """
-    start = wikititle(start)
-    dest = wikititle(dest)
+    if source is None:
+        source = default_source
+    if metrics is None:
+        metrics = null_metrics
+    with metrics.timer("title"):
+        start = source.wikititle(start)
+        dest = source.wikititle(dest)
+        goal = _goal_titles(source, dest)
     if start == dest:
         return []
 
     print(f"Finding path from {start} to {dest}")
 
-    # Initialise queue and tree for BFS
-    queue = Queue()
-    queue.put(Tree(start))
-    visited = {start}
-    pages_at_once = 32
-
-    # Start BFS
-    while not queue.empty():
-        pages: List[str] = []
-        for _ in range(pages_at_once):
-            if queue.empty():
-                break
-
-            current_page = queue.get()
-            pages.append(current_page)
-
-        parallel_links = get_links_parallel(pages)
-
-        for page_link_obj in parallel_links:
-            page = page_link_obj["page"]
-            links = page_link_obj["links"]
-            log_page(page.root)
-
-            for link in links:
-                if link == dest:
-                    print()
-                    return [start, *page.parents(), dest]
-
-                if link not in visited:
-                    visited.add(link)
-                    branch = Tree(link)
-                    page.add_child(branch)
-                    queue.put(branch)
-
-    print()
+    # Initialise queue and tree (of node ids) for BFS
+    tree = SearchTree(start)
+    queue = deque([0])
+    pages_at_once = MAX_TITLES * MAX_THREADS  # Fill every thread with a full query
+    level_left = 0  # Queued pages left of the level being expanded
+
+    # Start BFS (outstanding prefetches are abandoned once it's over)
+    with Prefetcher(source, prefetch, metrics) as prefetcher:
+        while queue:
+            # Responses arrive in any order, so a batch never spans two levels
+            # (a deeper page's links could otherwise be added first)
+            if not level_left:
+                level_left = len(queue)
+            pages = [queue.popleft() for _ in range(min(pages_at_once, level_left))]
+            level_left -= len(pages)
+            prefetcher.prefetch(tree.titles[page] for page in islice(queue, prefetch))
+
+            # Links are streamed per response so the search can stop mid-batch
+            titles = [tree.titles[page] for page in pages]
+            for title, links in prefetcher.iter_links_batched(titles):
+                page = tree.id_of(title)
+                _record_page(metrics, tree, page, len(queue))
+
+                with metrics.timer("frontier"):
+                    if not goal.isdisjoint(links):
+                        metrics.finish()
+                        return [*tree.path(page), dest]
+                    branches = tree.add_many(links, page)  # Not visited
+                    queue.extend(branches)
+                    prefetcher.prefetch(tree.titles[branch] for branch in branches)
+
+                if bridge is not None and branches:
+                    rest = bridge([tree.titles[branch] for branch in branches])
+                    if rest is not None:
+                        metrics.finish()
+                        return [*tree.path(tree.id_of(rest[0])), *rest[1:]]
+
+    metrics.finish()
     return []
 
 
-def find_path_wordmatching_parallel(start: str, dest: str, top_n: Optional[int] = 7) -> List[str]:
+def find_path_wordmatching_parallel(
+    start: str,
+    dest: str,
+    top_n: Optional[int] = 7,
+    source: Optional[LinkSource] = None,
+    scorer_factory: Optional[Callable[[List[str]], SimilarityScorer]] = None,
+    metrics: Optional[NullMetrics] = None,
+    prefetch: Optional[int] = None
+) -> List[str]:
     """
-    `find_path_wordmatching()` but http reqs are done in parallel
+    `find_path_wordmatching()` but http reqs are batched and done in parallel,
+    and the links of up to `prefetch` of the top queued pages (a batch by
+    default, 0 for none) are fetched while the current batch is scored
     """
     # Convert to valid/existing wikipedia titles
-    start = wikititle(start)
-    dest = wikititle(dest)
+    if source is None:
+        source = default_source
+    if metrics is None:
+        metrics = null_metrics
+    with metrics.timer("title"):
+        start = source.wikititle(start)
+        dest = source.wikititle(dest)
+        goal = _goal_titles(source, dest)
     if start == dest:
         return []
 
     print(f"Finding path from {start} to {dest}")
 
     # dest_words = get_words(dest_title)
-    dest_words = get_words_with_categories(dest)
+    dest_words = get_words_with_categories(dest, categories=source.get_categories(dest))
     print(f"Matching links against {dest_words}")
+    if scorer_factory is None:
+        scorer_factory = SimilarityScorer
+    scorer = scorer_factory(dest_words)
+
+    # Initialise queue and tree (of node ids) for BFS
+    tree = SearchTree(start)
+    queue = deque([0])
+    pages_at_once = MAX_TITLES  # One query per batch
+    if prefetch is None:
+        prefetch = pages_at_once
+
+    # Start BFS (outstanding prefetches are abandoned once it's over)
+    with Prefetcher(source, prefetch, metrics) as prefetcher:
+        while queue:
+            pages = [queue.popleft() for _ in range(min(pages_at_once, len(queue)))]
+            children: Dict[int, List[int]] = {}  # Parent id -> new link ids
+            # The next batches, fetched while this one is scored
+            prefetcher.prefetch(tree.titles[page] for page in islice(queue, prefetch))
+
+            # Links are streamed per response so the search can stop mid-batch
+            titles = [tree.titles[page] for page in pages]
+            for title, links in prefetcher.iter_links_batched(titles):
+                page = tree.id_of(title)
+                _record_page(metrics, tree, page, len(queue))
+
+                page_children = children.setdefault(page, [])
+                with metrics.timer("frontier"):
+                    if not goal.isdisjoint(links):
+                        metrics.finish()
+                        return [*tree.path(page), dest]
+                    # Not visited (so new to the whole batch)
+                    page_children.extend(tree.add_many(links, page))
+
+            # Score the new links of the whole batch at once
+            branches = [branch for page_children in children.values() for branch in page_children]
+            with metrics.timer("scoring"):
+                sims = dict(zip(branches, scorer.score_many([tree.titles[branch] for branch in branches])))
+
+            # Filter out the top n (default 7) links of each page by similarity to desitnation word(s)
+            for page_children in children.values():
+                filtered_links = heapq.nlargest(top_n, page_children, key=sims.__getitem__)  # originally 11
+
+                # Reverse so most recent element in queue (to pop) is highest similarity
+                queue.extend(reversed(filtered_links))
+
+    metrics.finish()
+    return []
 
-    # Initialise queue and tree for BFS
-    queue = Queue()
-    queue.put(Tree(start))
-    visited = {start}
-    pages_at_once = 32
 
-    # Start BFS
-    while not queue.empty():
-        links_by_sim = []
-        pages: List[str] = []
-        for _ in range(pages_at_once):
-            if queue.empty():
-                break
-
-            current_page = queue.get()
-            pages.append(current_page)
-
-        parallel_links = get_links_parallel(pages)
-
-        for page_link_obj in parallel_links:
-            page = page_link_obj["page"]
-            links = page_link_obj["links"]
-            log_page(page.root)
-
-            for link in links:
-                if link == dest:
-                    print()
-                    return [start, *page.parents(), dest]
-
-                if link not in visited:
-                    sim = similarity(get_words(link), dest_words)
-                    visited.add(link)
-                    links_by_sim.append((link, sim))
-
-            # Filter out the top n (default 7) links by similarity to desitnation word(s)
-            links_by_sim.sort(key=lambda x: x[1], reverse=True)
-            filtered_links = reversed(links_by_sim[:top_n])  # originally 11
-
-            for filtered_link, sim in filtered_links:
-                branch = Tree(filtered_link)
-                page.add_child(branch)
-                queue.put(branch)
-
-    print()
+def find_path_best_first(
+    start: str,
+    dest: str,
+    weight: Optional[float] = 10,
+    beam_width: Optional[int] = 7,
+    source: Optional[LinkSource] = None,
+    scorer_factory: Optional[Callable[[List[str]], SimilarityScorer]] = None,
+    metrics: Optional[NullMetrics] = None,
+    prefetch: Optional[int] = None
+) -> List[str]:
+    """
+    Finds a path from wikipedia page `start` to `dest` by always expanding
+    the queued pages with the best mix of relatedness to `dest` and depth
+
+    Parameters:
+    ----------
+    `weight`: Optional[float]
+        How many levels of depth a link is worth for each 1.0 of similarity
+        to the words & categories of `dest` (pages are expanded lowest
+        `depth - weight * similarity` first)
+        0 is a plain BFS (shortest path), larger values are greedier
+    `beam_width`: Optional[int]
+        Only the `beam_width` most related new links of each page are queued,
+        the rest are kept aside and queued (best first) once the queue runs
+        out, so no link is lost for good
+        None to queue every link
+    `scorer_factory`: Optional[Callable[[List[str]], SimilarityScorer]]
+        Makes the link scorer from the words of `dest`
+        (`SimilarityScorer` by default, or e.g. `EmbeddingScorer`)
+    `prefetch`: Optional[int]
+        The links of up to `prefetch` of the best queued pages (a batch by
+        default, 0 for none) are fetched while the current batch is scored
+
+    Unlike `find_path_wordmatching`, always finds a path if one exists
+    """
+    # Convert to valid/existing wikipedia titles
+    if source is None:
+        source = default_source
+    if metrics is None:
+        metrics = null_metrics
+    with metrics.timer("title"):
+        start = source.wikititle(start)
+        dest = source.wikititle(dest)
+        goal = _goal_titles(source, dest)
+    if start == dest:
+        return []
+
+    print(f"Finding path from {start} to {dest}")
+
+    dest_words = get_words_with_categories(dest, categories=source.get_categories(dest))
+    print(f"Matching links against {dest_words}")
+    if scorer_factory is None:
+        scorer_factory = SimilarityScorer
+    scorer = scorer_factory(dest_words)
+
+    # Heaps of (priority, order added, node id, depth), where the order
+    # added breaks ties first in first out (like BFS)
+    tree = SearchTree(start)
+    frontier = [(0.0, 0, 0, 0)]
+    pruned = []
+    added = 1
+    pages_at_once = MAX_TITLES  # One query per batch
+    if prefetch is None:
+        prefetch = pages_at_once
+
+    # Outstanding prefetches are abandoned once the search is over
+    with Prefetcher(source, prefetch, metrics) as prefetcher:
+        while frontier or pruned:
+            if not frontier:  # Re-admit the best pruned links
+                for _ in range(min(beam_width or len(pruned), len(pruned))):
+                    heapq.heappush(frontier, heapq.heappop(pruned))
+
+            pages = [heapq.heappop(frontier) for _ in range(min(pages_at_once, len(frontier)))]
+            depths = {page: depth for _priority, _added, page, depth in pages}
+            # The best pages left, most likely to be expanded next
+            best = heapq.nsmallest(prefetch, frontier)
+            prefetcher.prefetch(tree.titles[page] for _priority, _added, page, _depth in best)
+
+            # Links are streamed per response so the search can stop mid-batch
+            titles = [tree.titles[page] for page in depths]
+            for title, links in prefetcher.iter_links_batched(titles):
+                page = tree.id_of(title)
+                depth = depths[page] + 1
+                metrics.page(title)
+                if metrics.enabled:
+                    metrics.observe("depth", depth - 1)
+                    metrics.observe("frontier_size", len(frontier) + len(pruned))
+
+                with metrics.timer("frontier"):
+                    if not goal.isdisjoint(links):
+                        metrics.finish()
+                        return [*tree.path(page), dest]
+                    branches = tree.add_many(links, page)  # Not visited
+
+                with metrics.timer("scoring"):
+                    sims = scorer.score_many([tree.titles[branch] for branch in branches])
+
+                with metrics.timer("frontier"):
+                    entries = []
+                    for branch, sim in zip(branches, sims):
+                        entries.append((depth - weight * sim, added, branch, depth))
+                        added += 1
+
+                    # Queue the most related links, keeping the rest aside
+                    if beam_width is not None and len(entries) > beam_width:
+                        entries.sort()
+                        for entry in entries[beam_width:]:
+                            heapq.heappush(pruned, entry)
+                        entries = entries[:beam_width]
+
+                    for entry in entries:
+                        heapq.heappush(frontier, entry)
+
+    metrics.finish()
     return []
+
+
+def find_path_simple_async(
+    start: str,
+    dest: str,
+    concurrency: Optional[int] = MAX_THREADS,
+    rps: Optional[float] = None,
+    source: Optional[LinkSource] = None,
+    metrics: Optional[NullMetrics] = None
+) -> List[str]:
+    """
+    `find_path_simple()` but up to `concurrency` http reqs (of up to `MAX_TITLES`
+    pages each) are always in flight, with at most `rps` reqs started per second
+    Each response is searched as soon as it arrives instead of waiting for the
+    slowest page of a batch, so the path is short but may not be the shortest
+    """
+    if source is None:
+        source = default_source
+    if metrics is None:
+        metrics = null_metrics
+    with metrics.timer("title"):
+        start = source.wikititle(start)
+        dest = source.wikititle(dest)
+        goal = _goal_titles(source, dest)
+    if start == dest:
+        return []
+
+    print(f"Finding path from {start} to {dest}")
+    path = asyncio.run(_find_path_simple_async(start, dest, goal, concurrency, rps, source, metrics))
+    metrics.finish()
+    return path
+
+
+async def _find_path_simple_async(
+    start: str,
+    dest: str,
+    goal: FrozenSet[str],
+    concurrency: int,
+    rps: Optional[float],
+    source: LinkSource,
+    metrics: NullMetrics
+) -> List[str]:
+    """
+    Helper for `find_path_simple_async`, run in the event loop
+    """
+    tree = SearchTree(start)
+    queue = deque([0])
+    in_flight = set()
+
+    async with source.async_fetcher(concurrency, rps) as fetcher:
+        def fetch(titles: List[str], continue_params: Optional[Dict] = None) -> None:
+            in_flight.add(asyncio.ensure_future(fetcher.fetch_links(titles, continue_params)))
+
+        try:
+            while queue or in_flight:
+                # Keep the fetcher fed with as many pages as are queued
+                while queue and len(in_flight) < concurrency:
+                    pages = [queue.popleft() for _ in range(min(MAX_TITLES, len(queue)))]
+                    fetch([tree.titles[page] for page in pages])
+
+                done, _pending = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                for req in done:
+                    in_flight.remove(req)
+                    title_links, continuation = req.result()
+                    if continuation is not None:  # Rest of the pages' links
+                        fetch(*continuation)
+
+                    for title, links in title_links:
+                        page = tree.id_of(title)
+                        _record_page(metrics, tree, page, len(queue))
+
+                        with metrics.timer("frontier"):
+                            if not goal.isdisjoint(links):
+                                return [*tree.path(page), dest]
+                            queue.extend(tree.add_many(links, page))  # Not visited
+        finally:
+            # Goal found (or error) - cancel all outstanding reqs
+            for req in in_flight:
+                req.cancel()
+
+    return []
+
+
+def _join_paths(
+    forward: SearchTree,
+    forward_node: int,
+    backward: SearchTree,
+    backward_node: int
+) -> List[str]:
+    """
+    Helper for `find_path_bidirectional`
+    Joins the path from `start` to `forward_node` with the path
+    from `backward_node` to `dest`, where `forward_node` links to `backward_node`
+    """
+    return [*forward.path(forward_node), *reversed(backward.path(backward_node))]
+
+
+def find_path_bidirectional(
+    start: str,
+    dest: str,
+    source: Optional[LinkSource] = None,
+    metrics: Optional[NullMetrics] = None
+) -> List[str]:
+    """
+    Finds the shortest path from `start` to `dest` using a bidirectional
+    breadth first search: one frontier grows forwards from `start` through page
+    links, the other grows backwards from `dest` through backlinks, and the
+    smaller of the two is expanded a level at a time until they meet
+    Expands roughly 2 * b^(d/2) pages instead of the b^d of `find_path_simple`
+    """
+    if source is None:
+        source = default_source
+    if metrics is None:
+        metrics = null_metrics
+    with metrics.timer("title"):
+        start = source.wikititle(start)
+        dest = source.wikititle(dest)
+        goal = _goal_titles(source, dest)
+    if start == dest:
+        return []
+
+    if not source.supports_backlinks:
+        raise ValueError(f"{type(source).__name__} doesn't support backlinks")
+
+    print(f"Finding path from {start} to {dest}")
+
+    # Trees for both directions, where parents point back towards `start`
+    # in `forward` and onwards towards `dest` in `backward`
+    forward = SearchTree(start)
+    backward = SearchTree(dest)
+    forward_frontier = [0]
+    backward_frontier = [0]
+
+    while forward_frontier and backward_frontier:
+        # Expand a whole level of the smaller frontier. The first meeting
+        # found is a shortest path, as any shorter path would have met sooner
+        if len(forward_frontier) <= len(backward_frontier):
+            next_frontier = []
+            titles = [forward.titles[page] for page in forward_frontier]
+            for title, links in source.iter_links_batched(titles):
+                page = forward.id_of(title)
+                _record_page(metrics, forward, page, len(forward_frontier) + len(backward_frontier))
+
+                with metrics.timer("frontier"):
+                    for link in links:
+                        # Links to a redirect of `dest` meet at its root
+                        meeting = 0 if link in goal else backward.id_of(link)
+                        if meeting is not None:
+                            metrics.finish()
+                            return _join_paths(forward, page, backward, meeting)
+
+                        branch = forward.add(link, page)
+                        if branch is not None:  # Not visited
+                            next_frontier.append(branch)
+
+            forward_frontier = next_frontier
+        else:
+            next_frontier = []
+            titles = [backward.titles[page] for page in backward_frontier]
+            for title, backlinks in source.iter_backlinks_batched(titles):
+                page = backward.id_of(title)
+                _record_page(metrics, backward, page, len(forward_frontier) + len(backward_frontier))
+
+                with metrics.timer("frontier"):
+                    for backlink in backlinks:
+                        meeting = forward.id_of(backlink)
+                        if meeting is not None:
+                            metrics.finish()
+                            return _join_paths(forward, meeting, backward, page)
+
+                        branch = backward.add(backlink, page)
+                        if branch is not None:  # Not visited
+                            next_frontier.append(branch)
+
+            backward_frontier = next_frontier
+
+    metrics.finish()
+    return []
+
+
+class SearchResult(NamedTuple):
+    """
+    Result of `find_path_bounded`
+
+    Attributes:
+    ----------
+    `path`: List[str]
+        The path found (empty if none, or if the start is the destination,
+        like the other finders)
+    `reason`: str
+        Why the search stopped: "found", "exhausted" (no path exists), or the
+        budget it ran out of: "max_depth", "max_nodes" or "deadline"
+    `pages_expanded`: int
+        No. of pages whose links were searched
+    `nodes_seen`: int
+        No. of distinct pages found
+    `depth`: int
+        Depth of the deepest page expanded
+    """
+
+    path: List[str]
+    reason: str
+    pages_expanded: int
+    nodes_seen: int
+    depth: int
+
+    @property
+    def found(self) -> bool:
+        return self.reason == "found"
+
+
+def find_path_bounded(
+    start: str,
+    dest: str,
+    max_depth: Optional[int] = None,
+    max_nodes: Optional[int] = None,
+    deadline: Optional[float] = None,
+    memory_nodes: Optional[int] = 65536,
+    spill_dir: Optional[str] = None,
+    source: Optional[LinkSource] = None,
+    metrics: Optional[NullMetrics] = None
+) -> SearchResult:
+    """
+    `find_path_simple_parallel()` within a budget and with bounded memory use
+
+    The queue keeps at most about 2 * `memory_nodes` page ids in memory and the
+    rest in files, and the visited pages are kept in memory up to `memory_nodes`
+    of them, then in an sqlite database with a bloom filter in memory, all in
+    a temporary directory in `spill_dir` (the system temp directory by
+    default) deleted once the search is over
+
+    Parameters:
+    ----------
+    `max_depth`: Optional[int]
+        Only find paths of up to `max_depth` links
+    `max_nodes`: Optional[int]
+        Stop after finding `max_nodes` distinct pages
+    `deadline`: Optional[float]
+        Stop after `deadline` seconds
+
+    Returns a `SearchResult`, with the budget that ran out (if any) as its `reason`
+    """
+    if source is None:
+        source = default_source
+    if metrics is None:
+        metrics = null_metrics
+    with metrics.timer("title"):
+        start = source.wikititle(start)
+        dest = source.wikititle(dest)
+        goal = _goal_titles(source, dest)
+    if start == dest:
+        return SearchResult([], "found", 0, 1, 0)
+
+    print(f"Finding path from {start} to {dest}")
+    deadline_at = time.monotonic() + deadline if deadline is not None else None
+    pages_at_once = MAX_TITLES * MAX_THREADS  # Fill every thread with a full query
+    level_left = 0  # Queued pages left of the level being expanded
+
+    with spill_directory(spill_dir) as directory:
+        tree = DiskSearchTree(start, directory, memory_nodes, expected_nodes=max_nodes or 10_000_000)
+        queue = SpillQueue(directory, memory_nodes)
+        queue.append(0)
+        pages_expanded = 0
+        depth_reached = 0
+        cut_by_depth = False  # Pages were left unexpanded by `max_depth`
+
+        def result(path: List[str], reason: str) -> SearchResult:
+            metrics.finish()
+            return SearchResult(path, reason, pages_expanded, len(tree), depth_reached)
+
+        try:
+            while queue:
+                if deadline_at is not None and time.monotonic() >= deadline_at:
+                    return result([], "deadline")
+
+                # A batch never spans two levels, as responses arrive in any order
+                if not level_left:
+                    level_left = len(queue)
+                pages = [queue.popleft() for _ in range(min(pages_at_once, level_left))]
+                level_left -= len(pages)
+                nodes_by_title = {}  # Title -> (node id, depth)
+                for page, (title, depth) in tree.nodes(pages).items():
+                    if max_depth is not None and depth >= max_depth:
+                        cut_by_depth = True  # Its links would be too deep
+                    else:
+                        nodes_by_title[title] = (page, depth)
+
+                # Links are streamed per response so the search can stop mid-batch
+                expanded = set()
+                for title, links in source.iter_links_batched(list(nodes_by_title)):
+                    page, depth = nodes_by_title[title]
+                    if title not in expanded:
+                        expanded.add(title)
+                        pages_expanded += 1
+                        depth_reached = max(depth_reached, depth)
+                        metrics.page(title)
+                        if metrics.enabled:
+                            metrics.observe("depth", depth)
+                            metrics.observe("frontier_size", len(queue))
+
+                    with metrics.timer("frontier"):
+                        if not goal.isdisjoint(links):
+                            return result([*tree.path(page), dest], "found")
+                        queue.extend(tree.add_many(links, page, depth))
+
+                    if max_nodes is not None and len(tree) >= max_nodes:
+                        return result([], "max_nodes")
+                    if deadline_at is not None and time.monotonic() >= deadline_at:
+                        return result([], "deadline")
+
+            return result([], "max_depth" if cut_by_depth else "exhausted")
+        finally:
+            queue.close()
+            tree.close()
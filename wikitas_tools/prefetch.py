@@ -0,0 +1,231 @@
+"""
+Speculative fetching of the links of pages a search has queued but not yet
+expanded, so the http reqs of the next batch are in flight while the current
+batch's links are still being checked, added to the tree and scored
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from .metrics import NullMetrics, null_metrics
+from .sources import LinkSource
+from .wikiapi import MAX_THREADS, MAX_TITLES
+
+STALE_BATCHES = 2  # Batches after which prefetched links the search didn't ask for are dropped
+
+
+class _Query:
+    """
+    A query of the links of up to `MAX_TITLES` pages on a thread of a
+    `Prefetcher`, keeping each response as it arrives
+    """
+
+    def __init__(self, titles: List[str], batch: int):
+        self.titles = titles
+        self.batch = batch  # No. of the batch it was started in
+        self.responses: List[Tuple[str, List[str]]] = []
+        self.done = False  # Stopped, complete or not
+        self.complete = False
+        self.error: Optional[Exception] = None
+        self.abandoned = False
+        self.future: Optional[Future] = None
+
+
+class Prefetcher:
+    """
+    Fetches the links of up to `budget` pages ahead of a search from
+    `source`, in queries of `MAX_TITLES` pages on background threads, and
+    hands each response over as it arrives once the search asks for its
+    pages. Counts "prefetched" pages, "prefetch_hits" (prefetched pages the
+    search asked for) and "prefetch_dropped" (prefetched pages it didn't ask
+    for within `STALE_BATCHES` batches) in `metrics`
+
+    Only pages being fetched or fetched but not yet asked for use up the
+    budget. Use it as a context manager, so prefetches still outstanding
+    when the search ends (e.g. the goal is found) are abandoned
+
+    Methods:
+    -------
+    `prefetch(titles: Iterable[str])`: None
+        Start fetching the links of `titles` (in order, while under budget)
+    `iter_links_batched(titles: List[str])`: Iterator[Tuple[str, List[str]]]
+        `(title, links)` of `titles`, from their prefetches if any, else fetched now
+    `cancel()`: None
+        Abandon every outstanding prefetch
+    """
+
+    def __init__(self, source: LinkSource, budget: int, metrics: Optional[NullMetrics] = None):
+        self.source = source
+        self.budget = budget
+        self.metrics = metrics if metrics is not None else null_metrics
+        self._pending: Dict[str, None] = {}  # Titles waiting for a full query, in order
+        self._fetches: Dict[str, _Query] = {}  # Title -> query of its links, until asked for
+        self._batch = 0  # No. of batches asked for
+        self._stop = threading.Event()
+        self._changed = threading.Condition()  # Notified as a query gets a response or stops
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __enter__(self) -> 'Prefetcher':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.cancel()
+
+    def _run(self, query: _Query) -> None:
+        """
+        Fetch the links of `query` from `source` in a single query (run on a
+        background thread), until complete or abandoned
+        """
+        responses = iter(self.source.iter_links_query(query.titles))
+        try:
+            for title, links in responses:
+                if self._stop.is_set() or query.abandoned:
+                    break
+                with self._changed:
+                    query.responses.append((title, links))
+                    self._changed.notify_all()
+            else:
+                query.complete = True
+        except Exception as err:  # Re-raised on the searching thread
+            query.error = err
+        finally:
+            close = getattr(responses, "close", None)
+            if close is not None:  # Stop a generator mid-query
+                close()
+            self._finish(query)
+
+    def _finish(self, query: _Query) -> None:
+        with self._changed:
+            query.done = True
+            self._changed.notify_all()
+
+    def _start(self, titles: List[str]) -> _Query:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=MAX_THREADS)
+        query = _Query(titles, self._batch)
+        query.future = self._executor.submit(self._run, query)
+        return query
+
+    def _cancel(self, query: _Query) -> bool:
+        """
+        Whether `query` is over, cancelling it if not started yet
+        """
+        if not query.done and query.future.cancel():
+            query.abandoned = True
+            self._finish(query)
+        return query.done
+
+    def _abandon(self, query: _Query) -> None:
+        query.abandoned = True
+        self._cancel(query)
+
+    def prefetch(self, titles: Iterable[str]) -> None:
+        """
+        Queue `titles` to be fetched ahead, in order until `budget` pages
+        are held or in flight, starting a query for every `MAX_TITLES` of
+        them (or for the rest, once the budget is used up)
+        """
+        if self._stop.is_set():
+            return
+        for title in titles:
+            if len(self._pending) + len(self._fetches) >= self.budget:
+                break
+            if title not in self._fetches:
+                self._pending[title] = None
+
+        # Partial queries only once the budget is used up
+        while len(self._pending) >= MAX_TITLES or (
+            self._pending and len(self._pending) + len(self._fetches) >= self.budget
+        ):
+            chunk = list(self._pending)[:MAX_TITLES]
+            for title in chunk:
+                del self._pending[title]
+            self._fetches.update(dict.fromkeys(chunk, self._start(chunk)))
+            self.metrics.count("prefetched", len(chunk))
+
+    def _drop_stale(self, needed: Set[_Query]) -> None:
+        """
+        Drop the prefetched pages not asked for within `STALE_BATCHES`
+        batches (e.g. no longer among the best scored), once their query
+        is over or before it starts, to free up the budget. Queries still
+        `needed` by the current batch are kept
+        """
+        stale = {
+            query for query in self._fetches.values()
+            if self._batch - query.batch > STALE_BATCHES and query not in needed and self._cancel(query)
+        }
+        if not stale:
+            return
+        dropped = [title for title, query in self._fetches.items() if query in stale]
+        for title in dropped:
+            del self._fetches[title]
+        self.metrics.count("prefetch_dropped", len(dropped))
+
+    def iter_links_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        """
+        `(title, links)` of `titles` as each response of their queries
+        arrives (at once for those already received), the rest being
+        fetched now in queries of `MAX_TITLES` pages
+        """
+        if self.budget <= 0 or self._stop.is_set():  # Nothing to prefetch
+            yield from self.source.iter_links_batched(titles)
+            return
+
+        self._batch += 1
+        titles = list(dict.fromkeys(titles))
+        for title in titles:
+            self._pending.pop(title, None)  # About to be fetched anyway
+        queries = {title: self._fetches.pop(title) for title in titles if title in self._fetches}
+        self.metrics.count("prefetch_hits", len(queries))
+        self._drop_stale(set(queries.values()))
+
+        rest = [title for title in titles if title not in queries]
+        for i in range(0, len(rest), MAX_TITLES):
+            chunk = rest[i:i + MAX_TITLES]
+            queries.update(dict.fromkeys(chunk, self._start(chunk)))
+
+        # Titles of this batch in each query, and the no. of its responses searched
+        wanted: Dict[_Query, Set[str]] = {}
+        for title, query in queries.items():
+            wanted.setdefault(query, set()).add(title)
+        searched = dict.fromkeys(wanted, 0)
+        try:
+            while searched:
+                with self._changed:
+                    ready = []
+                    while not ready:
+                        ready = [
+                            (query, query.responses[count:], query.done)
+                            for query, count in searched.items()
+                            if query.done or len(query.responses) > count
+                        ]
+                        if not ready:
+                            self._changed.wait()
+
+                for query, responses, done in ready:
+                    searched[query] += len(responses)
+                    for title, links in responses:
+                        if title in wanted[query]:
+                            yield title, links
+                    if done:
+                        del searched[query]
+                        if query.error is not None:
+                            raise query.error
+                        if not query.complete:  # Abandoned by `cancel`
+                            yield from self.source.iter_links_batched(sorted(wanted[query]))
+        finally:  # Queries not needed by a later batch (e.g. the goal was found)
+            held = set(self._fetches.values())
+            for query in searched:
+                if query not in held:
+                    self._abandon(query)
+
+    def cancel(self) -> None:
+        """
+        Abandon every outstanding prefetch, and prefetch nothing more
+        """
+        self._stop.set()
+        for query in set(self._fetches.values()):
+            self._abandon(query)
+        self._fetches.clear()
+        self._pending.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,533 @@
+"""
+Long-running search service answering path queries over a local http/JSON
+api, so the http session pool, the cache of titles, links and redirects, the
+loaded wordnet and the similarity scores of recent destinations stay warm
+between queries instead of being rebuilt by a process per query
+
+Queries run concurrently, each on a thread of the http server, sharing one
+source whose fetches of the same page by concurrent queries are made only
+once (`SharedFetcher`). At most `max_queries` run at once and `max_waiting`
+wait for a turn, further queries being turned away, and each query gives up
+once its deadline has passed
+
+Run it with
+    python3 -m wikitas_tools.service [--port PORT] [--graph GRAPH_DIR] [--cache]
+and query it with
+    GET /path?start=START&dest=DEST[&method=METHOD][&timeout=SECONDS]
+    POST /path with a JSON object of the same fields
+    GET /stats for the no. of queries, cache hits, shared fetches, etc.
+"""
+import argparse
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from .cache import LinkCache, MemoryCache
+from .localgraph import LocalGraph
+from .metrics import NullMetrics, SearchMetrics, null_metrics
+from .pathfinding import (
+    find_path_best_first,
+    find_path_bidirectional,
+    find_path_simple_parallel,
+    find_path_wordmatching_parallel,
+)
+from .sources import CachedSource, LinkSource, default_source
+from .wikiapi import TitleNotFoundError
+from .word_utils import SimilarityScorer
+
+HOST = "127.0.0.1"
+PORT = 8080
+MAX_QUERIES = 8  # Queries searched at once
+MAX_WAITING = 32  # Queries waiting for a turn, before more are turned away
+QUERY_TIMEOUT = 60.0  # Max seconds of a query, waiting included
+MEMO_SIZE = 1_000_000  # Pages whose titles and links are kept in memory
+SCORERS_KEPT = 64  # Destinations whose similarity scores are kept
+
+# Searches a query can ask for, by name
+FINDERS: Dict[str, Callable[..., List[str]]] = {
+    "simple_parallel": find_path_simple_parallel,
+    "bidirectional": find_path_bidirectional,
+    "best_first": find_path_best_first,
+    "wordmatching_parallel": find_path_wordmatching_parallel,
+}
+DEFAULT_FINDER = "simple_parallel"
+WORD_MATCHING_FINDERS = (find_path_best_first, find_path_wordmatching_parallel)
+
+
+class OverloadedError(Exception):
+    """
+    Raised when a query is turned away as too many are already waiting
+    """
+
+
+class DeadlineExceededError(Exception):
+    """
+    Raised when a query is still waiting or searching at its deadline
+    """
+
+
+class SharedFetcher(LinkSource):
+    """
+    Layers over another link `source` so that concurrent fetches of the
+    links (or backlinks) of the same page are made once: a thread asking for
+    a page another thread is already fetching waits for that fetch instead,
+    counting "shared_fetches" in `metrics`
+
+    A page is handed over only once the fetch of the whole batch it was in
+    is complete, and a thread whose fetch is abandoned (e.g. by the caller
+    returning early) or fails leaves the threads waiting on it to fetch the
+    page themselves
+    """
+
+    def __init__(self, source: LinkSource, metrics: Optional[NullMetrics] = None):
+        self.source = source
+        self.metrics = metrics if metrics is not None else null_metrics
+        # (kind, title) -> the links, once fetched (None if the fetch didn't complete)
+        self._in_flight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def supports_backlinks(self) -> bool:
+        return self.source.supports_backlinks
+
+    def wikititle(self, title: str) -> str:
+        return self.source.wikititle(title)
+
+    def _iter_shared(
+        self,
+        kind: str,
+        query: Callable[[List[str]], Iterator[Tuple[str, List[str]]]],
+        titles: List[str]
+    ) -> Iterator[Tuple[str, List[str]]]:
+        """
+        `query` of the `titles` no other thread is fetching, streamed, then
+        the links of the rest as the threads fetching them complete
+        """
+        claimed = []
+        waiting: Dict[str, Future] = {}
+        with self._lock:
+            for title in dict.fromkeys(titles):
+                future = self._in_flight.get((kind, title))
+                if future is None:
+                    self._in_flight[(kind, title)] = Future()
+                    claimed.append(title)
+                else:
+                    waiting[title] = future
+        self.metrics.count("shared_fetches", len(waiting))
+
+        # Handed over before waiting on the others, so no 2 threads wait on each other
+        complete: Optional[Dict[str, List[str]]] = None
+        try:
+            if claimed:
+                links_by_title: Dict[str, List[str]] = {title: [] for title in claimed}
+                for title, links in query(claimed):
+                    links_by_title[title].extend(links)
+                    yield title, links
+                complete = links_by_title
+        finally:
+            with self._lock:
+                futures = [self._in_flight.pop((kind, title)) for title in claimed]
+            for title, future in zip(claimed, futures):
+                future.set_result(None if complete is None else complete[title])
+
+        abandoned = []
+        for title, future in waiting.items():
+            links = future.result()
+            if links is None:
+                abandoned.append(title)
+            else:
+                yield title, links
+        if abandoned:
+            yield from self._iter_shared(kind, query, abandoned)
+
+    def iter_links(self, title: str) -> Iterator[str]:
+        for _title, links in self.iter_links_batched([title]):
+            yield from links
+
+    def iter_links_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        return self._iter_shared("links", self.source.iter_links_batched, titles)
+
+    def iter_links_query(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        return self._iter_shared("links", self.source.iter_links_query, titles)
+
+    def iter_backlinks(self, title: str) -> Iterator[str]:
+        for _title, backlinks in self.iter_backlinks_batched([title]):
+            yield from backlinks
+
+    def iter_backlinks_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        return self._iter_shared("backlinks", self.source.iter_backlinks_batched, titles)
+
+    def get_redirects(self, title: str) -> List[str]:
+        return self.source.get_redirects(title)
+
+    def get_categories(self, title: str) -> List[str]:
+        return self.source.get_categories(title)
+
+
+class _DeadlineSource(LinkSource):
+    """
+    Link `source` (a `SharedFetcher`) of a single query, raising
+    `DeadlineExceededError` from any fetch made (or any response streamed)
+    after `deadline` (of `time.monotonic`)
+    """
+
+    def __init__(self, source: LinkSource, deadline: float):
+        self.source = source
+        self.deadline = deadline
+
+    @property
+    def supports_backlinks(self) -> bool:
+        return self.source.supports_backlinks
+
+    def _check(self) -> None:
+        if time.monotonic() >= self.deadline:
+            raise DeadlineExceededError("Query deadline exceeded")
+
+    def wikititle(self, title: str) -> str:
+        self._check()
+        return self.source.wikititle(title)
+
+    def iter_links(self, title: str) -> Iterator[str]:
+        for _title, links in self.iter_links_batched([title]):
+            yield from links
+
+    def _iter_checked(self, responses: Iterator[Tuple[str, List[str]]]) -> Iterator[Tuple[str, List[str]]]:
+        try:
+            for title, links in responses:
+                self._check()
+                yield title, links
+        finally:  # Abandon the fetch now, not once the error is freed
+            responses.close()
+
+    def iter_links_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        self._check()
+        return self._iter_checked(self.source.iter_links_batched(titles))
+
+    def iter_links_query(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        self._check()
+        return self._iter_checked(self.source.iter_links_query(titles))
+
+    def iter_backlinks(self, title: str) -> Iterator[str]:
+        for _title, backlinks in self.iter_backlinks_batched([title]):
+            yield from backlinks
+
+    def iter_backlinks_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        self._check()
+        return self._iter_checked(self.source.iter_backlinks_batched(titles))
+
+    def get_redirects(self, title: str) -> List[str]:
+        self._check()
+        return self.source.get_redirects(title)
+
+    def get_categories(self, title: str) -> List[str]:
+        self._check()
+        return self.source.get_categories(title)
+
+
+class SearchService:
+    """
+    Answers path queries concurrently from one warm `source` (the
+    wikipedia api by default): its titles, links and redirects are kept in
+    `cache` (the last `MEMO_SIZE` pages in memory by default) and
+    concurrent fetches of the same page are shared (`SharedFetcher`)
+
+    Attributes:
+    ----------
+    `source`: LinkSource
+        The cached, shared source every query searches
+    `metrics`: SearchMetrics
+        Totals of every query ("queries", "rejected", "timed_out", "errors"),
+        cache hits and shared fetches, and the no. of queries "in_flight"
+        and "waiting"
+    `max_queries`, `max_waiting`, `timeout`
+        Admission limits and the max seconds of each query
+
+    Methods:
+    -------
+    `search(start: str, dest: str, method: str, timeout: Optional[float])`: Dict[str, Any]
+        Find the path from `start` to `dest` by finder `method` (of `FINDERS`),
+        raising `OverloadedError` or `DeadlineExceededError` if it can't in time
+    `stats()`: Dict[str, Any]
+        `metrics.report()`
+    """
+
+    def __init__(
+        self,
+        source: Optional[LinkSource] = None,
+        cache: Optional[LinkCache] = None,
+        max_queries: Optional[int] = MAX_QUERIES,
+        max_waiting: Optional[int] = MAX_WAITING,
+        timeout: Optional[float] = QUERY_TIMEOUT
+    ):
+        if source is None:
+            source = default_source
+        if cache is None:
+            cache = MemoryCache(MEMO_SIZE)
+        self.metrics = SearchMetrics()
+        # Shared outside the cache, so a page is cached before the threads waiting on it are let go
+        self.source = SharedFetcher(CachedSource(source, cache, self.metrics), self.metrics)
+        self.max_queries = max_queries
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(max_queries)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        self._scorers: 'OrderedDict[Tuple[str, ...], SimilarityScorer]' = OrderedDict()
+
+    def _scorer(self, dest_words: List[str]) -> SimilarityScorer:
+        """
+        Scorer of `dest_words`, kept for the queries of the last
+        `SCORERS_KEPT` destinations so their scores stay cached
+        """
+        key = tuple(dest_words)
+        with self._lock:
+            scorer = self._scorers.get(key)
+            if scorer is not None:
+                self._scorers.move_to_end(key)
+                return scorer
+        scorer = SimilarityScorer(dest_words)
+        with self._lock:
+            self._scorers[key] = scorer
+            while len(self._scorers) > SCORERS_KEPT:
+                self._scorers.popitem(last=False)
+        return scorer
+
+    def _admit(self, deadline: float) -> None:
+        """
+        Wait for a turn to search until `deadline`, turning the query away if
+        `max_waiting` others are already waiting
+        """
+        with self._lock:
+            if self._waiting >= self.max_waiting:
+                self.metrics.count("rejected")
+                raise OverloadedError(f"{self._waiting} queries already waiting")
+            self._waiting += 1
+            self.metrics.gauge("waiting", self._waiting)
+        try:
+            admitted = self._slots.acquire(timeout=max(deadline - time.monotonic(), 0))
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                self.metrics.gauge("waiting", self._waiting)
+        if not admitted:
+            self.metrics.count("timed_out")
+            raise DeadlineExceededError("Query deadline exceeded while waiting for a turn")
+
+    def search(
+        self,
+        start: str,
+        dest: str,
+        method: Optional[str] = DEFAULT_FINDER,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Find the path from `start` to `dest` by the finder named `method`
+        within `timeout` seconds (at most the service's `timeout`)
+
+        Returns a dict of
+            "start", "dest", "method": the query as passed
+            "path": the path found (empty if none)
+            "found": whether a path was found
+            "seconds": seconds the query took, waiting included
+            "pages": no. of pages expanded
+
+        Raises:
+        ------
+        ValueError
+            If `method` isn't in `FINDERS`
+        OverloadedError
+            If too many queries are already waiting
+        DeadlineExceededError
+            If the query isn't answered within `timeout`
+        """
+        if method not in FINDERS:
+            raise ValueError(f"Unknown method '{method}', expected one of {', '.join(FINDERS)}")
+        finder = FINDERS[method]
+        start_time = time.monotonic()
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        deadline = start_time + timeout
+        self.metrics.count("queries")
+
+        self._admit(deadline)
+        with self._lock:
+            self._in_flight += 1
+            self.metrics.gauge("in_flight", self._in_flight)
+        try:
+            source = _DeadlineSource(self.source, deadline)
+            metrics = SearchMetrics()
+            if finder in WORD_MATCHING_FINDERS:
+                path = finder(start, dest, source=source, scorer_factory=self._scorer, metrics=metrics)
+            else:
+                path = finder(start, dest, source=source, metrics=metrics)
+        except DeadlineExceededError:
+            self.metrics.count("timed_out")
+            raise
+        except Exception:
+            self.metrics.count("errors")
+            raise
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._in_flight -= 1
+                self.metrics.gauge("in_flight", self._in_flight)
+
+        return {
+            "start": start,
+            "dest": dest,
+            "method": method,
+            "path": path,
+            "found": bool(path),
+            "seconds": time.monotonic() - start_time,
+            "pages": metrics.counts.get("pages", 0),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Totals of every query so far (see `metrics`)
+        """
+        return self.metrics.report()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Http handler of the api of `service` (set by `make_server`)
+    """
+
+    service: SearchService
+
+    def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    @staticmethod
+    def _parse_query(params: Dict[str, Any]) -> Tuple[str, str, str, Optional[float]]:
+        """
+        `(start, dest, method, timeout)` of the query `params`
+
+        Raises:
+        ------
+        ValueError
+            If a field is missing or invalid
+        """
+        for field in ("start", "dest"):
+            if not isinstance(params.get(field), str) or not params[field].strip():
+                raise ValueError(f"'{field}' must be a non-empty title")
+        method = params.get("method", DEFAULT_FINDER)
+        if method not in FINDERS:
+            raise ValueError(f"Unknown method '{method}', expected one of {', '.join(FINDERS)}")
+        timeout = params.get("timeout")
+        if timeout is not None:
+            try:
+                timeout = float(timeout)
+            except (TypeError, ValueError):
+                raise ValueError(f"'timeout' must be a no. of seconds, not '{timeout}'") from None
+            if not 0 < timeout < math.inf:
+                raise ValueError(f"'timeout' must be a positive no. of seconds, not {timeout}")
+        return params["start"], params["dest"], method, timeout
+
+    def _query(self, params: Dict[str, Any]) -> None:
+        """
+        Search the query `params` and send its result, or its error with the matching status
+        """
+        try:
+            start, dest, method, timeout = self._parse_query(params)
+        except ValueError as err:
+            self._send_json(400, {**params, "path": [], "found": False, "error": f"Bad query: {err}"})
+            return
+
+        try:
+            result = self.service.search(start, dest, method, timeout)
+        except TitleNotFoundError as err:
+            status, error = 404, str(err)
+        except OverloadedError as err:
+            status, error = 503, str(err)
+        except DeadlineExceededError as err:
+            status, error = 504, str(err)
+        except Exception as err:  # e.g. the api failing after every retry
+            status, error = 502, f"{type(err).__name__}: {err}"
+        else:
+            self._send_json(200, {**result, "error": None})
+            return
+        self._send_json(status, {**params, "path": [], "found": False, "error": error})
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path == "/path":
+            self._query({key: values[-1] for key, values in parse_qs(url.query).items()})
+        elif url.path == "/stats":
+            self._send_json(200, self.service.stats())
+        else:
+            self._send_json(404, {"error": f"No such endpoint {url.path}"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        if url.path != "/path":
+            self._send_json(404, {"error": f"No such endpoint {url.path}"})
+            return
+        try:
+            params = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if not isinstance(params, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as err:
+            self._send_json(400, {"error": f"Bad query: {err}"})
+            return
+        self._query(params)
+
+
+def make_server(
+    service: SearchService,
+    host: Optional[str] = HOST,
+    port: Optional[int] = PORT
+) -> ThreadingHTTPServer:
+    """
+    Http server of the api of `service` on `host`:`port`, answering each
+    connection on its own thread (call `serve_forever()` to start it)
+    """
+    handler = type("Handler", (_Handler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m wikitas_tools.service",
+        description="Serve path queries over a local http/JSON api, with caches kept warm between queries",
+    )
+    parser.add_argument("--host", default=HOST, help="Address to listen on")
+    parser.add_argument("--port", type=int, default=PORT, help="Port to listen on")
+    parser.add_argument("--graph", help="Search the offline graph in GRAPH_DIR instead of the wikipedia api")
+    parser.add_argument("--cache", action="store_true", help="Cache links on disk (~/.cache/wikitas) across runs")
+    parser.add_argument("--max-queries", type=int, default=MAX_QUERIES, help="Queries searched at once")
+    parser.add_argument("--max-waiting", type=int, default=MAX_WAITING, help="Queries waiting before more are turned away")
+    parser.add_argument("--timeout", type=float, default=QUERY_TIMEOUT, help="Max seconds of a query")
+    args = parser.parse_args()
+
+    service = SearchService(
+        LocalGraph(args.graph) if args.graph is not None else None,
+        LinkCache() if args.cache else None,
+        args.max_queries,
+        args.max_waiting,
+        args.timeout,
+    )
+    server = make_server(service, args.host, args.port)
+    print(f"Serving path queries on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Breadth first search split across worker processes, so fetching and parsing
+links and checking visited pages isn't limited to one core by the GIL
+
+Every title belongs to one worker (by the crc32 of the title), which keeps
+the visited pages and frontier of its titles. Each level, every worker
+fetches the links of its frontier and sends them on to the workers owning
+them, through the coordinator (the calling process), which detects the goal
+and rebuilds the path by asking the owners for the parent of each page
+"""
+import multiprocessing
+import os
+import pickle
+import traceback
+import zlib
+from typing import Any, Callable, List, Optional, Tuple
+from .metrics import NullMetrics, null_metrics
+from .sources import LinkSource, WikiApiSource
+
+# Workers are started fresh rather than forked, so they don't inherit the
+# caller's threads, http sessions or sqlite connections (e.g. a `LinkCache`)
+_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def shard_of(title: str, num_shards: int) -> int:
+    """
+    The shard (worker) `title` belongs to, the same in every process
+    """
+    return zlib.crc32(title.encode("utf-8")) % num_shards
+
+
+def _worker(conn, shard: int, num_shards: int, source_factory: Callable[[], LinkSource]) -> None:
+    """
+    Main loop of a worker process, answering the commands of `ShardedSearcher`
+    """
+    source = source_factory()
+    parents = {}  # Title -> title of the page it was found on (None for the start)
+    frontier: List[str] = []
+    goal = frozenset()  # The dest and the titles redirecting to it
+
+    while True:
+        command, *args = conn.recv()
+        if command == "stop":
+            break
+
+        try:
+            if command == "start":
+                start, goal = args
+                parents = {}
+                frontier = []
+                if shard_of(start, num_shards) == shard:
+                    parents[start] = None
+                    frontier = [start]
+                reply = len(frontier)
+
+            elif command == "expand":
+                # Links of the frontier, bucketed by the shard owning them
+                # (pickled here, so the coordinator only passes bytes on)
+                buckets = [{} for _ in range(num_shards)]
+                found = None
+                for title, links in source.iter_links_batched(frontier):
+                    if not goal.isdisjoint(links):
+                        found = title
+                        break
+                    for link in links:
+                        bucket = buckets[shard_of(link, num_shards)]
+                        if link not in bucket:
+                            bucket[link] = title
+
+                reply = (
+                    found,
+                    len(frontier),
+                    [pickle.dumps(bucket, pickle.HIGHEST_PROTOCOL) for bucket in buckets],
+                )
+
+            elif command == "add":
+                frontier = []
+                for blob in args[0]:
+                    for link, parent in pickle.loads(blob).items():
+                        if link not in parents:  # Not visited
+                            parents[link] = parent
+                            frontier.append(link)
+                reply = len(frontier)
+
+            elif command == "parent":
+                reply = parents.get(args[0])
+
+            else:
+                raise ValueError(f"Unknown command {command}")
+
+            conn.send(("ok", reply))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+
+
+class ShardedSearcher:
+    """
+    Pool of `workers` (default no. of cpus) worker processes running breadth
+    first searches together, each getting links from its own
+    `source_factory()` (the wikipedia api by default), kept running between
+    searches. `source_factory` must be picklable, e.g. a class or
+    `functools.partial(LocalGraph, graph_dir)`
+
+    Use as a context manager:
+        with ShardedSearcher(workers=32) as searcher:
+            path = searcher.find_path(start, dest)
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        source_factory: Optional[Callable[[], LinkSource]] = WikiApiSource
+    ):
+        self.num_shards = workers or os.cpu_count() or 1
+        self.source_factory = source_factory
+        self._source: Optional[LinkSource] = None  # For resolving titles
+        self._conns = []
+        self._processes = []
+
+        for shard in range(self.num_shards):
+            parent_conn, child_conn = _CONTEXT.Pipe()
+            process = _CONTEXT.Process(
+                target=_worker,
+                args=(child_conn, shard, self.num_shards, source_factory),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+
+    def __enter__(self) -> 'ShardedSearcher':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        Stop the worker processes
+        """
+        for conn in self._conns:
+            try:
+                conn.send(("stop",))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join()
+        self._conns = []
+        self._processes = []
+
+    def _recv(self, shard: int) -> Any:
+        status, reply = self._conns[shard].recv()
+        if status == "error":
+            raise RuntimeError(f"Worker {shard} failed:\n{reply}")
+        return reply
+
+    def _broadcast(self, messages: List[Tuple]) -> List[Any]:
+        """
+        Send each worker its message, then wait for all of their replies
+        """
+        for conn, message in zip(self._conns, messages):
+            conn.send(message)
+        return [self._recv(shard) for shard in range(self.num_shards)]
+
+    def _path(self, title: str) -> List[str]:
+        """
+        The path from the start to `title`, following parents through their owners
+        """
+        path = []
+        while title is not None:
+            path.append(title)
+            shard = shard_of(title, self.num_shards)
+            self._conns[shard].send(("parent", title))
+            title = self._recv(shard)
+
+        path.reverse()  # Convert to start first (correct order)
+        return path
+
+    def find_path(self, start: str, dest: str, metrics: Optional[NullMetrics] = None) -> List[str]:
+        """
+        `find_path_simple_parallel()` from `start` to `dest` on the workers
+        """
+        if metrics is None:
+            metrics = null_metrics
+        if self._source is None:
+            self._source = self.source_factory()
+        with metrics.timer("title"):
+            start = self._source.wikititle(start)
+            dest = self._source.wikititle(dest)
+            goal = frozenset([dest, *self._source.get_redirects(dest)])
+        if start == dest:
+            return []
+
+        print(f"Finding path from {start} to {dest}")
+        sizes = self._broadcast([("start", start, goal)] * self.num_shards)
+        depth = 0
+
+        while sum(sizes):
+            metrics.observe("depth", depth)
+            metrics.observe("frontier_size", sum(sizes))
+            replies = self._broadcast([("expand",)] * self.num_shards)
+            metrics.count("pages", sum(expanded for _found, expanded, _buckets in replies))
+
+            # A level is expanded at once, so any path found is a shortest path
+            for found, _expanded, _buckets in replies:
+                if found is not None:
+                    metrics.finish()
+                    return [*self._path(found), dest]
+
+            # Send each worker the links it owns from every worker
+            sizes = self._broadcast([
+                ("add", [buckets[shard] for _found, _expanded, buckets in replies])
+                for shard in range(self.num_shards)
+            ])
+            depth += 1
+
+        metrics.finish()
+        return []
+
+
+def find_path_sharded(
+    start: str,
+    dest: str,
+    workers: Optional[int] = None,
+    source_factory: Optional[Callable[[], LinkSource]] = WikiApiSource,
+    metrics: Optional[NullMetrics] = None
+) -> List[str]:
+    """
+    Finds the shortest path from `start` to `dest` using a breadth first
+    search split across `workers` processes (see `ShardedSearcher`)
+    """
+    with ShardedSearcher(workers, source_factory) as searcher:
+        return searcher.find_path(start, dest, metrics)
@@ -0,0 +1,293 @@
+"""
+Link sources the pathfinding functions get wikipedia titles and links from,
+so the live api, caches, offline graphs and test fixtures are interchangeable
+"""
+import asyncio
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .cache import LinkCache, cached_query
+from .metrics import NullMetrics, null_metrics
+from .asyncapi import AsyncLinkFetcher
+from .wikiapi import WikiApi, TitleNotFoundError, default_api, MAX_THREADS
+
+
+class LinkSource:
+    """
+    Where the pathfinding functions get wikipedia titles and links from
+
+    Subclasses implement `wikititle` and `iter_links`, and `iter_backlinks` if
+    they set `supports_backlinks`. Every other method has a default in terms of
+    those, which subclasses override when they can do better (e.g. by batching
+    many titles into one http req)
+
+    Attributes:
+    ----------
+    `supports_backlinks`: bool
+        Whether `iter_backlinks` (and so `find_path_bidirectional`) is supported
+
+    Methods:
+    -------
+    `wikititle(title: str)`: str
+        Convert `title` to an existing title, raising `TitleNotFoundError` if none
+    `iter_links(title: str)` / `get_links(title: str)`
+        Links from page `title`, streamed / as a list
+    `iter_links_batched(titles: List[str])` / `get_links_batched(titles: List[str])`
+        `(title, links)` of many pages, streamed / as a dict
+    `iter_links_query(titles: List[str])`
+        `(title, links)` of up to `MAX_TITLES` pages, streamed from a single
+        query on the calling thread where the source batches titles
+    `iter_backlinks(title: str)`, `get_backlinks(title: str)`, `iter_backlinks_batched(titles: List[str])`
+        The same for pages linking to `title`
+    `get_redirects(title: str)`: List[str]
+        Titles redirecting to page `title` (empty if unknown, or if links
+        to redirects are already resolved to their target)
+    `get_categories(title: str)`: List[str]
+        Categories of page `title` (empty if unknown)
+    `async_fetcher(concurrency: int, rps: Optional[float])`
+        Async context manager fetching links (see `AsyncLinkFetcher`)
+    """
+
+    supports_backlinks = False
+
+    def wikititle(self, title: str) -> str:
+        raise NotImplementedError
+
+    def iter_links(self, title: str) -> Iterator[str]:
+        raise NotImplementedError
+
+    def get_links(self, title: str) -> List[str]:
+        return list(self.iter_links(title))
+
+    def iter_links_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        for title in titles:
+            yield title, self.get_links(title)
+
+    def iter_links_query(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        return self.iter_links_batched(titles)
+
+    def get_links_batched(self, titles: List[str]) -> Dict[str, List[str]]:
+        links_by_title: Dict[str, List[str]] = {title: [] for title in titles}
+        for title, links in self.iter_links_batched(titles):
+            links_by_title[title].extend(links)
+        return links_by_title
+
+    def iter_backlinks(self, title: str) -> Iterator[str]:
+        raise NotImplementedError(f"{type(self).__name__} doesn't support backlinks")
+
+    def get_backlinks(self, title: str) -> List[str]:
+        return list(self.iter_backlinks(title))
+
+    def iter_backlinks_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        for title in titles:
+            yield title, self.get_backlinks(title)
+
+    def get_redirects(self, title: str) -> List[str]:
+        return []
+
+    def get_categories(self, title: str) -> List[str]:
+        return []
+
+    def async_fetcher(
+        self,
+        concurrency: int = MAX_THREADS,
+        rps: Optional[float] = None
+    ) -> 'SourceFetcher':
+        return SourceFetcher(self)
+
+
+class SourceFetcher:
+    """
+    Async link fetcher with the same interface as `AsyncLinkFetcher`
+    for sources without async http reqs, running `source.get_links_batched`
+    on the event loop's default thread pool
+    """
+
+    def __init__(self, source: LinkSource):
+        self.source = source
+
+    async def __aenter__(self) -> 'SourceFetcher':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+    async def fetch_links(
+        self,
+        titles: List[str],
+        continue_params: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Tuple[str, List[str]]], None]:
+        loop = asyncio.get_running_loop()
+        links_by_title = await loop.run_in_executor(None, self.source.get_links_batched, titles)
+        return list(links_by_title.items()), None
+
+
+class WikiApiSource(LinkSource):
+    """
+    Links from the live MediaWiki api of `api` (`default_api`, the english
+    wikipedia, by default), batched and on parallel threads
+    """
+
+    supports_backlinks = True
+
+    def __init__(self, api: Optional[WikiApi] = None):
+        self.api = api if api is not None else default_api
+
+    def wikititle(self, title: str) -> str:
+        return self.api.wikititle(title)
+
+    def iter_links(self, title: str) -> Iterator[str]:
+        return self.api.iter_links(title)
+
+    def iter_links_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        return self.api.iter_links_batched(titles)
+
+    def iter_links_query(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        return self.api.iter_links_query(titles)
+
+    def iter_backlinks(self, title: str) -> Iterator[str]:
+        return self.api.iter_backlinks(title)
+
+    def iter_backlinks_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        return self.api.iter_backlinks_batched(titles)
+
+    def get_redirects(self, title: str) -> List[str]:
+        return self.api.get_redirects(title)
+
+    def get_categories(self, title: str) -> List[str]:
+        return self.api.get_categories(title)
+
+    def async_fetcher(
+        self,
+        concurrency: int = MAX_THREADS,
+        rps: Optional[float] = None
+    ) -> AsyncLinkFetcher:
+        return AsyncLinkFetcher(concurrency, rps, self.api)
+
+
+class CachedSource(LinkSource):
+    """
+    Layers the on-disk `cache` over another link `source`, so only titles
+    missing from the cache reach `source`, counting cache hits in `metrics`
+    Entries are keyed by title alone, so a cache shared with other sources
+    (e.g. of another wiki) should be passed as a `scoped` view
+    """
+
+    def __init__(self, source: LinkSource, cache: LinkCache, metrics: Optional[NullMetrics] = None):
+        self.source = source
+        self.cache = cache
+        self.metrics = metrics if metrics is not None else null_metrics
+
+    @property
+    def supports_backlinks(self) -> bool:
+        return self.source.supports_backlinks
+
+    def wikititle(self, title: str) -> str:
+        cached = self.cache.get("title", title)
+        self.metrics.count("cache_hits" if cached is not None else "cache_misses")
+        if cached is None:
+            cached = self.source.wikititle(title)
+            self.cache.set("title", title, cached)
+        return cached
+
+    def _query_links(self, titles: List[str]) -> Iterator[Dict[str, List[str]]]:
+        for title, links in self.source.iter_links_batched(titles):
+            yield {title: links}
+
+    def _query_links_once(self, titles: List[str]) -> Iterator[Dict[str, List[str]]]:
+        for title, links in self.source.iter_links_query(titles):
+            yield {title: links}
+
+    def _query_backlinks(self, titles: List[str]) -> Iterator[Dict[str, List[str]]]:
+        for title, backlinks in self.source.iter_backlinks_batched(titles):
+            yield {title: backlinks}
+
+    def iter_links(self, title: str) -> Iterator[str]:
+        for _title, links in self.iter_links_batched([title]):
+            yield from links
+
+    def iter_links_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        for batch_links in cached_query(self.cache, "links", self._query_links, titles, self.metrics):
+            yield from batch_links.items()
+
+    def iter_links_query(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        for batch_links in cached_query(self.cache, "links", self._query_links_once, titles, self.metrics):
+            yield from batch_links.items()
+
+    def iter_backlinks(self, title: str) -> Iterator[str]:
+        for _title, backlinks in self.iter_backlinks_batched([title]):
+            yield from backlinks
+
+    def iter_backlinks_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        for batch_backlinks in cached_query(
+            self.cache, "backlinks", self._query_backlinks, titles, self.metrics
+        ):
+            yield from batch_backlinks.items()
+
+    def get_redirects(self, title: str) -> List[str]:
+        cached = self.cache.get("redirects", title)
+        self.metrics.count("cache_hits" if cached is not None else "cache_misses")
+        if cached is None:
+            cached = self.source.get_redirects(title)
+            self.cache.set("redirects", title, cached)
+        return cached
+
+    def get_categories(self, title: str) -> List[str]:
+        cached = self.cache.get("categories", title)
+        self.metrics.count("cache_hits" if cached is not None else "cache_misses")
+        if cached is None:
+            cached = self.source.get_categories(title)
+            self.cache.set("categories", title, cached)
+        return cached
+
+
+class MemorySource(LinkSource):
+    """
+    In-memory link graph of title -> links (and optionally title -> categories,
+    and redirect -> title of the page it leads to, which links may name like
+    on wikipedia), e.g. as a deterministic fixture for tests and benchmarks
+    """
+
+    supports_backlinks = True
+
+    def __init__(
+        self,
+        links: Dict[str, List[str]],
+        categories: Optional[Dict[str, List[str]]] = None,
+        redirects: Optional[Dict[str, str]] = None
+    ):
+        self.links = links
+        self.categories = categories if categories is not None else {}
+        self.redirects = redirects if redirects is not None else {}
+        self.backlinks: Dict[str, List[str]] = {}
+        for title, page_links in links.items():
+            for link in page_links:
+                # Links through a redirect are backlinks of its page
+                self.backlinks.setdefault(self.redirects.get(link, link), []).append(title)
+        self._redirects_to: Dict[str, List[str]] = {}
+        for redirect, title in self.redirects.items():
+            self._redirects_to.setdefault(title, []).append(redirect)
+        self._titles = {redirect.lower(): title for redirect, title in self.redirects.items()}
+        self._titles.update({title.lower(): title for title in links})
+
+    def wikititle(self, title: str) -> str:
+        title = title.replace("_", " ")
+        title = self.redirects.get(title, title)
+        if title in self.links:
+            return title
+        if title.lower() in self._titles:
+            return self._titles[title.lower()]
+        raise TitleNotFoundError(title, [])
+
+    def iter_links(self, title: str) -> Iterator[str]:
+        return iter(self.links.get(self.redirects.get(title, title), []))
+
+    def iter_backlinks(self, title: str) -> Iterator[str]:
+        return iter(self.backlinks.get(title, []))
+
+    def get_redirects(self, title: str) -> List[str]:
+        return self._redirects_to.get(title, [])
+
+    def get_categories(self, title: str) -> List[str]:
+        return self.categories.get(title, [])
+
+
+default_source = WikiApiSource()
@@ -0,0 +1,298 @@
+"""
+Search structures with bounded memory use, which keep most of their contents
+on disk, for `find_path_bounded`
+"""
+import os
+import sqlite3
+import tempfile
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Max no. of host parameters in an sqlite statement (999 before sqlite 3.32)
+_SQL_PARAMS = 900
+
+
+class SpillQueue:
+    """
+    First in first out queue of ints (e.g. node ids) keeping at most
+    about 2 * `chunk_size` of them in memory, the rest in files in `directory`
+
+    Methods:
+    -------
+    `append(item: int)` / `extend(items: Iterable[int])`
+        Add to the back of the queue
+    `popleft()`: int
+        Remove and return the front of the queue
+    `close()`
+        Delete the spilled files
+    """
+
+    def __init__(self, directory: str, chunk_size: int = 65536):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self._head: deque = deque()  # Front of the queue
+        self._tail = array("i")  # Back of the queue, spilled once full
+        self._chunks: deque = deque()  # Paths of spilled chunks, oldest first
+        self._spilled = 0  # No. of items in spilled chunks
+        self._next_chunk = 0
+
+    def __len__(self) -> int:
+        return len(self._head) + self._spilled + len(self._tail)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def append(self, item: int) -> None:
+        self._tail.append(item)
+        if len(self._tail) >= self.chunk_size:
+            self._spill()
+
+    def extend(self, items: Iterable[int]) -> None:
+        for item in items:
+            self.append(item)
+
+    def _spill(self) -> None:
+        """
+        Write the back of the queue to a new chunk file
+        """
+        path = os.path.join(self.directory, f"queue-{self._next_chunk}.bin")
+        self._next_chunk += 1
+        with open(path, "wb") as chunk_file:
+            self._tail.tofile(chunk_file)
+
+        self._chunks.append(path)
+        self._spilled += len(self._tail)
+        self._tail = array("i")
+
+    def popleft(self) -> int:
+        if not self._head:
+            if self._chunks:  # Read back the oldest chunk
+                path = self._chunks.popleft()
+                chunk = array("i")
+                with open(path, "rb") as chunk_file:
+                    chunk.frombytes(chunk_file.read())
+                os.remove(path)
+                self._spilled -= len(chunk)
+                self._head.extend(chunk)
+            else:
+                self._head.extend(self._tail)
+                self._tail = array("i")
+
+        return self._head.popleft()
+
+    def close(self) -> None:
+        for path in self._chunks:
+            os.remove(path)
+        self._chunks.clear()
+
+
+class BloomFilter:
+    """
+    Set of strings that may wrongly say it contains a string it doesn't
+    (with a probability of about 1% at `capacity` strings), but never the opposite,
+    in 10 bits per string of `capacity`
+
+    Uses python's (per-process) string hashes, so can't be saved and reloaded
+    """
+
+    HASHES = 7
+
+    def __init__(self, capacity: int):
+        self.num_bits = max(64, capacity * 10)
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str) -> List[int]:
+        # Double hashing from the two halves of one 64 bit hash
+        item_hash = hash(item) & 0xFFFFFFFFFFFFFFFF
+        hash_1 = item_hash & 0xFFFFFFFF
+        hash_2 = (item_hash >> 32) | 1
+        return [(hash_1 + i * hash_2) % self.num_bits for i in range(self.HASHES)]
+
+    def add(self, item: str) -> None:
+        bits = self._bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class DiskSearchTree:
+    """
+    Tree of the pages found by a search, like `SearchTree`, kept in memory
+    until it has more than `memory_nodes` nodes, then in an sqlite database
+    in `directory`, with a `BloomFilter` in memory so most new titles are
+    known to be new without reading the database
+
+    Each node also stores its depth (no. of links from the root)
+
+    Methods:
+    -------
+    `add_many(titles: List[str], parent: int, depth: int)`: List[int]
+        Adds the titles in `titles` not already in the tree as children
+        of node `parent` (at depth `depth`), returning their ids
+    `nodes(ids: List[int])`: Dict[int, Tuple[str, int]]
+        Returns the title and depth of each node in `ids`
+    `path(node: int)`: List[str]
+        Returns the titles from the root to node `node` (inclusive)
+    `close()`
+        Close (and delete) the database, if spilled
+    """
+
+    def __init__(
+        self,
+        root: str,
+        directory: str,
+        memory_nodes: Optional[int] = 65536,
+        expected_nodes: int = 10_000_000,
+        cache_kib: int = 16384
+    ):
+        self.db_path = os.path.join(directory, "tree.sqlite3")
+        self.memory_nodes = memory_nodes
+        self.expected_nodes = expected_nodes
+        self.cache_kib = cache_kib
+        self._conn: Optional[sqlite3.Connection] = None  # Once spilled
+        self._bloom: Optional[BloomFilter] = None
+        self._size = 0
+
+        # Until spilled: title -> node id, and the title, parent and depth of each node
+        self._ids: Dict[str, int] = {}
+        self._titles: List[str] = []
+        self._parents = array("i")
+        self._depths = array("i")
+        self._add_rows([(root, -1, 0)])
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _spill(self) -> None:
+        """
+        Move the tree to the database, for the rest of the search
+        """
+        self._conn = sqlite3.connect(self.db_path)
+        # Temporary data, so no journal or syncing, and a bounded page cache
+        self._conn.execute("PRAGMA journal_mode = OFF")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        self._conn.execute(f"PRAGMA cache_size = -{self.cache_kib}")
+        self._conn.execute(
+            "CREATE TABLE nodes ("
+            "id INTEGER PRIMARY KEY, title TEXT NOT NULL UNIQUE, "
+            "parent INTEGER NOT NULL, depth INTEGER NOT NULL)"
+        )
+        self._bloom = BloomFilter(max(self.expected_nodes, self._size))
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO nodes (id, title, parent, depth) VALUES (?, ?, ?, ?)",
+                zip(range(self._size), self._titles, self._parents, self._depths),
+            )
+        for title in self._titles:
+            self._bloom.add(title)
+
+        self._ids.clear()
+        self._titles = []
+        self._parents = array("i")
+        self._depths = array("i")
+
+    def _add_rows(self, rows: List[Tuple[str, int, int]]) -> List[int]:
+        ids = list(range(self._size, self._size + len(rows)))
+        if self._conn is None:
+            for node, (title, parent, depth) in zip(ids, rows):
+                self._ids[title] = node
+                self._titles.append(title)
+                self._parents.append(parent)
+                self._depths.append(depth)
+        else:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT INTO nodes (id, title, parent, depth) VALUES (?, ?, ?, ?)",
+                    [(node, *row) for node, row in zip(ids, rows)],
+                )
+            for title, _parent, _depth in rows:
+                self._bloom.add(title)
+        self._size += len(rows)
+
+        if self._conn is None and self.memory_nodes is not None and self._size > self.memory_nodes:
+            self._spill()
+        return ids
+
+    def _existing(self, titles: List[str]) -> set:
+        """
+        The titles in `titles` already in the tree
+        """
+        if self._conn is None:
+            return {title for title in titles if title in self._ids}
+
+        maybe_existing = [title for title in titles if title in self._bloom]
+        existing = set()
+        for i in range(0, len(maybe_existing), _SQL_PARAMS):
+            chunk = maybe_existing[i:i + _SQL_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            existing.update(
+                title for title, in self._conn.execute(
+                    f"SELECT title FROM nodes WHERE title IN ({placeholders})", chunk
+                )
+            )
+        return existing
+
+    def add_many(self, titles: List[str], parent: int, depth: int) -> List[int]:
+        """
+        Adds the titles in `titles` not already in the tree as children of
+        node `parent` (at depth `depth`), returning the ids of the new nodes
+        """
+        titles = list(dict.fromkeys(titles))  # No duplicates
+        existing = self._existing(titles)
+        return self._add_rows([
+            (title, parent, depth + 1) for title in titles if title not in existing
+        ])
+
+    def nodes(self, ids: List[int]) -> Dict[int, Tuple[str, int]]:
+        """
+        Returns the title and depth of each node in `ids`
+        """
+        if self._conn is None:
+            return {node: (self._titles[node], self._depths[node]) for node in ids}
+
+        found: Dict[int, Tuple[str, int]] = {}
+        for i in range(0, len(ids), _SQL_PARAMS):
+            chunk = ids[i:i + _SQL_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            for node, title, depth in self._conn.execute(
+                f"SELECT id, title, depth FROM nodes WHERE id IN ({placeholders})", chunk
+            ):
+                found[node] = (title, depth)
+        return found
+
+    def path(self, node: int) -> List[str]:
+        """
+        Returns the titles from the root to node `node` (inclusive)
+        """
+        path = []
+        while node != -1:
+            if self._conn is None:
+                title, node = self._titles[node], self._parents[node]
+            else:
+                title, node = self._conn.execute(
+                    "SELECT title, parent FROM nodes WHERE id = ?", (node,)
+                ).fetchone()
+            path.append(title)
+
+        path.reverse()  # Convert to root first (correct order)
+        return path
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            os.remove(self.db_path)
+
+
+def spill_directory(directory: Optional[str] = None) -> tempfile.TemporaryDirectory:
+    """
+    Temporary directory (in `directory`, or the system temp directory if None)
+    for the files of a `SpillQueue` and `DiskSearchTree`, deleted when closed
+    """
+    return tempfile.TemporaryDirectory(prefix="wikitas-", dir=directory)
@@ -0,0 +1,296 @@
+"""
+Resilient http transport for the wikipedia api: timeouts on every req, retries
+with jittered exponential backoff (honouring `Retry-After` and `maxlag`), and
+a limit on the no. of reqs in flight adapted to the latency and errors seen
+
+`requests` is only imported once the first req is made, so searches that
+never use the wikipedia api (e.g. of a `LocalGraph`) don't pay for it
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Any, Dict, Mapping, Optional, Tuple
+from .metrics import NullMetrics, null_metrics
+
+if TYPE_CHECKING:
+    import requests
+
+# Statuses worth retrying: rate limited, or a (usually brief) server error
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class RetryError(Exception):
+    """
+    Raised when an http req still fails after all of its retries
+    """
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a `Retry-After` header (either seconds or an http date)
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def new_session(pool_size: int = 32) -> 'requests.Session':
+    """
+    Returns a session keeping up to `pool_size` connections open (one per
+    req in flight), with no retries of its own (see `Transport`)
+    """
+    import requests
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class AdaptiveLimiter:
+    """
+    Limit on the no. of http reqs in flight, adapted like tcp congestion
+    control (AIMD): each fast success raises the limit by 1 / limit (so by about
+    1 per round trip of a full window), and each failed or throttled req, or
+    an average latency above `slow_factor` times the fastest seen (and above
+    `min_slow_latency` seconds, so small jitter of fast reqs doesn't count),
+    multiplies it by `decrease`, at most once per round trip so a burst of
+    errors counts once
+
+    Attributes:
+    ----------
+    `limit`: float
+        Current max no. of reqs in flight, between `min_limit` and `max_limit`
+    `in_flight`: int
+        No. of reqs in flight
+    `latency`: Optional[float]
+        Moving average of the latency of successful reqs (seconds)
+    `min_latency`: Optional[float]
+        Lowest latency of a successful req (seconds)
+
+    Methods:
+    -------
+    `acquire()` / `release()`
+        Wait for and take / give back a slot for a req
+    `record(latency: float, ok: bool)`
+        Adapt the limit to the outcome of a req
+    """
+
+    def __init__(
+        self,
+        max_limit: int = 32,
+        min_limit: int = 1,
+        initial: Optional[int] = None,
+        decrease: float = 0.5,
+        slow_factor: float = 4.0,
+        min_slow_latency: float = 1.0
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial if initial is not None else max_limit)
+        self.decrease = decrease
+        self.slow_factor = slow_factor
+        self.min_slow_latency = min_slow_latency
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.min_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def record(self, latency: float, ok: bool) -> None:
+        """
+        Adapt the limit to a req that took `latency` seconds,
+        `ok` False if it failed, timed out or was throttled
+        """
+        with self._condition:
+            if ok:
+                if self.latency is None:
+                    self.latency = self.min_latency = latency
+                else:
+                    self.latency = 0.8 * self.latency + 0.2 * latency
+                    self.min_latency = min(self.min_latency, latency)
+
+                if self.latency <= max(self.slow_factor * self.min_latency, self.min_slow_latency):
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                    self._condition.notify_all()
+                    return
+
+            now = time.monotonic()
+            if now - self._last_decrease >= (self.latency or 0.0):
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+
+
+class Transport:
+    """
+    Makes the http GET reqs of a `WikiApi` through `session` (by default a
+    `new_session` with a connection per req in flight, opened on first use),
+    each with a `timeout` of (connect, read) seconds and at most
+    `limiter.limit` in flight, retrying connection errors, timeouts, 429 / 5xx
+    responses and `maxlag` errors up to `max_retries` times after a jittered
+    exponential backoff (of up to `backoff` * 2^retry seconds, or as long as
+    `Retry-After` asks), capped at `max_backoff` seconds
+
+    Sends `maxlag` (seconds) with every req, so the api turns reqs away while
+    its database replicas lag instead of adding to their load (None to not)
+
+    Records the "backoff" time, the "retries" and "throttled" counts, and the
+    "concurrency_limit" and "latency" gauges in the `metrics` of each req
+    """
+
+    def __init__(
+        self,
+        session: Optional['requests.Session'] = None,
+        timeout: Optional[Tuple[float, float]] = (5.0, 30.0),
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 60.0,
+        maxlag: Optional[int] = 5,
+        limiter: Optional[AdaptiveLimiter] = None
+    ):
+        self._session = session
+        self._session_lock = threading.Lock()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.maxlag = maxlag
+        self.limiter = limiter if limiter is not None else AdaptiveLimiter()
+
+    @property
+    def session(self) -> 'requests.Session':
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = new_session(self.limiter.max_limit)
+        return self._session
+
+    def request_params(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        `params` with `maxlag` added
+        """
+        if self.maxlag is None:
+            return params
+        return {**params, "maxlag": self.maxlag}
+
+    @staticmethod
+    def is_throttled(status_code: int, headers: Mapping[str, str]) -> bool:
+        """
+        Whether a response asks the client to slow down
+        """
+        return status_code == 429 or headers.get("MediaWiki-API-Error") == "maxlag"
+
+    def should_retry(self, status_code: int, headers: Mapping[str, str]) -> bool:
+        """
+        Whether a response is a transient error worth retrying
+        """
+        return status_code in RETRY_STATUSES or self.is_throttled(status_code, headers)
+
+    def retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """
+        Seconds to wait before retrying after failed attempt no. `attempt`
+        (from 0): a random time up to the exponential backoff ("full jitter",
+        so retries of many reqs failing at once are spread out), or
+        `retry_after` (a `Retry-After` header) if longer
+        """
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        asked = _retry_after_seconds(retry_after)
+        if asked is not None:
+            delay = max(delay, min(asked, self.max_backoff))
+        return delay
+
+    def record(self, latency: float, ok: bool, metrics: NullMetrics = null_metrics) -> None:
+        """
+        Adapt the limiter to the outcome of a req, and report its state in `metrics`
+        """
+        self.limiter.record(latency, ok)
+        if metrics.enabled:
+            metrics.gauge("concurrency_limit", self.limiter.limit)
+            if self.limiter.latency is not None:
+                metrics.gauge("latency", self.limiter.latency)
+
+    def failed(
+        self,
+        attempt: int,
+        error: Exception,
+        retry_after: Optional[str] = None,
+        metrics: NullMetrics = null_metrics
+    ) -> float:
+        """
+        Returns the seconds to wait before retrying after failed attempt
+        no. `attempt` (from 0) with `error`
+
+        Raises:
+        ------
+            `RetryError` - if there are no retries left
+        """
+        if attempt >= self.max_retries:
+            raise RetryError(f"Http req failed after {attempt + 1} attempts: {error}") from error
+        metrics.count("retries")
+        return self.retry_delay(attempt, retry_after)
+
+    def get(
+        self,
+        url: str,
+        params: Dict[str, Any],
+        metrics: NullMetrics = null_metrics
+    ) -> 'requests.Response':
+        """
+        GET `url` with `params`, retrying transient errors
+
+        Raises:
+        ------
+            `RetryError` - if the req still fails after `max_retries` retries
+            `requests.HTTPError` - for other error statuses (e.g. 404), which aren't retried
+        """
+        import requests
+        session = self.session
+        params = self.request_params(params)
+        attempt = 0
+        while True:
+            res, retry_after = None, None
+            self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                res = session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as err:
+                error: Exception = err
+            finally:
+                self.limiter.release()
+            latency = time.monotonic() - start
+
+            if res is not None:
+                if not self.should_retry(res.status_code, res.headers):
+                    self.record(latency, True, metrics)
+                    res.raise_for_status()
+                    return res
+
+                if self.is_throttled(res.status_code, res.headers):
+                    metrics.count("throttled")
+                retry_after = res.headers.get("Retry-After")
+                error = requests.HTTPError(f"{res.status_code} response from {url}", response=res)
+
+            self.record(latency, False, metrics)
+            delay = self.failed(attempt, error, retry_after, metrics)
+            with metrics.timer("backoff"):
+                time.sleep(delay)
+            attempt += 1
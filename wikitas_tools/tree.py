@@ -1,62 +1,114 @@
 """
-Simplified Tree data structure for wiki pathfinding
+Compact tree data structure for wiki pathfinding
 """
-from typing import Any, Optional, List
+from array import array
+from typing import Dict, Iterable, List, Optional
 
 
-class Tree:
+class SearchTree:
     """
-    Simplified Tree data structure for wikipedia speedrunning purposes
+    Compact tree of the pages found by a search, where each title is interned
+    to an integer id (in order of discovery) and each id stores its parent's id
+    Also acts as the visited set of the search
 
     Attributes:
     ----------
-    `root`: str
-        The title of the page link in the case of wikipedia
-    `parent`: Tree
-        The parent node (Tree)
-    `children`: List[Tree]
-        The children of Tree
+    `titles`: List[str]
+        The title of each node, indexed by node id
+    `parents`: array
+        The id of the parent of each node, indexed by node id (-1 for the root)
 
     Methods:
     -------
-    `add_child(child: Tree)`: None
-        Adds child to the root of the Tree
-    `parents()` : List[str]
-        Returns the list of (titles/roots of) parents of the root node (Tree)
-        from furthest to closest in depth, not including itself
+    `add(title: str, parent: int)`: Optional[int]
+        Adds `title` as a child of node `parent`, returning its id, or
+        None if `title` is already in the tree
+    `add_many(titles: Iterable[str], parent: int)`: List[int]
+        Adds the titles in `titles` not already in the tree as children
+        of node `parent`, returning their ids
+    `id_of(title: str)`: Optional[int]
+        Returns the id of `title`, or None if not in the tree
+    `path(node: int)`: List[str]
+        Returns the titles from the root to node `node` (inclusive)
+    `depth(node: int)`: int
+        Returns the no. of links from the root to node `node`
     """
 
-    def __init__(self, root: Any, parent: Optional['Tree'] = None):
-        self.root: Any = root
-        self.parent: Tree = parent
-        self.children: List[Tree] = []
+    def __init__(self, root: str):
+        self.titles: List[str] = [root]
+        self.parents = array("i", [-1])
+        self._ids: Dict[str, int] = {root: 0}
 
-    def add_child(self, branch: 'Tree') -> None:
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def __contains__(self, title: str) -> bool:
+        return title in self._ids
+
+    def add(self, title: str, parent: int) -> Optional[int]:
+        """
+        Adds `title` as a child of node `parent`
+        Returns the id of the new node, or None if `title` is already in the tree
+        """
+        if title in self._ids:
+            return None
+
+        node = len(self.titles)
+        self._ids[title] = node
+        self.titles.append(title)
+        self.parents.append(parent)
+        return node
+
+    def add_many(self, titles: Iterable[str], parent: int) -> List[int]:
+        """
+        Adds the titles in `titles` not already in the tree as children of node
+        `parent`, returning the ids of the new nodes, in one pass over the
+        links of a response (one dict lookup per title, no per-title calls)
         """
-        Adds `child` to the root of the Tree
-        Returns the child node/branch (Tree)
+        ids = self._ids
+        all_titles = self.titles
+        added = []
+        node = len(all_titles)
+        for title in titles:
+            if ids.setdefault(title, node) == node:  # Not already in the tree
+                all_titles.append(title)
+                added.append(node)
+                node += 1
+
+        self.parents.extend([parent] * len(added))
+        return added
+
+    def id_of(self, title: str) -> Optional[int]:
         """
-        branch.parent = self
-        self.children.append(branch)
+        Returns the id of `title`, or None if not in the tree
+        """
+        return self._ids.get(title)
 
-    def parents(self) -> List[str]:
+    def path(self, node: int) -> List[str]:
         """
-        Returns the list of parents of the root node (Tree)
-        from furthest to closest in depth, not including itself
+        Returns the titles from the root to node `node` (inclusive)
         e.g.
-            for Tree A -> B -> C -> self
-            Returns [A, B, C]
+            for tree root -> A -> B -> node
+            Returns [root, A, B, node]
         """
         path = []
-        tree = self
-
-        # Get parents from closest to furthest in depth from self
-        while tree.parent is not None:
-            path.append(tree.root)
-            tree = tree.parent
+        while node != -1:
+            path.append(self.titles[node])
+            node = self.parents[node]
 
-        path.reverse()  # Convert to furthest to closest (correct order)
+        path.reverse()  # Convert to root first (correct order)
         return path
 
+    def depth(self, node: int) -> int:
+        """
+        Returns the no. of links from the root to node `node`
+        """
+        depth = 0
+        node = self.parents[node]
+        while node != -1:
+            depth += 1
+            node = self.parents[node]
+        return depth
+
     def __repr__(self):
-        return f"Tree({self.root}, {self.parent})"
+        return f"SearchTree({self.titles[0]}, {len(self)} nodes)"
@@ -1,36 +1,73 @@
 """
 Functions to interface with the wikipedia api
 """
-from typing import List, Dict, Any
+from typing import TYPE_CHECKING, List, Dict, Any, Callable, Iterator, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor
-import requests
-from .tree import Tree
+from queue import Queue
+from datetime import datetime, timezone
+import json
+import math
+import threading
+from .cache import LinkCache, MemoryCache, cached_query
+from .metrics import NullMetrics, null_metrics
+from .transport import AdaptiveLimiter, Transport
+
+try:  # Optional, decodes json several times faster
+    import orjson
+except ImportError:
+    orjson = None
+
+if TYPE_CHECKING:
+    import requests
 
 MAX_THREADS = 32
+MAX_TITLES = 50  # Max no. of titles per query allowed by the wikipedia api
+ALIAS_CACHE_SIZE = 1_000_000  # Max no. of aliases (e.g. redirects) kept in memory
 
-session = requests.Session()
-session.mount(
-    'https://',
-    requests.adapters.HTTPAdapter(pool_maxsize=MAX_THREADS)
-)
 URL = "https://en.wikipedia.org/w/api.php"
 PARAMS = {
     "action": "query",
     "format": "json",
+    "formatversion": 2,  # Pages as a list, without the page id keys
     "prop": "links",
     "pllimit": "max",
+    "plnamespace": 0,  # Ignore namespaces e.g. "Wikipedia:*", "Help:*", etc.
 }
 PARAMS_OPENSEARCH = {
     "action": "opensearch",
     "limit": "max",
     "namespace": "0",
     "format": "json",
+    "redirects": "resolve",  # Titles of the pages redirects lead to
+}
+PARAMS_BACKLINKS = {
+    "action": "query",
+    "format": "json",
+    "list": "backlinks",
+    "bllimit": "max",
+    "blnamespace": "0",
+    "blredirect": 1,
+}
+PARAMS_REDIRECTS = {
+    "action": "query",
+    "format": "json",
+    "list": "backlinks",
+    "bllimit": "max",
+    "blnamespace": "0",
+    "blfilterredir": "redirects",
 }
 PARAMS_CATEGORIES = {
     "action": "query",
     "format": "json",
     "prop": "categories",
 }
+PARAMS_INFO = {
+    "action": "query",
+    "format": "json",
+    "formatversion": 2,
+    "prop": "info",
+    "redirects": 1,
+}
 
 
 class TitleNotFoundError(Exception):
@@ -44,115 +81,557 @@ class TitleNotFoundError(Exception):
         )
 
 
-def wikititle(title: str) -> str:
+def _decode_json(content: bytes) -> Any:
+    """
+    Decode the json body of a response, with orjson if installed
     """
-    Convert `title` to existing wikipedia title using wikimedia's opensearch
-    https://en.wikipedia.org/w/api.php?action=opensearch&search={title}&limit=max&namespace=0&format=json
-    e.g. wikititle('among us') -> 'Among_Us'
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
 
-    Raises:
-    ------
-        `TitleNotFoundError` - if there are no close matches to the invalid wikipedia `title`
+def _resolve_title(title: str, aliases: Dict[str, str]) -> str:
     """
-    params = {
-        **PARAMS_OPENSEARCH,
-        "search": title,
-    }
-    res = session.get(URL, params=params).json()
-    # e.g. 'among us' -> ['Among Us', 'Among Us Hide...', 'They Are Among Us', ...]
-    possible_results = res[1]
-    if not possible_results:
-        raise TitleNotFoundError(title, res)
-    return possible_results[0]  # return the default search
+    Follow the normalizations and redirects in `aliases` from `title`
+    to the title of the page the wikipedia api returned
+    e.g. 'among_us' -> 'Among us' -> 'Among Us'
+    """
+    seen = {title}
+    while title in aliases:
+        title = aliases[title]
+        if title in seen:  # Redirect loop
+            break
+        seen.add(title)
+
+    return title
 
 
-def get_links(title: str) -> List[str]:
+def _parse_aliases(res: Dict[str, Any]) -> Dict[str, str]:
     """
-    Get all links with namespace=0 from valid wikipedia page `title` from
-    https://en.wikipedia.org/w/api.php?action=query&format=json&titles={title}&prop=links&pllimit=max
-    Returns empty list for invalid titles
+    Parse the normalizations and redirects of a `redirects=1` query response
+    into a dict mapping each alias to the title of the page the api returned
+    e.g. {'among_us': 'Among Us', 'Among us': 'Among Us'}
     """
-    params = {
-        **PARAMS,
-        "titles": title
-    }
+    query = res.get("query", {})
+    aliases: Dict[str, str] = {}  # 'from' title -> 'to' title
+    for alias in query.get("normalized", []) + query.get("redirects", []):
+        aliases[alias["from"]] = alias["to"]
 
-    res = session.get(URL, params=params).json()
-    page_links = []
+    return {title: _resolve_title(title, aliases) for title in aliases}
 
-    for (_page, contents) in res["query"]["pages"].items():
-        links = contents.get("links")
+
+def _parse_timestamp(timestamp: str) -> float:
+    """
+    Seconds since the epoch of an api timestamp e.g. '2024-01-01T12:00:00Z'
+    """
+    return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+
+
+def _parse_links(res: Dict[str, Any], titles: List[str]) -> Dict[str, List[str]]:
+    """
+    Parse a prop=links response for `titles` into a dict mapping titles
+    in `titles` (as passed) to the links found in the response
+    """
+    query = res.get("query", {})
+
+    # The titles param is resent with `continue`, so every response
+    # has the normalizations and redirects of all `titles`
+    aliases = _parse_aliases(res)
+
+    pages = query.get("pages", [])
+    if isinstance(pages, dict):  # formatversion=1, pages keyed by page id
+        pages = pages.values()
+
+    links_by_page: Dict[str, List[str]] = {}
+    for contents in pages:
         # Wikipedia page doesn't exist (e.g. Zip_File) -> no links
+        links = contents.get("links")
         if not links:
             continue
 
-        for link in links:
-            # Ignore namespaces e.g. "Wikipedia:*", "Help:*", etc.
-            if link["ns"] == 0:
-                page_links.append(link["title"])
+        # Only namespace 0 links are returned (plnamespace=0)
+        links_by_page[contents["title"]] = [link["title"] for link in links]
+
+    if not aliases:  # Every page is titled as passed
+        return links_by_page
 
-    return page_links
+    batch_links: Dict[str, List[str]] = {}
+    for title in titles:
+        resolved = aliases.get(title, title)
+        if resolved in links_by_page:
+            batch_links[title] = links_by_page[resolved]
 
+    return batch_links
 
-def get_categories(title: str) -> List[str]:
+
+def _links_params(titles: List[str]) -> Dict[str, Any]:
     """
-    Gets the categories of the wikipedia page `title` from
-    https://en.wikipedia.org/w/api.php?action=query&format=json&titles={title}&prop=categories
-    Returns empty list for invalid title with no redirects
+    Params of the prop=links query for up to `MAX_TITLES` `titles`
     """
-    params = {
-        **PARAMS_CATEGORIES,
-        "titles": title,
+    return {
+        **PARAMS,
+        "titles": "|".join(titles),
+        "redirects": 1,
     }
-    res = session.get(URL, params=params).json()
-    page_cats = []
 
-    for (_page, contents) in res["query"]["pages"].items():
-        cats = contents.get("categories")
-        # Wikipedia page doesn't exist (e.g. Zip_File) -> no links
-        if not cats:
-            continue
 
-        for cat in cats:
-            page_cats.append(cat["title"])
+def _iter_parallel(
+    titles: List[str],
+    query: Callable[[List[str]], Iterator[Dict[str, List[str]]]],
+    titles_per_query: int
+) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Helper for `WikiApi.iter_links_batched` and `WikiApi.iter_backlinks_batched`
+    Packs `titles` into batches of `titles_per_query`, runs `query` on each
+    batch on parallel threads and yields `(title, titles)` as each response
+    arrives. Outstanding reqs are abandoned when the iterator is closed
+    (e.g. the caller returns early)
+    """
+    titles = list(dict.fromkeys(titles))  # No duplicates
+    batches = [
+        titles[i:i + titles_per_query]
+        for i in range(0, len(titles), titles_per_query)
+    ]
+
+    responses = Queue()
+    stop = threading.Event()
+
+    def fetch_batch(batch: List[str]) -> None:
+        try:
+            for batch_links in query(batch):
+                if stop.is_set():
+                    break
+                responses.put(batch_links)
+            responses.put(None)  # Batch is complete
+        except Exception as err:  # Re-raised on the caller's thread
+            responses.put(err)
 
-    return page_cats
+    executor = ThreadPoolExecutor(max_workers=MAX_THREADS)
+    futures = [executor.submit(fetch_batch, batch) for batch in batches]
+    try:
+        remaining = len(batches)
+        while remaining:
+            batch_links = responses.get()
+            if batch_links is None:
+                remaining -= 1
+                continue
+            if isinstance(batch_links, Exception):
+                raise batch_links
 
+            yield from batch_links.items()
+    finally:
+        stop.set()
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
 
-# ------------------------------------------------------
-# Handling of http reqs on multiple threads for speed as
-# most of the time 'pathfinding' is spent on http reqs
 
+class WikiApi:
+    """
+    Client of the MediaWiki api at `url` (the english wikipedia by default)
+
+    Attributes:
+    ----------
+    `url`: str
+        Url of the api.php endpoint
+    `session`: requests.Session
+        Session to make the http reqs with (opened on first use if not passed)
+    `transport`: Transport
+        Makes the http reqs through `session`, with timeouts, retries and an
+        adaptive limit on the reqs in flight (see `transport.py`)
+    `cache`: Optional[LinkCache]
+        Cache of titles, links, backlinks, redirects and categories (None for
+        no caching), as a view scoped by `url` so each wiki's entries are apart
+    `aliases`: MemoryCache
+        The canonical title of the most recently seen `ALIAS_CACHE_SIZE` aliases
+        (searched titles, normalizations and redirects), kept under "title"
+        as the cache also keeps them across runs
+    `metrics`: NullMetrics
+        Where the time spent on http reqs & decoding json, and the no. of reqs,
+        bytes and cache hits are recorded (nothing by default, see `metrics.py`)
 
-def _get_links_with_page(page: Tree) -> List[str]:
+    The module-level functions (`wikititle`, `get_links`, ...) are
+    the methods of `default_api`
     """
-    Helper for `get_links_parallel`
-    Returns page and links as a dict:
-        {
-            "page": {page: Tree},
-            "links: [...],
+
+    def __init__(
+        self,
+        url: Optional[str] = URL,
+        session: Optional['requests.Session'] = None,
+        cache: Optional[LinkCache] = None,
+        metrics: Optional[NullMetrics] = None,
+        transport: Optional[Transport] = None
+    ):
+        self.url = url
+        self._cache: Optional[LinkCache] = None
+        if transport is None:
+            transport = Transport(session, limiter=AdaptiveLimiter(MAX_THREADS))
+        self.transport = transport
+        self.cache = cache
+        self.metrics = metrics if metrics is not None else null_metrics
+        self.aliases = MemoryCache(ALIAS_CACHE_SIZE)
+
+    @property
+    def session(self) -> 'requests.Session':
+        return self.transport.session
+
+    @property
+    def cache(self) -> Optional[LinkCache]:
+        return self._cache
+
+    @cache.setter
+    def cache(self, cache: Optional[LinkCache]) -> None:
+        if cache is not None and cache.scope != self.url:
+            cache = cache.scoped(self.url)
+        self._cache = cache
+
+    def _get(self, params: Dict[str, Any]) -> Any:
+        """
+        Make a single http req to the api (retried if it fails, see `Transport`),
+        returning the decoded json
+        """
+        metrics = self.metrics
+        if not metrics.enabled:
+            return _decode_json(self.transport.get(self.url, params).content)
+
+        with metrics.timer("http"):
+            res = self.transport.get(self.url, params, metrics)
+        with metrics.timer("decode"):
+            decoded = _decode_json(res.content)
+        metrics.count("requests")
+        metrics.count("bytes", len(res.content))
+        return decoded
+
+    def add_aliases(self, aliases: Dict[str, str]) -> None:
+        """
+        Remember the canonical title of each alias in `aliases` (in the cache too, if any)
+        """
+        if not aliases:
+            return
+        self.aliases.set_many("title", aliases)
+        if self.cache is not None:
+            self.cache.set_many("title", aliases)
+
+    def wikititle(self, title: str) -> str:
+        """
+        Convert `title` to existing wikipedia title using wikimedia's opensearch
+        https://en.wikipedia.org/w/api.php?action=opensearch&search={title}&limit=max&namespace=0&format=json&redirects=resolve
+        e.g. wikititle('among us') -> 'Among_Us'
+        Titles already seen as aliases (e.g. redirects in link queries) need no http req
+
+        Raises:
+        ------
+            `TitleNotFoundError` - if there are no close matches to the invalid wikipedia `title`
+        """
+        canonical = self.aliases.get("title", title)
+        if canonical is not None:
+            return canonical
+
+        if self.cache is not None:
+            cached = self.cache.get("title", title)
+            self.metrics.count("cache_hits" if cached is not None else "cache_misses")
+            if cached is not None:
+                self.aliases.set("title", title, cached)
+                return cached
+
+        params = {
+            **PARAMS_OPENSEARCH,
+            "search": title,
         }
+        res = self._get(params)
+        # e.g. 'among us' -> ['Among Us', 'Among Us Hide...', 'They Are Among Us', ...]
+        possible_results = res[1]
+        if not possible_results:
+            raise TitleNotFoundError(title, res)
+
+        self.add_aliases({title: possible_results[0]})
+        return possible_results[0]  # return the default search
+
+    def iter_links(self, title: str) -> Iterator[str]:
+        """
+        Iterate over all links with namespace=0 from valid wikipedia page `title` from
+        https://en.wikipedia.org/w/api.php?action=query&format=json&formatversion=2&titles={title}&prop=links&pllimit=max&plnamespace=0&redirects=1
+        Follows `plcontinue` so pages with more than `pllimit` links are complete,
+        yielding the links of each response as soon as it arrives
+        Yields nothing for invalid titles
+        """
+        for batch_links in self._iter_query_links([title]):
+            yield from batch_links.get(title, [])
+
+    def get_links(self, title: str) -> List[str]:
+        """
+        Get all links with namespace=0 from valid wikipedia page `title`
+        Returns empty list for invalid titles
+        """
+        return list(self.iter_links(title))
+
+    def _iter_query_links(self, titles: List[str]) -> Iterator[Dict[str, List[str]]]:
+        """
+        `_query_links` through the cache
+        """
+        return cached_query(self.cache, "links", self._query_links, titles, self.metrics)
+
+    def _query_links(self, titles: List[str]) -> Iterator[Dict[str, List[str]]]:
+        """
+        Get all links with namespace=0 from up to `MAX_TITLES` wikipedia pages
+        `titles` in a single query, following `continue` until every page is complete
+        https://en.wikipedia.org/w/api.php?action=query&format=json&formatversion=2&titles={title_1}|{title_2}|...&prop=links&pllimit=max&plnamespace=0&redirects=1
+        Yields a dict mapping titles in `titles` (as passed) to the links found
+        in each response, as each response arrives
+        """
+        params = _links_params(titles)
+        first = True
+
+        while True:
+            res = self._get(params)
+            if first:  # Resolve the redirects of `titles` in bulk
+                self.add_aliases(_parse_aliases(res))
+                first = False
+            yield _parse_links(res, titles)
+
+            # pllimit is shared by all titles in the query, so pages are
+            # usually split across multiple responses
+            if "continue" not in res:
+                break
+            params = {**params, **res["continue"]}
+
+    def iter_backlinks(self, title: str) -> Iterator[str]:
+        """
+        Iterate over all pages with namespace=0 linking to wikipedia page `title`,
+        either directly or through a redirect to `title`, from
+        https://en.wikipedia.org/w/api.php?action=query&format=json&list=backlinks&bltitle={title}&bllimit=max&blnamespace=0&blredirect=1
+        Follows `blcontinue` and yields the backlinks of each response as soon as it arrives
+        The redirects themselves are not yielded, as they are aliases of `title`
+        """
+        for batch_backlinks in self._iter_query_backlinks([title]):
+            yield from batch_backlinks.get(title, [])
+
+    def get_backlinks(self, title: str) -> List[str]:
+        """
+        Get all pages with namespace=0 linking to wikipedia page `title`
+        Returns empty list for invalid titles
+        """
+        return list(self.iter_backlinks(title))
+
+    def _iter_query_backlinks(self, titles: List[str]) -> Iterator[Dict[str, List[str]]]:
+        """
+        `_query_backlinks` through the cache
+        """
+        return cached_query(self.cache, "backlinks", self._query_backlinks, titles, self.metrics)
+
+    def _query_backlinks(self, titles: List[str]) -> Iterator[Dict[str, List[str]]]:
+        """
+        Helper for `iter_backlinks` and `iter_backlinks_batched`
+        list=backlinks only takes a single title, so `titles` must have length 1
+        Yields a dict mapping the title to the backlinks found in each response
+        """
+        title, = titles
+        params = {
+            **PARAMS_BACKLINKS,
+            "bltitle": title,
+        }
+
+        while True:
+            res = self._get(params)
+            backlinks = []
+
+            for backlink in res.get("query", {}).get("backlinks", []):
+                # Pages linking to a redirect of `title` are nested in "redirlinks"
+                if "redirect" in backlink:
+                    backlinks.extend(
+                        redirlink["title"]
+                        for redirlink in backlink.get("redirlinks", [])
+                        if redirlink["ns"] == 0
+                    )
+                elif backlink["ns"] == 0:
+                    backlinks.append(backlink["title"])
+
+            yield {title: backlinks}
+
+            if "continue" not in res:
+                break
+            params = {**params, **res["continue"]}
+
+    def get_redirects(self, title: str) -> List[str]:
+        """
+        Get the titles of all redirects (namespace=0) to wikipedia page `title` from
+        https://en.wikipedia.org/w/api.php?action=query&format=json&list=backlinks&bltitle={title}&bllimit=max&blnamespace=0&blfilterredir=redirects
+        Following `blcontinue`, and remembering each as an alias of `title`
+        Returns empty list for invalid titles or pages without redirects
+        """
+        if self.cache is not None:
+            cached = self.cache.get("redirects", title)
+            self.metrics.count("cache_hits" if cached is not None else "cache_misses")
+            if cached is not None:
+                return cached
+
+        params = {
+            **PARAMS_REDIRECTS,
+            "bltitle": title,
+        }
+        redirects = []
+        while True:
+            res = self._get(params)
+            redirects.extend(
+                redirect["title"] for redirect in res.get("query", {}).get("backlinks", [])
+            )
+            if "continue" not in res:
+                break
+            params = {**params, **res["continue"]}
+
+        self.add_aliases({redirect: title for redirect in redirects})
+        if self.cache is not None:
+            self.cache.set("redirects", title, redirects)
+        return redirects
+
+    def get_categories(self, title: str) -> List[str]:
+        """
+        Gets the categories of the wikipedia page `title` from
+        https://en.wikipedia.org/w/api.php?action=query&format=json&titles={title}&prop=categories
+        Returns empty list for invalid title with no redirects
+        """
+        if self.cache is not None:
+            cached = self.cache.get("categories", title)
+            self.metrics.count("cache_hits" if cached is not None else "cache_misses")
+            if cached is not None:
+                return cached
+
+        params = {
+            **PARAMS_CATEGORIES,
+            "titles": title,
+        }
+        res = self._get(params)
+        page_cats = []
+
+        for (_page, contents) in res["query"]["pages"].items():
+            cats = contents.get("categories")
+            # Wikipedia page doesn't exist (e.g. Zip_File) -> no links
+            if not cats:
+                continue
+
+            for cat in cats:
+                page_cats.append(cat["title"])
+
+        if self.cache is not None:
+            self.cache.set("categories", title, page_cats)
+        return page_cats
+
+    def invalidate_changed(self, titles: List[str]) -> None:
+        """
+        Remove the cached links, categories and title of each page in `titles`
+        fetched before the page last changed (its `touched` time, moved by
+        each revision of the page or of the templates it uses), or if it no
+        longer exists, checking `MAX_TITLES` pages per http req
+        https://en.wikipedia.org/w/api.php?action=query&format=json&formatversion=2&prop=info&redirects=1&titles={titles}
+        Backlinks and redirects change with other pages, so only expire
+        """
+        if self.cache is None:
+            return
+
+        for i in range(0, len(titles), MAX_TITLES):
+            batch = titles[i:i + MAX_TITLES]
+            res = self._get({**PARAMS_INFO, "titles": "|".join(batch)})
+            aliases = _parse_aliases(res)
+            pages = {page["title"]: page for page in res.get("query", {}).get("pages", [])}
+
+            changed_at: Dict[str, float] = {}
+            for title in batch:
+                page = pages.get(_resolve_title(title, aliases))
+                if page is None or page.get("missing") or "touched" not in page:
+                    changed_at[title] = math.inf  # Gone
+                else:
+                    changed_at[title] = _parse_timestamp(page["touched"])
+            for kind in ("links", "categories", "title"):
+                self.cache.invalidate_before(kind, changed_at)
+
+    # ------------------------------------------------------
+    # Handling of http reqs on multiple threads for speed as
+    # most of the time 'pathfinding' is spent on http reqs
+
+    def get_links_parallel(self, titles: List[str]) -> Dict[str, List[str]]:
+        """
+        Get links from `titles` using parallel threads to make one http req per title
+        Returns a dict of title -> links
+        """
+        with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
+            return dict(zip(titles, executor.map(self.get_links, titles)))
+
+    def iter_links_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Iterate over the links from `titles`, packing up to `MAX_TITLES` titles into
+        each http req and running the reqs on parallel threads
+        Yields `(title, links)` as each response arrives, so a page with many links
+        may be yielded more than once. Outstanding reqs are abandoned when the
+        iterator is closed (e.g. the caller returns early)
+        """
+        return _iter_parallel(titles, self._iter_query_links, MAX_TITLES)
+
+    def iter_links_query(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Iterate over the links from up to `MAX_TITLES` titles in a single query
+        (through the cache) on the calling thread, e.g. for a caller running
+        its own threads. Yields `(title, links)` as each response arrives
+        """
+        for batch_links in self._iter_query_links(titles):
+            yield from batch_links.items()
+
+    def get_links_batched(self, titles: List[str]) -> Dict[str, List[str]]:
+        """
+        Get all links from `titles` using `iter_links_batched`
+        Returns a dict of title -> links
+        """
+        links_by_title: Dict[str, List[str]] = {title: [] for title in titles}
+        for title, links in self.iter_links_batched(titles):
+            links_by_title[title].extend(links)
+        return links_by_title
+
+    def iter_backlinks_batched(self, titles: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Iterate over the backlinks of `titles` (see `iter_backlinks`), running one
+        http req per title on parallel threads (list=backlinks takes a single title)
+        Yields `(title, backlinks)` as each response arrives, in the same way
+        as `iter_links_batched`
+        """
+        return _iter_parallel(titles, self._iter_query_backlinks, 1)
+
+
+default_api = WikiApi()
+
+
+def __getattr__(name: str) -> Any:
+    # `session` (of `default_api`) is opened on first use, like `requests` itself
+    if name == "session":
+        return default_api.session
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def set_cache(link_cache: Optional[LinkCache]) -> None:
     """
-    return {
-        "page": page,
-        "links": get_links(page.root)
-    }
+    Cache the results of `wikititle`, `get_links`, `get_backlinks`,
+    `get_redirects` and `get_categories` (and their iterating/batched versions) of `default_api`
+    in `link_cache`. Pass None to stop caching
+    """
+    default_api.cache = link_cache
 
 
-def get_links_parallel(pages: List[Tree]) -> List[Dict[str, Any]]:
+def set_metrics(metrics: Optional[NullMetrics]) -> None:
     """
-    Get links from `pages` using parallel threads to make http reqs
-    Returns a list in the form of:
-        [
-            {
-                "page": {Tree},
-                "links": [...],
-            },
-            ...
-        ]
+    Record the http reqs of `default_api` in `metrics` (see `metrics.py`)
+    Pass None to stop recording
     """
-    links_pages_list = []
-    with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-        links_pages_list = list(executor.map(_get_links_with_page, pages))
+    default_api.metrics = metrics if metrics is not None else null_metrics
+
 
-    return links_pages_list
+# The english wikipedia api
+wikititle = default_api.wikititle
+iter_links = default_api.iter_links
+get_links = default_api.get_links
+iter_backlinks = default_api.iter_backlinks
+get_backlinks = default_api.get_backlinks
+get_redirects = default_api.get_redirects
+get_categories = default_api.get_categories
+get_links_parallel = default_api.get_links_parallel
+iter_links_batched = default_api.iter_links_batched
+get_links_batched = default_api.get_links_batched
+iter_backlinks_batched = default_api.iter_backlinks_batched
+invalidate_changed = default_api.invalidate_changed
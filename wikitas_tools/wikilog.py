@@ -1,7 +1,7 @@
 """
 Helper to log the current page nicely during the pathfinding
 """
-from typing import Iterable
+from typing import Iterable, Optional
 
 
 _MAGENTA_FG = "\033[35m"
@@ -25,3 +25,22 @@ def log_path(path: Iterable[str]) -> None:
     """
     path_display = " -> ".join(path)
     print(f"{_GREEN_FG}{path_display}{_RESET}")
+
+
+def log_progress(
+    page: str,
+    pages: int,
+    depth: Optional[int] = None,
+    frontier: Optional[int] = None
+) -> None:
+    """
+    Log the current page and progress of a search in magenta fg colour, formatted by
+    [ Current page: {page} | {pages} pages | depth {depth} | frontier {frontier} ]
+    Overwrites the previous output of log_progress()
+    """
+    progress = f"Current page: {page} | {pages} pages"
+    if depth is not None:
+        progress += f" | depth {depth}"
+    if frontier is not None:
+        progress += f" | frontier {frontier}"
+    print(f"\033[1K\r{_MAGENTA_FG}[ {progress} ]{_RESET}", end="", flush=True)
@@ -2,10 +2,62 @@
 Functions to get similarity of words
 and list of words & related wordsfrom string
 """
-from typing import List, Optional
-from nltk.corpus import wordnet
+import os
+from functools import lru_cache
+from typing import Any, List, Optional, Union
+from .compactwordnet import CompactWordNet, load_compact_wordnet
 from .wikiapi import get_categories
 
+SYNSET_CACHE_SIZE = 65536  # Words whose first synset is remembered
+SCORE_CACHE_SIZE = 65536  # Words whose score is remembered by each `SimilarityScorer`
+WORDNET_ENV = "WIKITAS_WORDNET"  # Path of a compact wordnet to use instead of nltk's
+
+# nltk's wordnet or a `CompactWordNet`, loaded on first use, as importing
+# nltk and reading its corpus takes seconds (and only word matching needs it)
+_wordnet: Any = None
+
+
+def use_wordnet(wordnet: Union[str, CompactWordNet, None]) -> None:
+    """
+    Match words with `wordnet`: a `CompactWordNet` or the path of one
+    (see `compactwordnet.py`), or None for nltk's wordnet (or the compact
+    wordnet at the `WIKITAS_WORDNET` environment variable, if set)
+    """
+    global _wordnet
+    if isinstance(wordnet, str):
+        wordnet = load_compact_wordnet(wordnet)
+    _wordnet = wordnet
+    _synset.cache_clear()
+
+
+def load_wordnet() -> Any:
+    """
+    The wordnet used for word matching, loaded if not yet loaded
+    (e.g. called by a worker process up front, before its first search)
+    """
+    global _wordnet
+    if _wordnet is None:
+        compact_path = os.environ.get(WORDNET_ENV)
+        if compact_path:
+            _wordnet = load_compact_wordnet(compact_path)
+        else:
+            from nltk.corpus import wordnet
+            wordnet.ensure_loaded()
+            _wordnet = wordnet
+    return _wordnet
+
+
+@lru_cache(maxsize=SYNSET_CACHE_SIZE)
+def _synset(word: str):
+    """
+    First wordnet synset of `word`, or None if not in the wordnet db
+    """
+    wordnet = load_wordnet()
+    if isinstance(wordnet, CompactWordNet):
+        return wordnet.synset(word)
+    synsets = wordnet.synsets(word)
+    return synsets[0] if synsets else None
+
 
 def similarity(words_1: List[str], words_2: List[str]) -> float:
     """
@@ -28,16 +80,16 @@ def similarity(words_1: List[str], words_2: List[str]) -> float:
     # Compare each word in `words_1` with each word in `word_2`
     # Skip word if it doesn't exist in wordnet db
     for w_1 in words_1:
-        syn_1 = wordnet.synsets(w_1)
-        if not syn_1:  # Word `w_1` not in wordnet db
+        syn_1 = _synset(w_1)
+        if syn_1 is None:  # Word `w_1` not in wordnet db
             continue
 
         for w_2 in words_2:
-            syn_2 = wordnet.synsets(w_2)
-            if not syn_2:  # Word `w_2` not in wordnet db
+            syn_2 = _synset(w_2)
+            if syn_2 is None:  # Word `w_2` not in wordnet db
                 continue
 
-            sim = syn_2[0].wup_similarity(syn_1[0])
+            sim = syn_2.wup_similarity(syn_1) or 0
             total_sim += sim
             total_comparisons += 1  # Increment total no. of comparisons made
 
@@ -48,6 +100,75 @@ def similarity(words_1: List[str], words_2: List[str]) -> float:
     return total_sim / total_comparisons  # return average similarity
 
 
+class SimilarityScorer:
+    """
+    Scores titles by their similarity to a fixed list of destination words,
+    giving the same scores as `similarity(get_words(title), dest_words)`
+
+    The synsets of `dest_words` are looked up once, and the summed similarity
+    of each word to all of them is kept in an LRU cache of `cache_size` words,
+    so each word is compared with the destination at most once
+
+    Methods:
+    -------
+    `score(words: List[str])`: float
+        Average similarity of `words` to the destination words
+    `score_title(title: str)`: float
+        Average similarity of the words of `title` to the destination words
+    `score_many(titles: List[str])`: List[float]
+        `score_title` of each title in `titles`
+    """
+
+    def __init__(self, dest_words: List[str], cache_size: int = SCORE_CACHE_SIZE):
+        self.dest_words = dest_words
+        # Words not in the wordnet db are skipped, as in `similarity`
+        self._dest_synsets = [
+            syn for syn in map(_synset, dest_words) if syn is not None
+        ]
+        self._word_score = lru_cache(maxsize=cache_size)(self._total_similarity)
+
+    def _total_similarity(self, word: str) -> Optional[float]:
+        """
+        Sum of the similarities of `word` to each destination synset,
+        or None if `word` isn't in the wordnet db
+        """
+        syn_1 = _synset(word)
+        if syn_1 is None:
+            return None
+        return sum(syn_2.wup_similarity(syn_1) or 0 for syn_2 in self._dest_synsets)
+
+    def score(self, words: List[str]) -> float:
+        """
+        Average similarity of `words` to the destination words
+        """
+        if not self._dest_synsets:
+            return 0
+
+        total_sim = 0
+        total_words = 0
+        for word in words:
+            word_sim = self._word_score(word)
+            if word_sim is not None:
+                total_sim += word_sim
+                total_words += 1
+
+        if total_words == 0:
+            return 0
+        return total_sim / (total_words * len(self._dest_synsets))
+
+    def score_title(self, title: str) -> float:
+        """
+        Average similarity of the words of `title` to the destination words
+        """
+        return self.score(get_words(title))
+
+    def score_many(self, titles: List[str]) -> List[float]:
+        """
+        `score_title` of each title in `titles`
+        """
+        return [self.score(get_words(title)) for title in titles]
+
+
 def get_words(title: str) -> List[str]:
     """
     Get the list of words from a string (e.g. sentence, phrase, etc.)
@@ -77,7 +198,8 @@ def get_words(title: str) -> List[str]:
 
 def get_words_with_categories(
     title: str,
-    similarity_threshold: Optional[float] = 0.4
+    similarity_threshold: Optional[float] = 0.4,
+    categories: Optional[List[str]] = None
 ) -> List[str]:
     """
     Get list of words from string (e.g. sentence, phrase, etc.) including words
@@ -92,12 +214,15 @@ def get_words_with_categories(
         0 <= similarity_threshold <= 1
         Words from the wikipedia categories of `title` with a similarity
         above this threshold will be added to the list
+    `categories`: Optional[List[str]]
+        The wikipedia categories of `title`, fetched from the wikipedia api if None
     """
     initial_words = get_words(title)
 
     # Get set of words in title existing in wordnet db
-    words = {word for word in initial_words if wordnet.synsets(word)}
-    categories = get_categories(title)
+    words = {word for word in initial_words if _synset(word) is not None}
+    if categories is None:
+        categories = get_categories(title)
 
     if not words:  # Initial words were invalid
         for cat in categories:
@@ -105,18 +230,19 @@ def get_words_with_categories(
             for word in cat_words:
                 # Words beginning with lowercase are usually unimportant
                 # e.g. in, with, based, etc.
-                if word[0].isupper() and word.lower() != "articles" and wordnet.synsets(word):
+                if word[0].isupper() and word.lower() != "articles" and _synset(word) is not None:
                     words.add(word)
 
         return list(words)  # Top 5 relevant category words
 
+    scorer = SimilarityScorer(initial_words)
     for cat in categories:
         cat_words = get_words(cat.replace("Category:", ""))
         for word in cat_words:
             if word.lower() == "articles":  # Ignore "Category:Articles about ..."
                 continue
 
-            sim = similarity([word], initial_words)
+            sim = scorer.score([word])
             if sim >= similarity_threshold:
                 words.add(word)
 